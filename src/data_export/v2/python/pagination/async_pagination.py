@@ -0,0 +1,286 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides a non-blocking version of the AutoPaginator.
+
+Many exports can be started from a single thread. Each export returns an
+ExportResult right away and every API request is run by a RequestPool
+shared by all the exports, so the number of requests in flight stays bounded
+no matter how many exports are running. All the completion callbacks are run
+one at a time on the same thread of the RequestPool. An error raised while
+handling a response fails only its own export, and an error raised by a
+completion callback is logged, so neither can stop the other exports.
+
+  RequestPool: a bounded pool of workers which make the API requests.
+  AsyncAutoPaginator: handles pagination through the API without blocking.
+  ExportResult: the pending result of an export.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import functools
+import logging
+import threading
+from multiprocessing import pool
+
+import pagination
+
+
+class RequestPool(object):
+  """A bounded pool of workers shared by many AsyncAutoPaginator objects.
+
+  Attributes:
+    DEFAULT_MAX_REQUESTS: int The default number of API requests that can be
+        in flight at the same time.
+  """
+
+  DEFAULT_MAX_REQUESTS = 10
+
+  def __init__(self, max_requests=DEFAULT_MAX_REQUESTS):
+    """Initializes this class.
+
+    Args:
+      max_requests: int The maximum number of API requests in flight at the
+          same time across all exports.
+    """
+    self.workers = pool.ThreadPool(max_requests)
+
+  def Submit(self, function, args, callback):
+    """Schedules function(*args) to run on one of the workers.
+
+    Args:
+      function: The function to run.
+      args: tuple The arguments to pass to function.
+      callback: function Called with a (result, error) tuple once function
+          returns. error is the pagination.AutoPaginatorError raised by
+          function, if any.
+    """
+    self.workers.apply_async(_CallSafely, (function, args), callback=callback)
+
+  def Close(self):
+    """Waits for all the scheduled requests and stops the workers."""
+    self.workers.close()
+    self.workers.join()
+
+
+def _CallSafely(function, args):
+  """Returns a (result, error) tuple from calling function(*args)."""
+  try:
+    return function(*args), None
+  except pagination.AutoPaginatorError, error:
+    return None, error
+  except Exception, error:  # pylint: disable-msg=W0703
+    # Any other error must still complete the export instead of leaving it
+    # pending forever.
+    return None, pagination.AutoPaginatorError(msg=str(error))
+
+
+class AsyncAutoPaginator(pagination.AutoPaginator):
+  """Gets all the pages in a Data Export API query without blocking.
+
+  The pages are planned the same way as AutoPaginator. Once the first page
+  is retrieved, all the remaining pages are submitted to the RequestPool and
+  merged in order when they are all retrieved. Each object handles one export
+  at a time.
+  """
+
+  def __init__(self, my_client, my_auth_helper, request_pool, verbose=False,
+               converter=None):
+    """Initializes this class.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The main object to
+          make requests to the API.
+      my_auth_helper: auth.AuthRoutine implementation.
+      request_pool: RequestPool The workers which make the API requests.
+      verbose: boolean Whether to print the queries that are being executed.
+      converter: function (optional) Converts each API response instead of
+          the gdata library, such as feed_parser.ParseDataFeed.
+    """
+    pagination.AutoPaginator.__init__(self, my_client, my_auth_helper,
+                                      verbose=verbose, converter=converter)
+    self.request_pool = request_pool
+
+  def GetDataFeedAsync(self, query, num_pages, callback=None,
+                       error_callback=None):
+    """Starts retrieving report data by paging through the Data Feed results.
+
+    Args:
+      query: gdata.analytics.client.DataQuery The query to pagniate.
+          The start-index is respected. The max-results will be overwritten to
+          the maximum number of results allowed by the API.
+      num_pages: int The number of pages to retrieve from the API.
+          if -1: return all pages in the result.
+          if >0: return a specific number of pages in the result.
+      callback: function (optional) Called with the merged
+          gdata.analytics.data.DataFeed once every page is retrieved.
+      error_callback: function (optional) Called with an AutoPaginatorError
+          if an error occurs with any of the API requests.
+
+    Returns:
+      ExportResult The pending result of this export.
+    """
+    result = ExportResult(callback, error_callback)
+    query.query['max-results'] = pagination.AutoPaginator.DEFAULT_MAX_RESULTS
+    self._Submit(query, result,
+                 functools.partial(self._OnFirstPage, query, num_pages,
+                                   result))
+    return result
+
+  def _Submit(self, query, result, handler):
+    """Retrieves a page of an export and passes the outcome to handler."""
+    self.request_pool.Submit(self.GetData, (query,),
+                             functools.partial(_HandleSafely, handler, result))
+
+  def _OnFirstPage(self, query, num_pages, result, outcome):
+    """Plans the remaining pages once the first page is retrieved."""
+    feed, error = outcome
+    if error:
+      result.SetError(error)
+      return
+
+    try:
+      self.SetPagination(query, feed.total_results.text, num_pages)
+    except pagination.AutoPaginatorError, error:
+      result.SetError(error)
+      return
+
+    start_indicies = self.GetStartIndicies()
+    if not start_indicies:
+      result.Set(feed)
+      return
+
+    pages = [None] * len(start_indicies)
+    for page_number, start_index in enumerate(start_indicies):
+      self._Submit(self.GetPageQuery(query, start_index), result,
+                   functools.partial(self._OnPage, feed, pages, page_number,
+                                     result))
+
+  def _OnPage(self, feed, pages, page_number, result, outcome):
+    """Stores a page and merges all of them once the last one is retrieved."""
+    page, error = outcome
+    if result.Ready():
+      return
+    if error:
+      result.SetError(error)
+      return
+
+    pages[page_number] = page
+    if None in pages:
+      return
+
+    for page in pages:
+      feed.entry.extend(page.entry)
+    result.Set(feed)
+
+
+class ExportResult(object):
+  """The pending result of an AsyncAutoPaginator export.
+
+  Attributes:
+    feed: gdata.analytics.data.DataFeed The merged feed once the export
+        succeeds.
+    error: AutoPaginatorError The error if the export fails.
+  """
+
+  def __init__(self, callback=None, error_callback=None):
+    """Initializes this class.
+
+    Args:
+      callback: function (optional) Called with the feed on success.
+      error_callback: function (optional) Called with the error on failure.
+    """
+    self.feed = None
+    self.error = None
+    self.callback = callback
+    self.error_callback = error_callback
+    self.done = threading.Event()
+
+  def Set(self, feed):
+    """Completes the export with feed."""
+    self.feed = feed
+    self.done.set()
+    if self.callback:
+      _RunCallback(self.callback, feed)
+
+  def SetError(self, error):
+    """Completes the export with error."""
+    self.error = error
+    self.done.set()
+    if self.error_callback:
+      _RunCallback(self.error_callback, error)
+
+  def Ready(self):
+    """Returns whether the export has completed."""
+    return self.done.is_set()
+
+  def Wait(self, timeout=None):
+    """Blocks until the export completes or timeout seconds pass.
+
+    Returns:
+      boolean Whether the export has completed.
+    """
+    self.done.wait(timeout)
+    return self.Ready()
+
+  def Get(self, timeout=None):
+    """Blocks until the export completes and returns the merged feed.
+
+    Args:
+      timeout: float (optional) The number of seconds to wait.
+
+    Returns:
+      gdata.analytics.data.DataFeed The feed with the entries of every page.
+
+    Raises:
+      AutoPaginatorError if an error occured with the API request or the
+      export did not complete within timeout.
+    """
+    if not self.Wait(timeout):
+      raise pagination.AutoPaginatorError(msg='The export did not complete.')
+    if self.error:
+      raise self.error
+    return self.feed
+
+
+def _HandleSafely(handler, result, outcome):
+  """Calls handler with the outcome of a request, failing result on error.
+
+  The handlers run on the same thread as the callbacks, so an error escaping
+  from them would also stop every other export, and leave result pending.
+  """
+  unused_value, error = _CallSafely(handler, (outcome,))
+  if not error:
+    return
+  if result.Ready():
+    logging.error('Handling a response of a completed export failed: %s',
+                  error.msg)
+  else:
+    result.SetError(error)
+
+
+def _RunCallback(callback, value):
+  """Calls callback with value, logging any error it raises.
+
+  The callbacks run on the thread which handles the results of every request
+  of the RequestPool. An error escaping from them would stop that thread, and
+  every export submitted afterwards would never complete.
+  """
+  try:
+    callback(value)
+  except Exception:
+    logging.exception('The callback of an export raised an error.')
@@ -0,0 +1,105 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for async_pagination.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import unittest
+import async_pagination
+import gdata.analytics.client
+import pagination
+import pagination_test
+
+
+class TestAsyncAutoPaginator(unittest.TestCase):
+
+  def setUp(self):
+    self.request_pool = async_pagination.RequestPool(max_requests=3)
+
+  def tearDown(self):
+    self.request_pool.Close()
+
+  def testGetDataFeedAsync(self):
+    my_client = pagination_test.FakeClient(45000, delay=0.02)
+    results = []
+    for _ in range(5):
+      paginator = async_pagination.AsyncAutoPaginator(
+          my_client, None, self.request_pool)
+      query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+      results.append(paginator.GetDataFeedAsync(query, -1))
+
+    for result in results:
+      self.assertEqual(range(1, 45001), result.Get(timeout=10).entry)
+    self.assertEqual(3, my_client.max_in_flight)
+
+  def testGetDataFeedAsyncError(self):
+    errors = []
+    paginator = async_pagination.AsyncAutoPaginator(
+        pagination_test.FakeClient(100), None, self.request_pool)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    result = paginator.GetDataFeedAsync(query, 0,
+                                        error_callback=errors.append)
+    self.assertRaises(pagination.AutoPaginatorError, result.Get, 10)
+    self.assertEqual([result.error], errors)
+
+  def testMalformedResponsesFailTheirExport(self):
+    class NoTotalClient(pagination_test.FakeClient):
+      def GetDataFeed(self, query, converter=None):
+        feed = pagination_test.FakeClient.GetDataFeed(self, query)
+        feed.total_results = None
+        return feed
+
+    class NoEntryClient(pagination_test.FakeClient):
+      def GetDataFeed(self, query, converter=None):
+        feed = pagination_test.FakeClient.GetDataFeed(self, query)
+        if query.query.get('start-index'):
+          feed.entry = None
+        return feed
+
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+    for my_client in (NoTotalClient(15000), NoEntryClient(15000)):
+      paginator = async_pagination.AsyncAutoPaginator(
+          my_client, None, self.request_pool)
+      result = paginator.GetDataFeedAsync(query, -1)
+      self.assertRaises(pagination.AutoPaginatorError, result.Get, 10)
+
+    paginator = async_pagination.AsyncAutoPaginator(
+        pagination_test.FakeClient(15000), None, self.request_pool)
+    result = paginator.GetDataFeedAsync(query, -1)
+    self.assertEqual(15000, len(result.Get(timeout=10).entry))
+
+  def testRaisingCallbackDoesNotStopOtherExports(self):
+    def RaisingCallback(feed):
+      raise ValueError('The callback failed.')
+
+    my_client = pagination_test.FakeClient(15000)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+    paginator = async_pagination.AsyncAutoPaginator(
+        my_client, None, self.request_pool)
+    first_result = paginator.GetDataFeedAsync(query, -1,
+                                              callback=RaisingCallback)
+    self.assertEqual(15000, len(first_result.Get(timeout=10).entry))
+
+    paginator = async_pagination.AsyncAutoPaginator(
+        my_client, None, self.request_pool)
+    second_result = paginator.GetDataFeedAsync(query, -1)
+    self.assertEqual(15000, len(second_result.Get(timeout=10).entry))
+
+
+if __name__ == '__main__':
+  unittest.main()
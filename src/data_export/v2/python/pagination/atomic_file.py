@@ -0,0 +1,60 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Writes files so that readers never see a partial file.
+
+The data is written to a temporary file in the directory of the target,
+flushed to disk, then renamed over the target. A crash leaves either the old
+file or the new one, never a mix, and at worst a stray .tmp file.
+
+Usage:
+  atomic_file.WriteAtomically('spool/manifest.json', json.dumps(manifest))
+
+  WriteAtomically(): Replaces a file with new data in one step.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import tempfile
+
+
+TEMP_SUFFIX = '.tmp'
+
+
+def WriteAtomically(path, data):
+  """Replaces the file at path with data in one step.
+
+  Args:
+    path: string The file to write. Its directory must exist.
+    data: str The bytes to write.
+  """
+  handle, temp_path = tempfile.mkstemp(
+      dir=os.path.dirname(os.path.abspath(path)), suffix=TEMP_SUFFIX)
+  try:
+    temp_file = os.fdopen(handle, 'wb')
+    try:
+      temp_file.write(data)
+      temp_file.flush()
+      os.fsync(temp_file.fileno())
+    finally:
+      temp_file.close()
+    os.rename(temp_path, path)
+  except:
+    if os.path.exists(temp_path):
+      os.remove(temp_path)
+    raise
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for atomic_file.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import atomic_file
+
+
+class TestWriteAtomically(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.path = os.path.join(self.temp_dir, 'manifest.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def testWriteAtomically(self):
+    data = 'x' * (1024 * 1024 * 3)
+    atomic_file.WriteAtomically(self.path, data)
+    self.assertEqual(data, open(self.path, 'rb').read())
+
+    atomic_file.WriteAtomically(self.path, '{}')
+    self.assertEqual('{}', open(self.path, 'rb').read())
+    self.assertEqual(['manifest.json'], os.listdir(self.temp_dir))
+
+  def testFailedWriteKeepsOldFile(self):
+    atomic_file.WriteAtomically(self.path, 'old')
+    self.assertRaises(TypeError, atomic_file.WriteAtomically, self.path,
+                      object())
+    self.assertEqual('old', open(self.path, 'rb').read())
+    self.assertEqual(['manifest.json'], os.listdir(self.temp_dir))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -23,10 +23,20 @@
   Beyond getting new tokens, these classes will try to reuse old tokens
   by saving and loading them to disk.
 
+  Tokens are kept in a TokenStore, keyed by account and token type. The store
+  is shared by every AuthRoutineUtil of a process and keeps the tokens in
+  memory. It only reads the file again when another process has changed it.
+  Writes are atomic and the file is locked, so many threads and processes
+  can share one token file. A missing token is only requested once, by the
+  first thread or process to need it, while the others wait for it.
+
   AuthRoutine: Base class to handle saving, loading and deleting auth tokens.
   OAuthRoutine: Extends AuthRoutine to retrieve an OAuth for Installed
       Applications token. Most people should use this class.
   ClientLoginRoutine: Extends AuthRoutine to get a ClientLogin token.
+  AuthRoutineUtil: Saves, loads and deletes the tokens of one account.
+  TokenStore: Stores tokens by account and token type in one file.
+  GetTokenStore(): Returns the TokenStore of a file shared by this process.
   AppError: Base class for exceptions.
   AuthError: Raised if there is an authorization error.
 """
@@ -34,11 +44,19 @@
 __author__ = 'api.nickm@google.com (Nick Mihailovski)'
 
 
+import contextlib
 import cPickle
 import getpass
 import os
+import tempfile
+import threading
 import webbrowser
 
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
+
 import gdata
 import gdata.analytics.client
 
@@ -94,12 +112,8 @@ class AuthRoutine(object):
     if self.auth_token:
       return self.auth_token
 
-    self.auth_token = self.auth_routine_util.LoadAuthToken(self.token_obj_name)
-
-    if not self.auth_token:
-      self.auth_token = self.RequestAuthToken()
-      self.auth_routine_util.SaveAuthToken(self.auth_token)
-
+    self.auth_token = self.auth_routine_util.LoadOrRequestAuthToken(
+        self.token_obj_name, self.RequestAuthToken)
     return self.auth_token
 
 
@@ -208,9 +222,26 @@ class AuthRoutineUtil(object):
 
   Attributes:
     TOKEN_FILE_NAME: The name of the file to save tokens.
+    DEFAULT_ACCOUNT: The account of the tokens if none is given.
+    account: string The account whose tokens are saved and loaded.
+    token_store: TokenStore The store of the tokens.
   """
 
   TOKEN_FILE_NAME = 'auth_token.tok'
+  DEFAULT_ACCOUNT = 'default'
+
+  def __init__(self, account=DEFAULT_ACCOUNT, token_store=None):
+    """Initializes this object.
+
+    Args:
+      account: string (optional) A name for the account whose tokens are
+          saved and loaded, so several accounts can share one token file.
+      token_store: TokenStore (optional) The store of the tokens. Defaults to
+          the store of TOKEN_FILE_NAME shared by the whole process.
+    """
+    self.account = account
+    self.token_store = token_store or GetTokenStore(
+        AuthRoutineUtil.TOKEN_FILE_NAME)
 
   def SaveAuthToken(self, auth_token):
     """Saves the authorization token into a file to be used later.
@@ -221,41 +252,237 @@ class AuthRoutineUtil(object):
       auth_token: object The Authorization token to be saved.
     """
     try:
-      my_file = open(AuthRoutineUtil.TOKEN_FILE_NAME, 'wb')
-      cPickle.dump(auth_token, my_file)
-    except (IOError, EOFError):
+      self.token_store.Set(self.account, auth_token.__class__.__name__,
+                           auth_token)
+    except (IOError, OSError):
       print 'Problems writing access token to file, try again.'
-    finally:
-      my_file.close()
 
   def LoadAuthToken(self, token_obj_name):
     """Tries to load an authorization token of type token_obj_name from disk.
 
-    To differentiate between different types of token, a check is made to
-    ensure the right type of token was loaded.
+    To differentiate between different types of token, each type of token is
+    saved separately.
 
     Args:
       token_obj_name: string The name of the authorization object to
       try and load.
 
     Returns:
-      The object saved in AuthRoutine.TOKEN_FILE_NAME. None if an error
-      occurs or if the incorrect token type was found.
+      The token of type token_obj_name saved for the account. None if an
+      error occurs or if no token of this type was saved.
+    """
+    return self.token_store.Get(self.account, token_obj_name)
+
+  def LoadOrRequestAuthToken(self, token_obj_name, request_function):
+    """Loads a token, or requests and saves a new one if there is none.
+
+    Only one thread or process requests a missing token. The others wait for
+    it and load it once it is saved.
+
+    Args:
+      token_obj_name: string The name of the authorization object to load.
+      request_function: function Returns a new token when called.
+
+    Returns:
+      The token of type token_obj_name.
+
+    Raises:
+      AuthError: If there was an error trying to get a token.
     """
     try:
-      my_file = open(AuthRoutineUtil.TOKEN_FILE_NAME, 'rb')
-      access_token = cPickle.load(my_file)
-    except (IOError, EOFError):
-      return None
-
-    if access_token.__class__.__name__ != token_obj_name:
-      return None
-    return access_token
-
-  def DeleteAuthToken(self):
-    """Deletes the authorization token file if it exists."""
-    if os.path.exists(AuthRoutineUtil.TOKEN_FILE_NAME):
-      os.remove(AuthRoutineUtil.TOKEN_FILE_NAME)
+      return self.token_store.GetOrCreate(self.account, token_obj_name,
+                                          request_function)
+    except (IOError, OSError):
+      print 'Problems writing access token to file, try again.'
+      return request_function()
+
+  def DeleteAuthToken(self, token_obj_name=None):
+    """Deletes the saved authorization tokens of the account.
+
+    Args:
+      token_obj_name: string (optional) The name of the authorization object
+          to delete. All the tokens of the account are deleted if not set.
+    """
+    self.token_store.Delete(self.account, token_obj_name)
+
+
+class TokenStore(object):
+  """Stores authorization tokens by account and token type in one file.
+
+  The tokens are cached in memory and the file is only read again when its
+  modification time, size or inode changes. Each change is written to a
+  temporary file which then replaces the token file, while holding an
+  exclusive lock on a separate lock file. Locking is skipped where fcntl is
+  not available.
+
+  Attributes:
+    file_name: string The absolute path of the token file.
+  """
+
+  LOCK_SUFFIX = '.lock'
+
+  def __init__(self, file_name):
+    """Initializes this object.
+
+    Args:
+      file_name: string The name of the token file.
+    """
+    self.file_name = os.path.abspath(file_name)
+    self.lock = threading.RLock()
+    self.tokens = {}
+    self.signature = None
+
+  def Get(self, account, token_type):
+    """Returns the token of an account and type or None if there is none."""
+    with self.lock:
+      with self._LockFile(exclusive=False):
+        self._Refresh()
+      return self.tokens.get((account, token_type))
+
+  def Set(self, account, token_type, token):
+    """Saves the token of an account and type."""
+    with self.lock:
+      with self._LockFile(exclusive=True):
+        self._Refresh()
+        self.tokens[(account, token_type)] = token
+        self._Write()
+
+  def GetOrCreate(self, account, token_type, create_function):
+    """Returns a saved token, or creates and saves one if there is none.
+
+    The file stays locked while create_function runs, so other threads and
+    processes wait for the new token instead of creating their own.
+
+    Args:
+      account: string The account of the token.
+      token_type: string The name of the class of the token.
+      create_function: function Returns a new token when called.
+
+    Returns:
+      The token of the account and type.
+    """
+    token = self.Get(account, token_type)
+    if token:
+      return token
+
+    with self.lock:
+      with self._LockFile(exclusive=True):
+        self._Refresh()
+        token = self.tokens.get((account, token_type))
+        if not token:
+          token = create_function()
+          self.tokens[(account, token_type)] = token
+          self._Write()
+        return token
+
+  def Delete(self, account, token_type=None):
+    """Deletes the token of an account and type.
+
+    Args:
+      account: string The account of the tokens.
+      token_type: string (optional) The type of the token to delete. All the
+          tokens of the account are deleted if not set.
+    """
+    with self.lock:
+      with self._LockFile(exclusive=True):
+        self._Refresh()
+        keys = [key for key in self.tokens
+                if key[0] == account and token_type in (None, key[1])]
+        if keys:
+          for key in keys:
+            del self.tokens[key]
+          self._Write()
+
+  def _Refresh(self):
+    """Reads the token file again if another process changed it."""
+    try:
+      stat = os.stat(self.file_name)
+    except OSError:
+      self.tokens = {}
+      self.signature = None
+      return
+
+    signature = (stat.st_mtime, stat.st_size, stat.st_ino)
+    if signature == self.signature:
+      return
+
+    try:
+      my_file = open(self.file_name, 'rb')
+      try:
+        tokens = cPickle.load(my_file)
+      finally:
+        my_file.close()
+    except (IOError, EOFError, AttributeError, ImportError, IndexError,
+            KeyError, TypeError, ValueError, cPickle.UnpicklingError):
+      # A truncated or corrupt file unpickles with any of these errors and is
+      # treated like a missing one.
+      tokens = {}
+
+    # Older versions saved a single token of the default account.
+    if not isinstance(tokens, dict):
+      tokens = {(AuthRoutineUtil.DEFAULT_ACCOUNT,
+                 tokens.__class__.__name__): tokens}
+    self.tokens = tokens
+    self.signature = signature
+
+  def _Write(self):
+    """Replaces the token file with the tokens in memory."""
+    handle, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(self.file_name), suffix='.tmp')
+    try:
+      my_file = os.fdopen(handle, 'wb')
+      try:
+        cPickle.dump(self.tokens, my_file, cPickle.HIGHEST_PROTOCOL)
+        my_file.flush()
+        os.fsync(my_file.fileno())
+      finally:
+        my_file.close()
+      os.rename(temp_path, self.file_name)
+    except:
+      if os.path.exists(temp_path):
+        os.remove(temp_path)
+      raise
+
+    stat = os.stat(self.file_name)
+    self.signature = (stat.st_mtime, stat.st_size, stat.st_ino)
+
+  @contextlib.contextmanager
+  def _LockFile(self, exclusive):
+    """Locks the lock file of the token file while in the with block."""
+    if not fcntl:
+      yield
+      return
+
+    lock_file = open(self.file_name + TokenStore.LOCK_SUFFIX, 'a')
+    try:
+      if exclusive:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+      else:
+        fcntl.flock(lock_file, fcntl.LOCK_SH)
+      yield
+    finally:
+      lock_file.close()
+
+
+_token_stores = {}
+_token_stores_lock = threading.Lock()
+
+
+def GetTokenStore(file_name):
+  """Returns the TokenStore of a file, shared by the whole process.
+
+  Args:
+    file_name: string The name of the token file.
+
+  Returns:
+    TokenStore The store of the file.
+  """
+  file_name = os.path.abspath(file_name)
+  with _token_stores_lock:
+    token_store = _token_stores.get(file_name)
+    if not token_store:
+      token_store = _token_stores[file_name] = TokenStore(file_name)
+    return token_store
 
 
 class AppError(Exception):
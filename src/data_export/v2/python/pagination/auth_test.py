@@ -0,0 +1,148 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for the token store of auth.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cPickle
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import auth
+
+
+class OAuthHmacToken(object):
+  """A token with the class name of an OAuth token."""
+
+  def __init__(self, value):
+    self.value = value
+
+
+class ClientLoginToken(OAuthHmacToken):
+  """A token with the class name of a ClientLogin token."""
+  pass
+
+
+class FakeRoutine(auth.AuthRoutine):
+  """Requests a new token by counting the requests in a file."""
+
+  def __init__(self, auth_routine_util, count_file_name):
+    auth.AuthRoutine.__init__(self, auth_routine_util, 'OAuthHmacToken')
+    self.count_file_name = count_file_name
+
+  def RequestAuthToken(self):
+    count_file = open(self.count_file_name, 'a')
+    count_file.write('x')
+    count_file.close()
+    time.sleep(0.2)
+    return OAuthHmacToken('new token')
+
+
+def GetTokenInProcess(args):
+  """Returns the token value seen by a new routine in a worker process."""
+  file_name, count_file_name = args
+  util = auth.AuthRoutineUtil(token_store=auth.TokenStore(file_name))
+  return FakeRoutine(util, count_file_name).GetAuthToken().value
+
+
+class TestTokenStore(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.temp_dir, 'auth_token.tok')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def testAccountsAndTypes(self):
+    util_a = auth.AuthRoutineUtil('a', auth.TokenStore(self.file_name))
+    util_b = auth.AuthRoutineUtil('b', auth.TokenStore(self.file_name))
+    util_a.SaveAuthToken(OAuthHmacToken('a oauth'))
+    util_a.SaveAuthToken(ClientLoginToken('a login'))
+    util_b.SaveAuthToken(OAuthHmacToken('b oauth'))
+
+    self.assertEqual('a oauth', util_a.LoadAuthToken('OAuthHmacToken').value)
+    self.assertEqual('a login', util_a.LoadAuthToken('ClientLoginToken').value)
+    self.assertEqual('b oauth', util_b.LoadAuthToken('OAuthHmacToken').value)
+    self.assertEqual(None, util_b.LoadAuthToken('ClientLoginToken'))
+
+    util_a.DeleteAuthToken('OAuthHmacToken')
+    self.assertEqual(None, util_a.LoadAuthToken('OAuthHmacToken'))
+    self.assertEqual('a login', util_a.LoadAuthToken('ClientLoginToken').value)
+    util_a.DeleteAuthToken()
+    self.assertEqual(None, util_a.LoadAuthToken('ClientLoginToken'))
+    self.assertEqual('b oauth', util_b.LoadAuthToken('OAuthHmacToken').value)
+    self.assertEqual([os.path.basename(self.file_name),
+                      os.path.basename(self.file_name) + '.lock'],
+                     sorted(os.listdir(self.temp_dir)))
+
+  def testReadsFileOnlyWhenChanged(self):
+    token_store = auth.TokenStore(self.file_name)
+    token_store.Set('a', 'OAuthHmacToken', OAuthHmacToken('first'))
+    token = token_store.Get('a', 'OAuthHmacToken')
+    self.assertTrue(token is token_store.Get('a', 'OAuthHmacToken'))
+
+    auth.TokenStore(self.file_name).Set('a', 'OAuthHmacToken',
+                                        OAuthHmacToken('second'))
+    self.assertEqual('second', token_store.Get('a', 'OAuthHmacToken').value)
+
+  def testLegacyFile(self):
+    my_file = open(self.file_name, 'wb')
+    cPickle.dump(OAuthHmacToken('legacy'), my_file)
+    my_file.close()
+    util = auth.AuthRoutineUtil(token_store=auth.TokenStore(self.file_name))
+    self.assertEqual('legacy', util.LoadAuthToken('OAuthHmacToken').value)
+    self.assertEqual(None, util.LoadAuthToken('ClientLoginToken'))
+
+  def testCorruptFile(self):
+    auth.TokenStore(self.file_name).Set('a', 'OAuthHmacToken',
+                                        OAuthHmacToken('saved'))
+    data = open(self.file_name, 'rb').read()
+    for length in range(len(data)):
+      my_file = open(self.file_name, 'wb')
+      my_file.write(data[:length])
+      my_file.close()
+      token_store = auth.TokenStore(self.file_name)
+      self.assertEqual(None, token_store.Get('a', 'OAuthHmacToken'))
+
+    token_store.Set('a', 'OAuthHmacToken', OAuthHmacToken('new'))
+    self.assertEqual('new', auth.TokenStore(self.file_name).Get(
+        'a', 'OAuthHmacToken').value)
+
+  def testSharedStore(self):
+    self.assertTrue(auth.GetTokenStore(self.file_name) is
+                    auth.GetTokenStore(self.file_name))
+
+  def testRequestsOnceAcrossProcesses(self):
+    count_file_name = os.path.join(self.temp_dir, 'count')
+    workers = multiprocessing.Pool(4)
+    try:
+      values = workers.map(GetTokenInProcess,
+                           [(self.file_name, count_file_name)] * 4)
+    finally:
+      workers.close()
+      workers.join()
+
+    self.assertEqual(['new token'] * 4, values)
+    self.assertEqual('x', open(count_file_name).read())
+
+
+if __name__ == '__main__':
+  unittest.main()
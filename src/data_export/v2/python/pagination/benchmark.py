@@ -0,0 +1,240 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks exports through the full pipeline against a MockApiServer.
+
+Each export is retrieved with an AutoPaginator, parsed with
+feed_parser.ParseDataFeed and written to a temporary file with a
+FeedPrinter, from a MockApiServer on this machine. Every export runs in its
+own process so its peak memory use is measured on its own.
+
+For each export the benchmark reports:
+  rows/s: The number of rows exported per second.
+  first row: The seconds until the first page was retrieved.
+  peak RSS: The peak resident memory of the exporting process.
+
+Usage: python benchmark.py [format] [rows ...]
+  format is one of PRINTERS and defaults to tsv. The number of rows of each
+  export default to SIZES.
+
+SIZES: The number of rows of each export.
+NUM_WORKERS: The number of pages retrieved at the same time.
+QUERY: The parameters of the query exported.
+PRINTERS: The function returning the FeedPrinter of each output format.
+
+  BenchmarkResult: The measurements of one export.
+  RunBenchmarks(): Benchmarks exports of several sizes.
+  RunBenchmark(): Benchmarks one export in its own process.
+  FormatResults(): Returns the results as a table.
+  BenchmarkError: Raised when an export fails.
+  main(): The main logic of the application.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import collections
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import traceback
+
+import columnar_file
+import feed_parser
+import feed_printer
+import gdata.analytics.client
+import mapped_store
+import mock_api_server
+import pagination
+
+
+SIZES = [10000, 100000, 1000000]
+NUM_WORKERS = 4
+QUERY = {
+    'ids': 'ga:1',
+    'start-date': '2011-01-01',
+    'end-date': '2011-01-31',
+    'dimensions': 'ga:source,ga:medium,ga:keyword',
+    'metrics': 'ga:visits,ga:pageviews,ga:visitBounceRate'}
+PRINTERS = {
+    'tsv': feed_printer.GetTsvFilePrinter,
+    'gzip': feed_printer.GetGzipTsvFilePrinter,
+    'jsonl': feed_printer.GetJsonLinesFilePrinter,
+    'columnar': columnar_file.GetColumnarFilePrinter,
+    'mapped': mapped_store.GetMappedStoreFilePrinter,
+}
+
+BenchmarkResult = collections.namedtuple('BenchmarkResult', [
+    'rows', 'pages', 'seconds', 'first_row_seconds', 'peak_rss_kb',
+    'output_bytes'])
+
+
+def RunBenchmarks(sizes, output_format='tsv', num_workers=NUM_WORKERS,
+                  **server_args):
+  """Benchmarks exports of several sizes against one MockApiServer.
+
+  Args:
+    sizes: list of ints The number of rows of each export.
+    output_format: string The output format, one of PRINTERS.
+    num_workers: int The number of pages retrieved at the same time.
+    server_args: The other arguments of the MockApiServer, such as latency,
+        jitter, error_rate or max_page_size.
+
+  Returns:
+    A list of BenchmarkResult tuples, one per size.
+
+  Raises:
+    BenchmarkError: If an export fails.
+  """
+  server = mock_api_server.MockApiServer(**server_args)
+  server.Start()
+  try:
+    return [RunBenchmark(server, rows, output_format, num_workers)
+            for rows in sizes]
+  finally:
+    server.Stop()
+
+
+def RunBenchmark(server, rows, output_format='tsv', num_workers=NUM_WORKERS):
+  """Benchmarks one export in its own process.
+
+  Args:
+    server: mock_api_server.MockApiServer The started server to export from.
+    rows: int The number of rows of the export.
+    output_format: string The output format, one of PRINTERS.
+    num_workers: int The number of pages retrieved at the same time.
+
+  Returns:
+    BenchmarkResult The measurements of the export.
+
+  Raises:
+    BenchmarkError: If the export fails.
+  """
+  server.total_results = rows
+  receiver, sender = multiprocessing.Pipe(duplex=False)
+  process = multiprocessing.Process(
+      target=_RunExport, args=(server, output_format, num_workers, sender))
+  process.start()
+  sender.close()
+  try:
+    error, result = receiver.recv()
+  except EOFError:
+    error, result = 'The export process exited unexpectedly.', None
+  process.join()
+
+  if error:
+    raise BenchmarkError(msg=error)
+  return result
+
+
+def FormatResults(results):
+  """Returns the results of RunBenchmarks as a table.
+
+  Args:
+    results: list of BenchmarkResult tuples.
+
+  Returns:
+    string One line per result, after a line of column names.
+  """
+  lines = ['%10s %6s %9s %11s %10s %12s %11s' % (
+      'rows', 'pages', 'seconds', 'rows/s', 'first row', 'peak RSS MB',
+      'output MB')]
+  for result in results:
+    lines.append('%10d %6d %9.2f %11.0f %10.3f %12.1f %11.1f' % (
+        result.rows, result.pages, result.seconds,
+        result.rows / max(result.seconds, 1e-9), result.first_row_seconds,
+        result.peak_rss_kb / 1024.0, result.output_bytes / 1048576.0))
+  return '\n'.join(lines)
+
+
+class BenchmarkError(Exception):
+  """Raised when an export of a benchmark fails."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _RunExport(server, output_format, num_workers, sender):
+  """Exports every row of the server and sends an (error, result) tuple."""
+  output_dir = tempfile.mkdtemp()
+  try:
+    my_client = server.GetClient()
+    paginator = pagination.AutoPaginator(my_client, None,
+                                         num_workers=num_workers,
+                                         converter=feed_parser.ParseDataFeed)
+    file_name = os.path.join(output_dir, 'export.%s' % output_format)
+    printer = PRINTERS[output_format](file_name)
+    counts = {'rows': 0, 'pages': 0}
+
+    start = time.time()
+    times = []
+    query = gdata.analytics.client.DataFeedQuery(dict(QUERY))
+    try:
+      printer.OutputPages(_CountPages(paginator.GetDataPages(query, -1),
+                                      counts, start, times))
+    finally:
+      printer.Close()
+    seconds = time.time() - start
+    my_client.http_client.Close()
+
+    # ru_maxrss is in kilobytes on Linux.
+    peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    sender.send((None, BenchmarkResult(
+        counts['rows'], counts['pages'], seconds,
+        times[0] if times else seconds, peak_rss_kb,
+        os.path.getsize(file_name))))
+  except Exception:
+    sender.send((traceback.format_exc(), None))
+  finally:
+    sender.close()
+    shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def _CountPages(pages, counts, start, times):
+  """Yields pages, counting their rows and timing the first one."""
+  for page in pages:
+    if not times:
+      times.append(time.time() - start)
+    counts['pages'] += 1
+    counts['rows'] += len(page.entry)
+    yield page
+
+
+def main():
+  """Main program."""
+  args = sys.argv[1:]
+  output_format = 'tsv'
+  if args and args[0] in PRINTERS:
+    output_format = args.pop(0)
+  sizes = [int(arg) for arg in args] or SIZES
+
+  print 'Exporting %s with %d workers.' % (output_format, NUM_WORKERS)
+  try:
+    results = RunBenchmarks(sizes, output_format)
+  except BenchmarkError, error:
+    print error.msg
+    sys.exit(1)
+  print FormatResults(results)
+
+
+if __name__ == '__main__':
+  main()
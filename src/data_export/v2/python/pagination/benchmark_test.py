@@ -0,0 +1,52 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for benchmark.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import unittest
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+
+  def testRunBenchmarks(self):
+    results = benchmark.RunBenchmarks([500, 25000], 'jsonl', num_workers=2)
+
+    self.assertEqual([500, 25000], [result.rows for result in results])
+    self.assertEqual([1, 3], [result.pages for result in results])
+    for result in results:
+      self.assertTrue(result.first_row_seconds <= result.seconds)
+      self.assertTrue(result.peak_rss_kb > 0)
+      self.assertTrue(result.output_bytes > 0)
+
+  def testError(self):
+    self.assertRaises(benchmark.BenchmarkError, benchmark.RunBenchmarks,
+                      [100], error_rate=1)
+
+  def testFormatResults(self):
+    table = benchmark.FormatResults(
+        [benchmark.BenchmarkResult(1000, 1, 0.5, 0.25, 2048, 1048576)])
+    lines = table.split('\n')
+
+    self.assertEqual(2, len(lines))
+    self.assertEqual(['1000', '1', '0.50', '2000', '0.250', '2.0', '1.0'],
+                     lines[1].split())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Exports the same set of queries for many profiles using a process pool.
+
+Each (profile, query) pair is an ExportJob. The jobs are spread across a
+pool of processes, so parsing and writing use every core. Each process
+creates its own authorized client once, then exports its jobs one after the
+other to a TSV file per job. A JobSummary with the rows, pages, size of the
+output file and time of each job is returned to the caller.
+
+The authorization token must already be saved to disk before the processes
+start, since they can not prompt the user. RunBulkExport calls the client
+factory once before starting them, so any missing token is requested then.
+
+  RunBulkExport(): Runs every job and returns their summaries.
+  GetExportJobs(): Returns one job per profile and query.
+  FormatSummary(): Returns the summaries as a printable table.
+  GetAuthorizedClient(): Returns an authorized client and its auth helper.
+  ExportJob: A query to export for one profile.
+  JobSummary: The outcome of one job.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import collections
+import functools
+import httplib
+import multiprocessing
+import os
+import re
+import socket
+import time
+from xml.parsers import expat
+
+import auth
+import credential_pool
+import feed_parser
+import feed_printer
+import gdata.analytics.client
+import http_pool
+import pagination
+
+
+ExportJob = collections.namedtuple('ExportJob', 'table_id query_name query')
+
+JobSummary = collections.namedtuple(
+    'JobSummary',
+    'table_id query_name file_name rows pages file_bytes seconds error')
+
+DEFAULT_NUM_PROCESSES = multiprocessing.cpu_count()
+
+# The client of the current worker process, created by _InitWorker.
+_worker_client = None
+
+
+def RunBulkExport(jobs, output_dir, app_name, num_processes=None,
+                  num_workers=pagination.AutoPaginator.DEFAULT_NUM_WORKERS,
+                  client_factory=None):
+  """Runs every job on a pool of processes.
+
+  Args:
+    jobs: list of ExportJob The jobs to run.
+    output_dir: string The directory to write one TSV file per job to.
+    app_name: string The name of this application.
+    num_processes: int (optional) The number of processes. Defaults to the
+        number of cores.
+    num_workers: int The number of pages each process retrieves at the same
+        time.
+    client_factory: function (optional) Called with app_name in each process
+        to return a (client, auth helper) tuple, such as
+        credential_pool.PoolFactory. Must be picklable. Defaults to
+        GetAuthorizedClient. It is also called once in this process so any
+        token is saved before the processes start.
+
+  Returns:
+    A list of JobSummary, in the same order as jobs.
+  """
+  client_factory = client_factory or GetAuthorizedClient
+  client_factory(app_name)
+
+  if not os.path.isdir(output_dir):
+    os.makedirs(output_dir)
+
+  workers = multiprocessing.Pool(
+      num_processes or DEFAULT_NUM_PROCESSES, initializer=_InitWorker,
+      initargs=(client_factory, app_name))
+  try:
+    return workers.map(
+        functools.partial(_RunJob, output_dir=output_dir,
+                          num_workers=num_workers),
+        jobs, chunksize=1)
+  finally:
+    workers.close()
+    workers.join()
+
+
+def GetExportJobs(table_ids, queries):
+  """Returns one job per profile and query.
+
+  Args:
+    table_ids: list The table ids to export, such as ga:1174.
+    queries: dict The name of each query mapped to a
+        gdata.analytics.client.DataFeedQuery or a dict of its parameters.
+        The ids parameter is replaced by each table id.
+
+  Returns:
+    A list of ExportJob.
+  """
+  jobs = []
+  for table_id in table_ids:
+    for query_name in sorted(queries):
+      params = dict(getattr(queries[query_name], 'query', queries[query_name]))
+      params['ids'] = table_id
+      jobs.append(ExportJob(table_id, query_name, params))
+  return jobs
+
+
+def FormatSummary(summaries):
+  """Returns the summaries of the jobs as a printable table.
+
+  Args:
+    summaries: list of JobSummary The summaries returned by RunBulkExport.
+
+  Returns:
+    string One line per job followed by the totals.
+  """
+  lines = ['%-16s %-20s %10s %6s %12s %8s  %s' % (
+      'Table Id', 'Query', 'Rows', 'Pages', 'File Bytes', 'Seconds', 'Error')]
+  for summary in summaries:
+    lines.append('%-16s %-20s %10d %6d %12d %8.1f  %s' % (
+        summary.table_id, summary.query_name, summary.rows, summary.pages,
+        summary.file_bytes, summary.seconds, summary.error or ''))
+
+  failed = len([summary for summary in summaries if summary.error])
+  lines.append('%-16s %-20s %10d %6d %12d %8.1f  %d failed' % (
+      'Total', '%d jobs' % len(summaries),
+      sum(summary.rows for summary in summaries),
+      sum(summary.pages for summary in summaries),
+      sum(summary.file_bytes for summary in summaries),
+      sum(summary.seconds for summary in summaries), failed))
+  return '\n'.join(lines)
+
+
+def GetAuthorizedClient(app_name):
+  """Returns an authorized client and its auth helper.
+
+  Args:
+    app_name: string The name of this application.
+
+  Returns:
+    A (gdata.analytics.client.AnalyticsClient, auth.AuthRoutineUtil) tuple.
+
+  Raises:
+    AuthError: If there was an error trying to get a token.
+  """
+  my_auth_helper = auth.AuthRoutineUtil()
+  my_client = gdata.analytics.client.AnalyticsClient(
+      source=app_name, http_client=http_pool.PooledHttpClient())
+  my_client.auth_token = auth.OAuthRoutine(my_client,
+                                           my_auth_helper).GetAuthToken()
+  return my_client, my_auth_helper
+
+
+def GetFileName(job):
+  """Returns the name of the output file of a job."""
+  return re.sub(r'[^\w.-]', '_', '%s_%s.tsv' % (job.table_id, job.query_name))
+
+
+def _InitWorker(client_factory, app_name):
+  """Creates the client of a worker process."""
+  global _worker_client
+  _worker_client = client_factory(app_name)
+
+
+def _RunJob(job, output_dir, num_workers):
+  """Exports one job in a worker process and returns its JobSummary."""
+  my_client, my_auth_helper = _worker_client
+  paginator = pagination.AutoPaginator(my_client, my_auth_helper,
+                                       num_workers=num_workers,
+                                       converter=feed_parser.ParseDataFeed)
+  file_name = os.path.join(output_dir, GetFileName(job))
+  counts = {'rows': 0, 'pages': 0}
+  error = None
+  start_time = time.time()
+
+  def CountPages(pages):
+    for page in pages:
+      counts['pages'] += 1
+      counts['rows'] += len(page.entry)
+      yield page
+
+  my_handle = open(file_name, 'wb')
+  try:
+    printer = feed_printer.FeedPrinter(
+        feed_printer.UnicodeWriter(my_handle, dialect='excel-tab'))
+    query = gdata.analytics.client.DataFeedQuery(dict(job.query))
+    printer.OutputPages(CountPages(paginator.GetDataPages(query, -1)))
+  except pagination.AutoPaginatorError, paginator_error:
+    # An empty message must still mark the job as failed.
+    error = (_GetFirstLine(paginator_error.msg) or
+             type(paginator_error).__name__)
+  # A failed job must not abort the other jobs of the pool. A malformed
+  # response fails to parse with any of the last three errors.
+  except (socket.error, httplib.HTTPException, IOError,
+          credential_pool.CredentialPoolError, expat.ExpatError, SyntaxError,
+          ValueError), job_error:
+    error = _GetFirstLine('%s: %s' % (type(job_error).__name__, job_error))
+  finally:
+    my_handle.close()
+
+  return JobSummary(job.table_id, job.query_name, file_name, counts['rows'],
+                    counts['pages'], os.path.getsize(file_name),
+                    time.time() - start_time, error)
+
+
+def _GetFirstLine(msg):
+  """Returns the first line of an error message, or '' if it is empty."""
+  return (msg.splitlines() or [''])[0]
@@ -0,0 +1,73 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Demo on how to export the same queries for many profiles at once.
+
+Every query in QUERIES is exported for every profile in TABLE_IDS. The
+exports are spread across one process per core and each export is written
+to its own tab seperated file in OUTPUT_DIR.
+
+Usage: Set your table ids in the TABLE_IDS variable. Configure which
+    directory to write to in the OUTPUT_DIR variable.
+
+APP_NAME: The name of this application.
+TABLE_IDS: The Google Analytics Table IDs from which to retrieve data.
+OUTPUT_DIR: The directory to write the output files to.
+QUERIES: The name and parameters of each query to export.
+
+  main(): The main logic of the application.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import sys
+import auth
+import bulk_export
+
+
+APP_NAME = 'BulkExport_Demo'
+TABLE_IDS = ['ga:xxxxx', 'ga:yyyyy']  # Insert your Table Ids here.
+OUTPUT_DIR = 'my_output'
+QUERIES = {
+    'search_traffic': {
+        'start-date': '2010-10-01',
+        'end-date': '2010-10-30',
+        'dimensions': 'ga:source,ga:medium,ga:keyword',
+        'metrics': 'ga:visits',
+        'sort': '-ga:visits,ga:medium,ga:source'},
+    'daily_visits': {
+        'start-date': '2010-10-01',
+        'end-date': '2010-10-30',
+        'dimensions': 'ga:date',
+        'metrics': 'ga:visits,ga:pageviews'},
+}
+
+
+def main():
+  """Main program."""
+  jobs = bulk_export.GetExportJobs(TABLE_IDS, QUERIES)
+  try:
+    summaries = bulk_export.RunBulkExport(jobs, OUTPUT_DIR, APP_NAME)
+
+  except auth.AuthError, error:
+    print error.msg
+    sys.exit(1)
+
+  print bulk_export.FormatSummary(summaries)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for bulk_export.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import shutil
+import socket
+import StringIO
+import tempfile
+import unittest
+import bulk_export
+import feed_parser
+import gdata.analytics.client
+import gdata.client
+
+
+class FakeProfileClient(object):
+  """Returns 15000 rows for each profile, except a few which fail.
+
+  ga:0 is not found, ga:7 returns a truncated response, the connection to
+  ga:8 is reset and ga:9 is rejected without any message.
+  """
+
+  api_version = '2'
+
+  def GetDataFeed(self, query, converter=None):
+    if query.query['ids'] == 'ga:0':
+      raise gdata.client.RequestError('Server responded with: 404\nNot Found')
+    if query.query['ids'] == 'ga:7':
+      return feed_parser.ParseDataFeed(StringIO.StringIO(
+          '<feed xmlns="http://www.w3.org/2005/Atom"><entry>'))
+    if query.query['ids'] == 'ga:8':
+      raise socket.error(104, 'Connection reset by peer')
+    if query.query['ids'] == 'ga:9':
+      raise gdata.client.Unauthorized('')
+
+    start_index = int(query.query.get('start-index') or 1)
+    end_index = min(start_index + int(query.query['max-results']), 15001)
+    page = feed_parser.DataPage()
+    page.total_results = feed_parser.TextElement('15000')
+    page.dimension_names = ['ga:profile']
+    page.metric_names = ['ga:visits']
+    page.entry = [(query.query['ids'], str(i))
+                  for i in range(start_index, end_index)]
+    return page
+
+
+def GetFakeClient(app_name):
+  """Returns a fake client and no auth helper."""
+  return FakeProfileClient(), None
+
+
+class TestBulkExport(unittest.TestCase):
+
+  def setUp(self):
+    self.output_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.output_dir)
+
+  def testGetExportJobs(self):
+    queries = {
+        'visits': gdata.analytics.client.DataFeedQuery({
+            'ids': 'ga:1', 'metrics': 'ga:visits'}),
+        'browsers': {'dimensions': 'ga:browser', 'metrics': 'ga:visits'},
+    }
+    jobs = bulk_export.GetExportJobs(['ga:2', 'ga:3'], queries)
+    self.assertEqual(
+        [('ga:2', 'browsers'), ('ga:2', 'visits'),
+         ('ga:3', 'browsers'), ('ga:3', 'visits')],
+        [(job.table_id, job.query_name) for job in jobs])
+    self.assertEqual({'ids': 'ga:3', 'metrics': 'ga:visits'}, jobs[3].query)
+    self.assertEqual('ga:1', queries['visits'].query['ids'])
+
+  def testRunBulkExport(self):
+    jobs = bulk_export.GetExportJobs(['ga:1', 'ga:0', 'ga:2'],
+                                     {'visits': {'metrics': 'ga:visits'}})
+    summaries = bulk_export.RunBulkExport(
+        jobs, self.output_dir, 'test', num_processes=2,
+        client_factory=GetFakeClient)
+
+    self.assertEqual(['ga:1', 'ga:0', 'ga:2'],
+                     [summary.table_id for summary in summaries])
+    self.assertTrue(summaries[1].error.startswith('There was a error'))
+    self.assertEqual(0, summaries[1].rows)
+
+    for summary in (summaries[0], summaries[2]):
+      self.assertEqual(None, summary.error)
+      self.assertEqual(15000, summary.rows)
+      self.assertEqual(2, summary.pages)
+      self.assertEqual(os.path.getsize(summary.file_name), summary.file_bytes)
+
+    lines = open(summaries[2].file_name, 'rb').read().splitlines()
+    self.assertEqual(15001, len(lines))
+    self.assertEqual('ga:profile\tga:visits', lines[0])
+    self.assertEqual('ga:2\t15000', lines[-1])
+
+    table = bulk_export.FormatSummary(summaries)
+    self.assertTrue('30000' in table.splitlines()[-1])
+    self.assertTrue('1 failed' in table.splitlines()[-1])
+
+  def testFailedJobsDoNotStopOthers(self):
+    jobs = bulk_export.GetExportJobs(['ga:8', 'ga:9', 'ga:7', 'ga:1'],
+                                     {'visits': {'metrics': 'ga:visits'}})
+    summaries = bulk_export.RunBulkExport(
+        jobs, self.output_dir, 'test', num_processes=1,
+        client_factory=GetFakeClient)
+
+    self.assertTrue(summaries[0].error.startswith('error: '))
+    self.assertTrue('Connection reset by peer' in summaries[0].error)
+    self.assertEqual('AutoPaginatorError', summaries[1].error)
+    self.assertTrue(summaries[2].error.startswith('ExpatError: '))
+    self.assertEqual(None, summaries[3].error)
+    self.assertEqual(15000, summaries[3].rows)
+    self.assertTrue('3 failed' in
+                    bulk_export.FormatSummary(summaries).splitlines()[-1])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,248 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides exports which can be resumed after an error.
+
+Each page retrieved by a CheckpointedExport is saved to a spool directory
+along with a manifest which records the query, its total results and the
+pages already retrieved. If the export fails, running the same export again
+only retrieves the missing pages. Once every page has been yielded, the
+manifest is marked complete, so running the same query again, such as a
+nightly export with relative dates, starts a fresh export.
+
+Usage:
+  export = checkpoint.CheckpointedExport(paginator, 'spool_dir')
+  printer.OutputPages(export.GetDataPages(query, -1))
+
+  CheckpointedExport: Retrieves the pages of a query with checkpoints.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cPickle
+import json
+import os
+import re
+
+import atomic_file
+import feed_parser
+import gdata.client
+import pagination
+import response_cache
+
+
+# The names of the saved pages in the spool directory.
+_PAGE_FILE_NAME = re.compile(r'^page-\d+\.(pickle|xml)$')
+
+# Errors raised when reading a saved page which is missing or truncated.
+# ElementTree raises a subclass of SyntaxError for invalid XML.
+_LOAD_ERRORS = (IOError, EOFError, ValueError, SyntaxError,
+                cPickle.UnpicklingError)
+
+
+class CheckpointedExport(object):
+  """Retrieves the pages of a query and saves a checkpoint after each page.
+
+  Attributes:
+    MANIFEST_FILE_NAME: string The name of the manifest in the spool directory.
+    paginator: pagination.AutoPaginator The paginator used to retrieve the
+        pages.
+    spool_dir: string The directory with the saved pages and the manifest.
+    pages_fetched: int The number of pages retrieved from the API by the last
+        export, as opposed to read from the spool directory.
+  """
+
+  MANIFEST_FILE_NAME = 'manifest.json'
+
+  def __init__(self, paginator, spool_dir):
+    """Initializes this class.
+
+    Args:
+      paginator: pagination.AutoPaginator The paginator used to retrieve the
+          pages.
+      spool_dir: string The directory to save the pages in. It is created if
+          it does not exist.
+    """
+    self.paginator = paginator
+    self.spool_dir = spool_dir
+    self.pages_fetched = 0
+
+    if not os.path.isdir(spool_dir):
+      os.makedirs(spool_dir)
+
+  def GetDataPages(self, query, num_pages):
+    """Yields each page of the query, retrieving only the missing pages.
+
+    If the spool directory has the manifest of an unfinished export of the
+    same query, the pages already saved are read from disk, and any saved
+    page which can not be read is retrieved again. Otherwise the spool
+    directory is cleared and the export starts from the first page.
+
+    Args:
+      query: gdata.analytics.client.DataQuery The query to pagniate.
+      num_pages: int The number of pages to retrieve from the API.
+          if -1: return all pages in the result.
+          if >0: return a specific number of pages in the result.
+
+    Yields:
+      gdata.analytics.data.DataFeed or feed_parser.DataPage One object per
+      page, in page order.
+
+    Raises:
+      AutoPaginatorError if an error occurs with the API request. All the
+      pages retrieved before the error are kept.
+    """
+    self.pages_fetched = 0
+    query.query['max-results'] = pagination.AutoPaginator.DEFAULT_MAX_RESULTS
+    query_key = response_cache.GetCacheKey(query)
+
+    manifest = self.LoadManifest()
+    if (not manifest or manifest['query_key'] != query_key or
+        manifest.get('complete')):
+      self.Clear()
+      first_page = self.paginator.GetData(query)
+      self.pages_fetched += 1
+      manifest = {'query_key': query_key,
+                  'query': query.query,
+                  'total_results': first_page.total_results.text,
+                  'pages_done': []}
+      self.SavePage(manifest, self.GetFirstStartIndex(query), first_page)
+
+    self.paginator.SetPagination(query, manifest['total_results'], num_pages)
+    start_indicies = ([self.paginator.start_index] +
+                      self.paginator.GetStartIndicies())
+
+    pages_done = set(manifest['pages_done'])
+    missing = [start_index for start_index in start_indicies
+               if start_index not in pages_done]
+    fetched_pages = self.paginator.GetPages(query, missing)
+
+    for start_index in start_indicies:
+      page = None
+      if start_index in pages_done:
+        page = self.LoadPage(start_index)
+        if page is None:
+          page = self.paginator.GetData(
+              self.paginator.GetPageQuery(query, start_index))
+          self.pages_fetched += 1
+          self.SavePage(manifest, start_index, page)
+      else:
+        page = fetched_pages.next()
+        self.pages_fetched += 1
+        self.SavePage(manifest, start_index, page)
+      yield page
+
+    manifest['complete'] = True
+    self.SaveManifest(manifest)
+
+  def GetFirstStartIndex(self, query):
+    """Returns the start index of the first page of query."""
+    return int(query.query.get('start-index') or
+               pagination.AutoPaginator.DEFAULT_START_INDEX)
+
+  def LoadManifest(self):
+    """Returns the manifest in the spool directory or None if there is none."""
+    try:
+      manifest_file = open(self._GetPath(
+          CheckpointedExport.MANIFEST_FILE_NAME), 'rb')
+      try:
+        return json.load(manifest_file)
+      finally:
+        manifest_file.close()
+    except (IOError, ValueError):
+      return None
+
+  def SavePage(self, manifest, start_index, page):
+    """Saves a page then records it as done in the manifest.
+
+    Args:
+      manifest: dict The manifest of the export.
+      start_index: int The start index of the page.
+      page: gdata.analytics.data.DataFeed or feed_parser.DataPage The page.
+    """
+    if isinstance(page, feed_parser.DataPage):
+      atomic_file.WriteAtomically(
+          self._GetPagePath(start_index),
+          cPickle.dumps(page, cPickle.HIGHEST_PROTOCOL))
+    else:
+      my_client = self.paginator.my_client
+      if my_client.api_version is not None:
+        body = page.to_string(
+            gdata.client.get_xml_version(my_client.api_version))
+      else:
+        body = page.to_string()
+      atomic_file.WriteAtomically(self._GetPagePath(start_index, xml=True),
+                                  body)
+
+    if start_index not in manifest['pages_done']:
+      manifest['pages_done'].append(start_index)
+    self.SaveManifest(manifest)
+
+  def SaveManifest(self, manifest):
+    """Replaces the manifest in the spool directory."""
+    atomic_file.WriteAtomically(
+        self._GetPath(CheckpointedExport.MANIFEST_FILE_NAME),
+        json.dumps(manifest))
+
+  def LoadPage(self, start_index):
+    """Returns the page saved for start_index.
+
+    Args:
+      start_index: int The start index of the page.
+
+    Returns:
+      gdata.analytics.data.DataFeed or feed_parser.DataPage The page as it
+      was retrieved, or None if the saved page is missing or truncated.
+    """
+    try:
+      page_path = self._GetPagePath(start_index)
+      if os.path.exists(page_path):
+        page_file = open(page_path, 'rb')
+        try:
+          return cPickle.load(page_file)
+        finally:
+          page_file.close()
+
+      page_file = open(self._GetPagePath(start_index, xml=True), 'rb')
+      try:
+        return response_cache.ParseResponseBody(self.paginator.my_client,
+                                                page_file.read())
+      finally:
+        page_file.close()
+    except _LOAD_ERRORS:
+      return None
+
+  def Clear(self):
+    """Deletes every saved page and the manifest.
+
+    Only the files written by this class are deleted, so the spool directory
+    can hold other files.
+    """
+    for file_name in os.listdir(self.spool_dir):
+      if (_PAGE_FILE_NAME.match(file_name) or
+          file_name == CheckpointedExport.MANIFEST_FILE_NAME):
+        os.remove(self._GetPath(file_name))
+
+  def _GetPath(self, file_name):
+    """Returns the path of a file in the spool directory."""
+    return os.path.join(self.spool_dir, file_name)
+
+  def _GetPagePath(self, start_index, xml=False):
+    """Returns the path of the page saved for start_index."""
+    if xml:
+      return self._GetPath('page-%d.xml' % start_index)
+    return self._GetPath('page-%d.pickle' % start_index)
@@ -0,0 +1,132 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for checkpoint.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import checkpoint
+import feed_parser
+import gdata.analytics.client
+import gdata.client
+import pagination
+
+
+class FlakyClient(object):
+  """Returns pages of numbered rows and fails once at fail_index."""
+
+  api_version = '2'
+
+  def __init__(self, total_results, fail_index=None):
+    self.total_results = total_results
+    self.fail_index = fail_index
+    self.start_indicies = []
+
+  def GetDataFeed(self, query, converter=None):
+    start_index = int(query.query.get('start-index') or 1)
+    if start_index == self.fail_index:
+      self.fail_index = None
+      raise gdata.client.RequestError('Server responded with: 503')
+    self.start_indicies.append(start_index)
+
+    end_index = min(start_index + int(query.query['max-results']),
+                    self.total_results + 1)
+    page = feed_parser.DataPage()
+    page.total_results = feed_parser.TextElement(str(self.total_results))
+    page.entry = [(str(i),) for i in range(start_index, end_index)]
+    return page
+
+
+class TestCheckpointedExport(unittest.TestCase):
+
+  def setUp(self):
+    self.spool_dir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.spool_dir)
+
+  def GetExport(self, my_client):
+    paginator = pagination.AutoPaginator(my_client, None, num_workers=2)
+    return checkpoint.CheckpointedExport(paginator, self.spool_dir)
+
+  def GetRows(self, export):
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+    return [row[0] for page in export.GetDataPages(query, -1)
+            for row in page.entry]
+
+  def testResume(self):
+    my_client = FlakyClient(45000, fail_index=30001)
+    self.assertRaises(pagination.AutoPaginatorError, self.GetRows,
+                      self.GetExport(my_client))
+    self.assertEqual([1, 10001, 20001], sorted(my_client.start_indicies)[:3])
+
+    my_client.start_indicies = []
+    export = self.GetExport(my_client)
+    rows = self.GetRows(export)
+    self.assertEqual([str(i) for i in range(1, 45001)], rows)
+    self.assertTrue(30001 in my_client.start_indicies)
+    self.assertFalse(1 in my_client.start_indicies)
+    self.assertFalse(10001 in my_client.start_indicies)
+
+    # A finished export is retrieved again rather than read from the spool.
+    my_client.start_indicies = []
+    my_client.total_results = 45001
+    rows = self.GetRows(self.GetExport(my_client))
+    self.assertEqual(45001, len(rows))
+    self.assertEqual([1, 10001, 20001, 30001, 40001],
+                     sorted(my_client.start_indicies))
+
+  def testUnreadablePageIsRetrievedAgain(self):
+    my_client = FlakyClient(45000, fail_index=30001)
+    self.assertRaises(pagination.AutoPaginatorError, self.GetRows,
+                      self.GetExport(my_client))
+    open(os.path.join(self.spool_dir, 'page-10001.pickle'), 'wb').write(
+        '\x80\x02')
+    os.remove(os.path.join(self.spool_dir, 'page-20001.pickle'))
+
+    my_client.start_indicies = []
+    rows = self.GetRows(self.GetExport(my_client))
+    self.assertEqual([str(i) for i in range(1, 45001)], rows)
+    self.assertEqual([10001, 20001, 30001, 40001],
+                     sorted(my_client.start_indicies))
+
+  def testNewQueryClearsSpool(self):
+    my_client = FlakyClient(15000)
+    self.GetRows(self.GetExport(my_client))
+
+    export = self.GetExport(my_client)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:2'})
+    pages = list(export.GetDataPages(query, -1))
+    self.assertEqual(2, len(pages))
+    self.assertEqual(2, export.pages_fetched)
+
+  def testClearKeepsOtherFiles(self):
+    other_path = os.path.join(self.spool_dir, 'my_output.tsv')
+    open(other_path, 'w').write('ga:source\tga:visits\n')
+    export = self.GetExport(FlakyClient(15000))
+    self.GetRows(export)
+
+    export.Clear()
+    self.assertEqual(['my_output.tsv'], os.listdir(self.spool_dir))
+    self.assertEqual('ga:source\tga:visits\n', open(other_path).read())
+
+
+if __name__ == '__main__':
+  unittest.main()
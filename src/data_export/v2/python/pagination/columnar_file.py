@@ -0,0 +1,235 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Writes and reads query results in a compact columnar binary file.
+
+The file stores the same columns as a data_table.DataTable. Metrics are
+stored as typed arrays and dimensions are dictionary encoded. The rows are
+written one block per page, as the pages are retrieved, so the writer only
+keeps the distinct values of each dimension in memory.
+
+File layout, with every count stored as a 4 byte little endian integer and
+every array in the byte order recorded in the header:
+  MAGIC
+  Header: its length, then a JSON object with the names of the dimensions,
+      the name, type, typecode and itemsize of each metric and the byte order
+      of the arrays.
+  Blocks: the number of rows in the block, then for each dimension the number
+      of values not seen in earlier blocks, their UTF-8 lengths as an array
+      of counts, the values themselves and the array of the codes of the
+      rows. Then the array of the values of each metric.
+  End: a block of 0 rows.
+
+Usage:
+  printer = columnar_file.GetColumnarFilePrinter('my_output.gacol')
+  printer.OutputPages(paginator.GetDataPages(my_query, -1))
+  printer.Close()
+  table = columnar_file.ReadDataTable(open('my_output.gacol', 'rb'))
+
+  GetColumnarFilePrinter(): Returns an object to output to columnar files.
+  ColumnarSink: Writes the rows of each page as a block of columns.
+  ReadDataTable(): Returns the DataTable stored in a columnar file.
+  ColumnarFileError: Raised when a file is not a valid columnar file.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import array
+import json
+import struct
+import sys
+
+import data_table
+import feed_printer
+
+
+MAGIC = 'GACOL\x00\x01\n'
+
+_COUNT = struct.Struct('<I')
+_COUNT_TYPECODE = 'I'
+
+
+def GetColumnarFilePrinter(file_name):
+  """Returns a Feed Printer object to output a columnar file to file_name.
+
+  Args:
+    file_name: string The name of the file to output to.
+
+  Returns:
+    The newly created FeedPrinter object.
+  """
+  return feed_printer.FeedPrinter(
+      ColumnarSink(open(file_name, 'wb'), owns_stream=True))
+
+
+class ColumnarSink(feed_printer.Sink):
+  """Writes the rows of each page as a block of typed columns."""
+
+  def __init__(self, stream, owns_stream=False):
+    """Initializes the class.
+
+    Args:
+      stream: file The file to output to.
+      owns_stream: boolean Whether Close closes stream.
+    """
+    self.stream = stream
+    self.owns_stream = owns_stream
+    self.dimensions = []
+    self.typecodes = []
+
+  def WriteHeaders(self, dimension_names, metric_names, metric_types):
+    metric_types = list(metric_types)
+    metric_types += [None] * (len(metric_names) - len(metric_types))
+    self.dimensions = [data_table.DimensionColumn() for _ in dimension_names]
+    self.typecodes = [data_table.GetTypecode(metric_type)
+                      for metric_type in metric_types]
+
+    header = json.dumps({
+        'dimensions': list(dimension_names),
+        'metrics': [{'name': name, 'type': metric_type, 'typecode': typecode,
+                     'itemsize': array.array(typecode).itemsize}
+                    for name, metric_type, typecode
+                    in zip(metric_names, metric_types, self.typecodes)],
+        'byteorder': sys.byteorder})
+    self.stream.write(MAGIC + _COUNT.pack(len(header)) + header)
+
+  def WriteRows(self, rows):
+    if not rows:
+      return
+
+    columns = zip(*rows)
+    num_dims = len(self.dimensions)
+    chunks = [_COUNT.pack(len(rows))]
+    for column, values in zip(self.dimensions, columns[:num_dims]):
+      num_values = len(column.values)
+      column.Extend(values)
+      new_values = [value.encode('utf-8')
+                    for value in column.values[num_values:]]
+      chunks.append(_COUNT.pack(len(new_values)))
+      chunks.append(array.array(_COUNT_TYPECODE,
+                                map(len, new_values)).tostring())
+      chunks.append(''.join(new_values))
+      chunks.append(column.codes.tostring())
+      # Only the distinct values are kept for the next blocks.
+      column.codes = array.array(data_table.CODE_TYPECODE)
+
+    for typecode, values in zip(self.typecodes, columns[num_dims:]):
+      if typecode == data_table.INTEGER_TYPECODE:
+        chunks.append(array.array(typecode, map(int, values)).tostring())
+      else:
+        chunks.append(array.array(typecode, map(float, values)).tostring())
+    self.stream.write(''.join(chunks))
+
+  def Close(self):
+    if self.typecodes or self.dimensions:
+      self.stream.write(_COUNT.pack(0))
+    if self.owns_stream:
+      self.stream.close()
+    else:
+      self.stream.flush()
+
+
+def ReadDataTable(stream):
+  """Returns the DataTable stored in a columnar file.
+
+  Args:
+    stream: file The columnar file, opened for binary reading.
+
+  Returns:
+    data_table.DataTable The columns of the file. The table is empty if the
+    file is empty.
+
+  Raises:
+    ColumnarFileError: If the file is not a valid columnar file.
+  """
+  table = data_table.DataTable()
+  magic = stream.read(len(MAGIC))
+  if not magic:
+    return table
+  if magic != MAGIC:
+    raise ColumnarFileError(msg='Not a columnar file.')
+
+  header = json.loads(stream.read(_ReadCount(stream)))
+  metrics = header['metrics']
+  table.SetColumns(header['dimensions'],
+                   [metric['name'] for metric in metrics],
+                   [metric['type'] for metric in metrics])
+  typecodes = [_GetTypecode(metric['typecode'], metric['itemsize'])
+               for metric in metrics]
+  swap = header['byteorder'] != sys.byteorder
+
+  while True:
+    num_rows = _ReadCount(stream)
+    if not num_rows:
+      return table
+
+    for column in table.dimensions:
+      lengths = _ReadArray(stream, _COUNT_TYPECODE, _ReadCount(stream), swap)
+      data = stream.read(sum(lengths))
+      offset = 0
+      for length in lengths:
+        value = data[offset:offset + length].decode('utf-8')
+        column.index[value] = len(column.values)
+        column.values.append(value)
+        offset += length
+      column.codes.extend(
+          _ReadArray(stream, data_table.CODE_TYPECODE, num_rows, swap))
+
+    for column, typecode in zip(table.metrics, typecodes):
+      column.extend(_ReadArray(stream, typecode, num_rows, swap))
+    table.num_rows += num_rows
+
+
+class ColumnarFileError(Exception):
+  """Raised when a file is not a valid columnar file."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _ReadCount(stream):
+  """Reads a count from stream."""
+  data = stream.read(_COUNT.size)
+  if len(data) != _COUNT.size:
+    raise ColumnarFileError(msg='The columnar file is truncated.')
+  return _COUNT.unpack(data)[0]
+
+
+def _ReadArray(stream, typecode, length, swap):
+  """Reads an array of length items from stream."""
+  values = array.array(typecode)
+  data = stream.read(length * values.itemsize)
+  if len(data) != length * values.itemsize:
+    raise ColumnarFileError(msg='The columnar file is truncated.')
+  values.fromstring(data)
+  if swap:
+    values.byteswap()
+  return values
+
+
+def _GetTypecode(typecode, itemsize):
+  """Returns a local array type code with the item size of the file."""
+  if array.array(typecode).itemsize == itemsize:
+    return typecode
+  candidates = ('i', 'l') if typecode in 'il' else ('f', 'd')
+  for candidate in candidates:
+    if array.array(candidate).itemsize == itemsize:
+      return candidate
+  raise ColumnarFileError(msg='Unsupported item size %d for type code %s.' %
+                          (itemsize, typecode))
@@ -0,0 +1,99 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for columnar_file.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import os
+import unittest
+import columnar_file
+import feed_parser
+import feed_printer
+
+
+DATA_FEED_FILE_NAME = os.path.join(os.path.dirname(__file__), '..', '..', '..',
+                                   '..', 'v2', 'dataFeedResponse.xml')
+
+
+def GetPage(rows):
+  """Returns a page of ga:source, ga:visits and ga:avgTimeOnSite rows."""
+  page = feed_parser.DataPage()
+  page.dimension_names = ['ga:source']
+  page.metric_names = ['ga:visits', 'ga:avgTimeOnSite']
+  page.metric_types = ['integer', 'time']
+  page.entry = rows
+  return page
+
+
+class TestColumnarFile(unittest.TestCase):
+
+  def Write(self, pages):
+    output = cStringIO.StringIO()
+    printer = feed_printer.FeedPrinter(columnar_file.ColumnarSink(output))
+    printer.OutputPages(pages)
+    printer.Close()
+    return output.getvalue()
+
+  def testRoundTrip(self):
+    pages = [GetPage([(u'google', u'10', u'1.5'), (u'caf\xe9', u'3', u'0.0')]),
+             GetPage([]),
+             GetPage([(u'google', u'7', u'2.25'), (u'', u'1', u'8.0')])]
+    table = columnar_file.ReadDataTable(cStringIO.StringIO(self.Write(pages)))
+
+    self.assertEqual(['ga:source'], table.dimension_names)
+    self.assertEqual(['integer', 'time'], table.metric_types)
+    self.assertEqual(4, len(table))
+    self.assertEqual([u'google', u'caf\xe9', u''],
+                     table.GetDimension('ga:source').values)
+    self.assertEqual([(u'google', 10, 1.5), (u'caf\xe9', 3, 0.0),
+                      (u'google', 7, 2.25), (u'', 1, 8.0)],
+                     list(table.GetRows()))
+    self.assertEqual(21, table.Sum('ga:visits'))
+
+  def testSmallerThanTsv(self):
+    page = feed_parser.ParseDataFeed(open(DATA_FEED_FILE_NAME, 'rb'))
+    page.entry = page.entry * 50
+    data = self.Write([page])
+
+    tsv = cStringIO.StringIO()
+    feed_printer.FeedPrinter(
+        feed_printer.UnicodeWriter(tsv, dialect='excel-tab')).Output(page)
+    self.assertTrue(len(data) < len(tsv.getvalue()))
+
+    table = columnar_file.ReadDataTable(cStringIO.StringIO(data))
+    self.assertEqual(len(page.entry), len(table))
+    self.assertEqual(page.entry[-1][:len(page.dimension_names)],
+                     table.GetRow(len(table) - 1)[:len(page.dimension_names)])
+
+  def testEmpty(self):
+    self.assertEqual('', self.Write([]))
+    self.assertEqual(0, len(columnar_file.ReadDataTable(
+        cStringIO.StringIO(''))))
+
+  def testInvalidFile(self):
+    self.assertRaises(columnar_file.ColumnarFileError,
+                      columnar_file.ReadDataTable,
+                      cStringIO.StringIO('not a columnar file'))
+    data = self.Write([GetPage([(u'google', u'10', u'1.5')])])
+    self.assertRaises(columnar_file.ColumnarFileError,
+                      columnar_file.ReadDataTable,
+                      cStringIO.StringIO(data[:-6]))
+
+
+if __name__ == '__main__':
+  unittest.main()
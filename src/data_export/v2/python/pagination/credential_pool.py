@@ -0,0 +1,266 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Spreads Data Export API requests across several authorized accounts.
+
+The API quota is tracked per credential, so one authorized client limits the
+throughput of an export. A CredentialPool holds one authorized client per
+account and can be used in place of a client: each request leases the
+client with the fewest requests in flight.
+
+A credential whose request fails with gdata.client.Unauthorized is taken out
+of rotation, its saved token is deleted and the request is made again with
+another credential. The export only fails once no credential is left.
+
+Usage:
+  my_pool = credential_pool.GetAuthorizedPool(APP_NAME, ['first', 'second'])
+  paginator = pagination.AutoPaginator(my_pool, None, num_workers=8)
+
+  CredentialPool: Leases authorized clients to requests.
+  Credential: One authorized client and its request counts.
+  GetAuthorizedPool(): Returns a pool with one authorized client per account.
+  PoolFactory: Builds pools in the processes of bulk_export.RunBulkExport.
+  CredentialPoolError: Raised when a pool has no credentials.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import contextlib
+import threading
+
+import auth
+import gdata.analytics.client
+import gdata.client
+import http_pool
+
+
+class CredentialPool(object):
+  """Leases authorized clients to requests, fewest requests in flight first.
+
+  The pool has the GetDataFeed method and api_version attribute of a client,
+  so it can be given to an AutoPaginator, ResponseCache or any other class
+  which makes requests with a client.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.credentials = []
+    self.lock = threading.Lock()
+
+  @property
+  def api_version(self):
+    """The API version of the clients in the pool."""
+    if not self.credentials:
+      return None
+    return self.credentials[0].my_client.api_version
+
+  def AddClient(self, my_client, my_auth_helper=None, name=None):
+    """Adds an authorized client to the rotation.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient An authorized client.
+      my_auth_helper: auth.AuthRoutineUtil (optional) Deletes the token of the
+          client if the client is taken out of rotation.
+      name: string (optional) A name for the credential, such as its account.
+
+    Returns:
+      Credential The new credential.
+    """
+    credential = Credential(my_client, my_auth_helper,
+                            name or str(len(self.credentials)))
+    with self.lock:
+      self.credentials.append(credential)
+    return credential
+
+  def GetDataFeed(self, query, **kwargs):
+    """Makes a data feed request with the least busy credential.
+
+    Unauthorized credentials are taken out of rotation and the request is
+    made again with the next credential.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to retrieve.
+      kwargs: The other arguments of the GetDataFeed method of the client,
+          such as converter or http_request.
+
+    Returns:
+      The result of the GetDataFeed method of the client.
+
+    Raises:
+      gdata.client.Unauthorized: If every credential is unauthorized.
+      CredentialPoolError: If the pool has no credentials.
+    """
+    while True:
+      with self.Lease() as credential:
+        try:
+          return credential.my_client.GetDataFeed(query, **kwargs)
+        except gdata.client.Unauthorized, error:
+          self.Disable(credential, error)
+
+  @contextlib.contextmanager
+  def Lease(self):
+    """Leases the active credential with the fewest requests in flight.
+
+    Yields:
+      Credential The leased credential, returned to the pool after the with
+      block.
+
+    Raises:
+      gdata.client.Unauthorized: If every credential is unauthorized.
+      CredentialPoolError: If the pool has no credentials.
+    """
+    credential = self.Acquire()
+    try:
+      yield credential
+    finally:
+      self.Release(credential)
+
+  def Acquire(self):
+    """Takes the active credential with the fewest requests in flight.
+
+    Each call must be followed by a call to Release.
+
+    Returns:
+      Credential The least busy active credential. Ties go to the credential
+      with the fewest requests so far.
+
+    Raises:
+      gdata.client.Unauthorized: If every credential is unauthorized.
+      CredentialPoolError: If the pool has no credentials.
+    """
+    with self.lock:
+      active = self.GetActiveCredentials()
+      if not active:
+        if self.credentials:
+          raise self.credentials[-1].error
+        raise CredentialPoolError(msg='The credential pool is empty.')
+
+      credential = min(active, key=lambda cred: (cred.in_flight,
+                                                 cred.requests))
+      credential.in_flight += 1
+      credential.requests += 1
+      return credential
+
+  def Release(self, credential):
+    """Returns a credential taken with Acquire to the pool."""
+    with self.lock:
+      credential.in_flight -= 1
+
+  def Disable(self, credential, error):
+    """Takes a credential out of rotation and deletes its saved token.
+
+    Args:
+      credential: Credential The credential to disable.
+      error: gdata.client.Unauthorized The error of the credential.
+    """
+    with self.lock:
+      if credential.error:
+        return
+      credential.error = error
+    if credential.my_auth_helper:
+      credential.my_auth_helper.DeleteAuthToken()
+
+  def GetActiveCredentials(self):
+    """Returns the credentials still in rotation."""
+    return [credential for credential in self.credentials
+            if not credential.error]
+
+
+class Credential(object):
+  """One authorized client of a CredentialPool.
+
+  Attributes:
+    my_client: gdata.analytics.client.AnalyticsClient The authorized client.
+    my_auth_helper: auth.AuthRoutineUtil The helper which saved its token.
+    name: string The name of the credential.
+    in_flight: int The number of requests being made with the client.
+    requests: int The number of requests made with the client.
+    error: gdata.client.Unauthorized The error which took the credential out
+        of rotation, or None if it is active.
+  """
+
+  def __init__(self, my_client, my_auth_helper, name):
+    """Initializes this class."""
+    self.my_client = my_client
+    self.my_auth_helper = my_auth_helper
+    self.name = name
+    self.in_flight = 0
+    self.requests = 0
+    self.error = None
+
+
+def GetAuthorizedPool(app_name, accounts, routine_class=auth.OAuthRoutine):
+  """Returns a pool with one authorized client per account.
+
+  The token of each account is loaded from the token file, or requested and
+  saved if there is none. The clients share one pool of HTTP connections.
+
+  Args:
+    app_name: string The name of this application.
+    accounts: list of strings The names of the accounts, used to save their
+        tokens separately.
+    routine_class: class The auth.AuthRoutine used to get each token, such as
+        auth.OAuthRoutine or auth.ClientLoginRoutine.
+
+  Returns:
+    CredentialPool The pool of authorized clients.
+
+  Raises:
+    AuthError: If there was an error trying to get a token.
+  """
+  my_pool = CredentialPool()
+  http_client = http_pool.PooledHttpClient()
+  for account in accounts:
+    my_auth_helper = auth.AuthRoutineUtil(account)
+    my_client = gdata.analytics.client.AnalyticsClient(
+        source=app_name, http_client=http_client)
+    my_client.auth_token = routine_class(my_client,
+                                         my_auth_helper).GetAuthToken()
+    my_pool.AddClient(my_client, my_auth_helper, account)
+  return my_pool
+
+
+class PoolFactory(object):
+  """Builds a CredentialPool in each process of bulk_export.RunBulkExport.
+
+  Usage:
+    bulk_export.RunBulkExport(jobs, OUTPUT_DIR, APP_NAME,
+                              client_factory=PoolFactory(['first', 'second']))
+  """
+
+  def __init__(self, accounts, routine_class=auth.OAuthRoutine):
+    """Initializes this class.
+
+    Args:
+      accounts: list of strings The names of the accounts.
+      routine_class: class The auth.AuthRoutine used to get each token.
+    """
+    self.accounts = accounts
+    self.routine_class = routine_class
+
+  def __call__(self, app_name):
+    """Returns a (CredentialPool, None) tuple to use as client and helper."""
+    return GetAuthorizedPool(app_name, self.accounts, self.routine_class), None
+
+
+class CredentialPoolError(Exception):
+  """Raised when a credential pool has no credentials."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
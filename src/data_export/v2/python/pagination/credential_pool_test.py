@@ -0,0 +1,115 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for credential_pool.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import unittest
+import credential_pool
+import gdata.analytics.client
+import gdata.client
+import pagination
+import pagination_test
+
+
+class FakeAuthHelper(object):
+  """Records whether the token was deleted."""
+
+  def __init__(self):
+    self.deleted = False
+
+  def DeleteAuthToken(self):
+    self.deleted = True
+
+
+class RevokedClient(object):
+  """A client whose token was revoked."""
+
+  api_version = '2'
+
+  def __init__(self):
+    self.requests = 0
+
+  def GetDataFeed(self, query, converter=None):
+    self.requests += 1
+    raise gdata.client.Unauthorized('Server responded with: 401')
+
+
+class TestCredentialPool(unittest.TestCase):
+
+  def GetQuery(self):
+    return gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+  def testFewestInFlightFirst(self):
+    my_pool = credential_pool.CredentialPool()
+    first = my_pool.AddClient(None, name='first')
+    second = my_pool.AddClient(None, name='second')
+
+    with my_pool.Lease() as credential:
+      self.assertTrue(credential is first)
+      with my_pool.Lease() as credential:
+        self.assertTrue(credential is second)
+        self.assertEqual(1, first.in_flight)
+    self.assertEqual(0, first.in_flight)
+    self.assertEqual(0, second.in_flight)
+
+  def testSpreadsConcurrentRequests(self):
+    my_pool = credential_pool.CredentialPool()
+    clients = [pagination_test.FakeClient(80000, delay=0.05)
+               for _ in range(3)]
+    for my_client in clients:
+      my_pool.AddClient(my_client)
+
+    paginator = pagination.AutoPaginator(my_pool, None, num_workers=6)
+    feed = paginator.GetDataFeed(self.GetQuery(), -1)
+    self.assertEqual(range(1, 80001), feed.entry)
+    for my_client, credential in zip(clients, my_pool.credentials):
+      self.assertTrue(my_client.max_in_flight <= 2)
+      self.assertTrue(credential.requests >= 2)
+
+  def testUnauthorizedCredentialLeavesRotation(self):
+    my_pool = credential_pool.CredentialPool()
+    revoked_client = RevokedClient()
+    auth_helper = FakeAuthHelper()
+    revoked = my_pool.AddClient(revoked_client, auth_helper)
+    my_client = pagination_test.FakeClient(30000)
+    my_pool.AddClient(my_client)
+
+    paginator = pagination.AutoPaginator(my_pool, None, num_workers=2)
+    feed = paginator.GetDataFeed(self.GetQuery(), -1)
+    self.assertEqual(range(1, 30001), feed.entry)
+    self.assertEqual(1, revoked_client.requests)
+    self.assertTrue(auth_helper.deleted)
+    self.assertTrue(revoked.error)
+    self.assertEqual([my_pool.credentials[1]], my_pool.GetActiveCredentials())
+
+  def testAllUnauthorized(self):
+    my_pool = credential_pool.CredentialPool()
+    my_pool.AddClient(RevokedClient())
+    my_pool.AddClient(RevokedClient())
+    paginator = pagination.AutoPaginator(my_pool, None)
+    self.assertRaises(pagination.AutoPaginatorError,
+                      paginator.GetDataFeed, self.GetQuery(), -1)
+
+  def testEmpty(self):
+    self.assertRaises(credential_pool.CredentialPoolError,
+                      credential_pool.CredentialPool().GetDataFeed,
+                      self.GetQuery())
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,283 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Typed columnar container for the rows of a Data Export API query.
+
+Each metric is stored in a compact array typed from the metric type reported
+by the API, so integer metrics are stored as integers and currency, percent
+and time metrics as floats. Each dimension is dictionary encoded: every
+distinct value is stored once and each row only holds its integer code.
+
+Operations over a whole column use NumPy when it is installed and the
+standard library otherwise.
+
+Usage:
+  table = data_table.DataTable()
+  for page in paginator.GetDataPages(query, -1):
+    table.AddPage(page)
+  print table.Sum('ga:visits')
+
+  GetDataTable(): Returns a DataTable with the rows of every page.
+  DataTable: The columns of a query.
+  DimensionColumn: The dictionary encoded values of one dimension.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import array
+import heapq
+import math
+
+import feed_parser
+import feed_printer
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+INTEGER_TYPE = 'integer'
+
+# The array type codes used to store each type of metric.
+INTEGER_TYPECODE = 'l'
+FLOAT_TYPECODE = 'd'
+CODE_TYPECODE = 'i'
+
+
+def GetDataTable(pages):
+  """Returns a DataTable with the rows of every page.
+
+  Args:
+    pages: iterable of gdata.analytics.data.DataFeed or feed_parser.DataPage
+        The pages to store, such as AutoPaginator.GetDataPages.
+
+  Returns:
+    DataTable The columns of all the pages.
+  """
+  table = DataTable()
+  for page in pages:
+    table.AddPage(page)
+  return table
+
+
+class DataTable(object):
+  """The typed columns of a Data Export API query.
+
+  Attributes:
+    dimension_names: list The names of the dimensions, in column order.
+    metric_names: list The names of the metrics, in column order.
+    metric_types: list The type of each metric reported by the API.
+    dimensions: list A DimensionColumn for each dimension.
+    metrics: list An array.array for each metric.
+    num_rows: int The number of rows in the table.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.dimension_names = []
+    self.metric_names = []
+    self.metric_types = []
+    self.dimensions = []
+    self.metrics = []
+    self.num_rows = 0
+
+  def __len__(self):
+    return self.num_rows
+
+  def AddPage(self, page):
+    """Appends the rows of a page to the columns.
+
+    The columns are defined by the first page with entries.
+
+    Args:
+      page: gdata.analytics.data.DataFeed or feed_parser.DataPage The page
+          with the rows to append.
+    """
+    if not page.entry:
+      return
+
+    if isinstance(page, feed_parser.DataPage):
+      dimension_names = page.dimension_names
+      metric_names = page.metric_names
+      metric_types = page.metric_types
+      rows = page.entry
+    else:
+      first_entry = page.entry[0]
+      dimension_names = [dim.name for dim in first_entry.dimension]
+      metric_names = [met.name for met in first_entry.metric]
+      metric_types = [met.type for met in first_entry.metric]
+      rows = [feed_printer.GetRow(entry) for entry in page.entry]
+
+    if not self.dimension_names and not self.metric_names:
+      self.SetColumns(dimension_names, metric_names, metric_types)
+
+    columns = zip(*rows)
+    num_dims = len(self.dimensions)
+    for column, values in zip(self.dimensions, columns[:num_dims]):
+      column.Extend(values)
+    for column, values in zip(self.metrics, columns[num_dims:]):
+      if column.typecode == INTEGER_TYPECODE:
+        column.fromlist(map(int, values))
+      else:
+        column.fromlist(map(float, values))
+    self.num_rows += len(rows)
+
+  def SetColumns(self, dimension_names, metric_names, metric_types):
+    """Creates an empty column for each dimension and metric.
+
+    Args:
+      dimension_names: list The names of the dimensions.
+      metric_names: list The names of the metrics.
+      metric_types: list The type of each metric reported by the API.
+    """
+    self.dimension_names = list(dimension_names)
+    self.metric_names = list(metric_names)
+    self.metric_types = list(metric_types)
+    self.dimensions = [DimensionColumn() for _ in dimension_names]
+    self.metrics = [array.array(GetTypecode(metric_type))
+                    for metric_type in metric_types]
+
+  def GetDimension(self, name):
+    """Returns the DimensionColumn of the dimension called name."""
+    return self.dimensions[self.dimension_names.index(name)]
+
+  def GetMetric(self, name):
+    """Returns the values of the metric called name.
+
+    Returns:
+      A numpy.ndarray copy of the column if NumPy is installed. Otherwise the
+      array.array of the column.
+    """
+    column = self.metrics[self.metric_names.index(name)]
+    if numpy:
+      return _AsNumpy(column).copy()
+    return column
+
+  def GetRow(self, row_index):
+    """Returns the values of one row.
+
+    Args:
+      row_index: int The position of the row in the table.
+
+    Returns:
+      A tuple with the dimension values followed by the metric values.
+    """
+    return (tuple(column[row_index] for column in self.dimensions) +
+            tuple(column[row_index] for column in self.metrics))
+
+  def GetRows(self):
+    """Yields the values of every row, as returned by GetRow."""
+    for row_index in xrange(self.num_rows):
+      yield self.GetRow(row_index)
+
+  def Sum(self, name):
+    """Returns the sum of the values of the metric called name."""
+    column = self.metrics[self.metric_names.index(name)]
+    if numpy:
+      return _AsNumpy(column).sum().item()
+    if column.typecode == INTEGER_TYPECODE:
+      return sum(column)
+    return math.fsum(column)
+
+  def TopN(self, name, n):
+    """Returns the positions of the n rows with the largest values of a metric.
+
+    Args:
+      name: string The name of the metric to rank the rows by.
+      n: int The number of rows to return.
+
+    Returns:
+      A list with the position of each row, largest value first.
+    """
+    column = self.metrics[self.metric_names.index(name)]
+    n = min(n, len(column))
+    if n <= 0:
+      return []
+
+    if numpy:
+      values = _AsNumpy(column)
+      top = numpy.argpartition(-values, n - 1)[:n]
+      return top[numpy.argsort(-values[top], kind='mergesort')].tolist()
+    return heapq.nlargest(n, xrange(len(column)), key=column.__getitem__)
+
+
+class DimensionColumn(object):
+  """The dictionary encoded values of one dimension.
+
+  Attributes:
+    values: list Each distinct value, in the order first seen.
+    codes: array.array The position in values of the value of each row.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.values = []
+    self.codes = array.array(CODE_TYPECODE)
+    self.index = {}
+
+  def __len__(self):
+    return len(self.codes)
+
+  def __getitem__(self, row_index):
+    return self.values[self.codes[row_index]]
+
+  def Extend(self, values):
+    """Appends the values of more rows to the column.
+
+    Args:
+      values: iterable The value of each row.
+    """
+    index = self.index
+    distinct_values = self.values
+    codes = []
+    for value in values:
+      code = index.get(value)
+      if code is None:
+        code = index[value] = len(distinct_values)
+        distinct_values.append(value)
+      codes.append(code)
+    self.codes.fromlist(codes)
+
+
+def GetTypecode(metric_type):
+  """Returns the array type code used to store a type of metric.
+
+  Args:
+    metric_type: string The metric type reported by the API, such as integer,
+        currency, percent or time.
+
+  Returns:
+    string The array.array type code.
+  """
+  if metric_type == INTEGER_TYPE:
+    return INTEGER_TYPECODE
+  return FLOAT_TYPECODE
+
+
+def _AsNumpy(column):
+  """Returns a numpy.ndarray which shares the memory of an array.array.
+
+  The result must not be kept once the column grows.
+  """
+  if column.typecode == INTEGER_TYPECODE:
+    dtype = numpy.int_
+  else:
+    dtype = numpy.float64
+  if not column:
+    return numpy.zeros(0, dtype=dtype)
+  return numpy.frombuffer(column, dtype=dtype)
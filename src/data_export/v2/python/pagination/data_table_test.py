@@ -0,0 +1,76 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for data_table.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import unittest
+import atom.core
+import data_table
+import feed_parser
+import feed_parser_test
+import gdata.analytics.data
+
+
+class TestDataTable(unittest.TestCase):
+
+  def setUp(self):
+    self.xml = open(feed_parser_test.DATA_FEED_FILE_NAME).read()
+    self.page = feed_parser.ParseDataFeed(cStringIO.StringIO(self.xml))
+
+  def testAddPage(self):
+    table = data_table.GetDataTable([self.page, self.page])
+
+    self.assertEqual(10, len(table))
+    self.assertEqual(['ga:source', 'ga:medium'], table.dimension_names)
+    self.assertEqual(['ga:visits', 'ga:bounces'], table.metric_names)
+    self.assertEqual(('google.com', 'referral', 29666, 14979),
+                     table.GetRow(6))
+
+    medium = table.GetDimension('ga:medium')
+    self.assertEqual(['referral'], medium.values)
+    self.assertEqual([0] * 10, list(medium.codes))
+
+  def testAddGdataPage(self):
+    feed = atom.core.parse(self.xml, gdata.analytics.data.DataFeed)
+    table = data_table.GetDataTable([feed])
+    expected_table = data_table.GetDataTable([self.page])
+
+    self.assertEqual(list(expected_table.GetRows()), list(table.GetRows()))
+
+  def testSum(self):
+    table = data_table.GetDataTable([self.page])
+    self.assertEqual(107579, table.Sum('ga:visits'))
+
+    table = data_table.DataTable()
+    table.SetColumns(['ga:source'], ['ga:avgTimeOnSite'], ['time'])
+    self.assertEqual(0, table.Sum('ga:avgTimeOnSite'))
+
+  def testTopN(self):
+    table = data_table.GetDataTable([self.page])
+    self.assertEqual([0, 1, 3], table.TopN('ga:bounces', 3))
+    self.assertEqual([0, 1, 3, 4, 2], table.TopN('ga:bounces', 10))
+
+  def testGetTypecode(self):
+    self.assertEqual('l', data_table.GetTypecode('integer'))
+    self.assertEqual('d', data_table.GetTypecode('currency'))
+    self.assertEqual('d', data_table.GetTypecode('percent'))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,607 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Exports a query by splitting its date range into shards.
+
+Queries over long date ranges are more likely to be sampled by the API and
+need many pages. The ShardedPaginator splits the start-date and end-date of
+a query into day, week or month shards and paginates the shards
+concurrently. If the results of a shard are sampled, the shard is split in
+half until each part is either not sampled or a single day.
+
+Every shard is first probed for its totals, without its rows, so the
+shards which are sampled can be split before any row is retrieved. The rows
+are then retrieved num_workers shards at a time, each by a background
+thread at most one page ahead of the rows being merged.
+
+The rows of the shards are merged into one stream of pages:
+  - If the query has the ga:date dimension, the rows of each shard are
+    distinct and are merged in the order of the query sort parameter. With
+    no sort, or a sort on ga:date first, the shards are output one after the
+    other and only the pages being retrieved are held in memory. With any
+    other sort, each shard is spooled to a temporary file and the files are
+    merged, holding SPOOL_CHUNK_ROWS rows of each shard in memory.
+  - Otherwise the same row can appear in several shards, so the metrics of
+    those rows are summed. This is refused for metrics which can not be
+    summed, such as ratios, averages and unique visitors. The sums, one row
+    per distinct set of dimension values, are held in memory, and sorted
+    there if the query has a sort.
+
+  ShardedPaginator: Paginates the shards of a query and merges the rows.
+  ShardRun: The rows of one shard, retrieved by a background thread.
+  GetHeader(): Returns the names and types of the columns of a query.
+  MergeRuns(): Merges the sorted rows of several shards.
+  SumRuns(): Sums the metrics of equal rows of several shards.
+  SplitDateRange(): Splits a date range into shards.
+  HalveDateRange(): Splits a date range into two shards.
+  IsAdditiveMetric(): Returns whether the values of a metric can be summed.
+  GetSortKey(): Returns a function to sort rows like the sort parameter.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import collections
+import cPickle
+import datetime
+import functools
+import heapq
+import itertools
+import Queue
+import re
+import tempfile
+import threading
+from multiprocessing import pool
+
+import feed_parser
+import gdata.analytics.client
+import pagination
+
+
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+
+DATE_FORMAT = '%Y-%m-%d'
+
+# The number of rows of a shard read at a time from its spool file.
+SPOOL_CHUNK_ROWS = 100
+DATE_DIMENSION = 'ga:date'
+INTEGER_TYPE = 'integer'
+
+# Metrics whose values can not be summed across date ranges: averages, ratios
+# such as ga:perVisitGoalValue or ga:CPC, and counts of unique visitors.
+_NON_ADDITIVE_METRIC = re.compile(
+    r'^ga:(avg|per)|Rate|Per[A-Z]|^ga:(CPC|CPM|RPC|CTR|ROI|margin)$|'
+    r'^ga:visitors$')
+
+
+class ShardedPaginator(object):
+  """Paginates the date range shards of a query and merges the rows.
+
+  Attributes:
+    DEFAULT_NUM_WORKERS: int The default number of shards paginated at the
+        same time.
+    ROWS_PER_PAGE: int The number of rows in each merged page.
+    num_shards: int The number of shards paginated by the last export,
+        including the shards split because they were sampled.
+    contains_sampled_data: boolean Whether any shard of the last export was
+        still sampled.
+  """
+
+  DEFAULT_NUM_WORKERS = 4
+  ROWS_PER_PAGE = pagination.AutoPaginator.DEFAULT_MAX_RESULTS
+
+  def __init__(self, my_client, my_auth_helper, shard_size=MONTH,
+               num_workers=DEFAULT_NUM_WORKERS, verbose=False, cache=None):
+    """Initializes this class.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The main object to
+          make requests to the API.
+      my_auth_helper: auth.AuthRoutine implementation.
+      shard_size: string The size of each shard. One of DAY, WEEK or MONTH.
+      num_workers: int The number of shards to paginate at the same time.
+      verbose: boolean Whether to print the queries that are being executed.
+      cache: response_cache.ResponseCache (optional) Where to save and reuse
+          the API responses.
+    """
+    self.my_client = my_client
+    self.my_auth_helper = my_auth_helper
+    self.shard_size = shard_size
+    self.num_workers = num_workers
+    self.verbose = verbose
+    self.cache = cache
+    self.num_shards = None
+    self.contains_sampled_data = None
+
+  def GetDataPages(self, query):
+    """Yields the merged rows of every shard of query.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to export. It must
+          have a start-date and an end-date. Any start-index is ignored.
+
+    Yields:
+      feed_parser.DataPage Pages of at most ROWS_PER_PAGE merged rows.
+
+    Raises:
+      AutoPaginatorError if an error occurs with the API request or if the
+      metrics of the query can not be summed across shards.
+    """
+    dimension_names = _SplitNames(query.query.get('dimensions'))
+    merge_by_date = DATE_DIMENSION in dimension_names
+    if not merge_by_date:
+      non_additive = [name for name in _SplitNames(query.query.get('metrics'))
+                      if not IsAdditiveMetric(name)]
+      if non_additive:
+        raise pagination.AutoPaginatorError(msg=(
+            'Without the %s dimension, these metrics can not be summed across '
+            'shards: %s' % (DATE_DIMENSION, ', '.join(non_additive))))
+
+    shards = SplitDateRange(query.query['start-date'],
+                            query.query['end-date'], self.shard_size)
+    num_workers = max(1, self.num_workers)
+    workers = pool.ThreadPool(min(num_workers, len(shards)))
+    try:
+      shard_runs = workers.map(functools.partial(self.GetShardRuns, query),
+                               shards, chunksize=1)
+    finally:
+      workers.close()
+      workers.join()
+
+    runs = [run for runs in shard_runs for run in runs]
+    self.num_shards = len(runs)
+    self.contains_sampled_data = any(run.contains_sampled_data for run in runs)
+
+    runs = [run for run in runs if run.num_rows]
+    if not runs:
+      return
+    header = GetHeader(query, runs[0].header)
+    sort = query.query.get('sort')
+    sort_key = GetSortKey(sort, header.dimension_names, header.metric_names,
+                          header.metric_types)
+    date_order = _GetDateOrder(sort)
+    if date_order < 0:
+      runs.reverse()
+
+    spools = []
+    try:
+      if not merge_by_date:
+        rows = SumRuns((run.GetRows() for run in _StartRuns(runs, num_workers)),
+                       len(header.dimension_names), header.metric_types)
+        if sort_key:
+          rows = sorted(rows, key=sort_key)
+      elif not sort_key or date_order:
+        rows = MergeRuns(run.GetRows()
+                         for run in _StartRuns(runs, num_workers))
+      else:
+        for run in _StartRuns(runs, num_workers):
+          spools.append(_SpoolRows(run.GetRows()))
+        rows = MergeRuns([_ReadSpool(spool) for spool in spools], sort_key)
+
+      rows = iter(rows)
+      while True:
+        page_rows = list(itertools.islice(rows,
+                                          ShardedPaginator.ROWS_PER_PAGE))
+        if not page_rows:
+          break
+        page = feed_parser.DataPage()
+        page.dimension_names = header.dimension_names
+        page.metric_names = header.metric_names
+        page.metric_types = header.metric_types
+        page.contains_sampled_data = self.contains_sampled_data
+        page.entry = page_rows
+        yield page
+    finally:
+      for run in runs:
+        run.Stop()
+      for spool in spools:
+        spool.close()
+
+  def GetShardRuns(self, query, shard):
+    """Probes one shard of query for its totals.
+
+    If the results of the shard are sampled and the shard has more than one
+    day, each half of the shard is probed instead. No rows are retrieved.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to export.
+      shard: tuple The start-date and end-date of the shard.
+
+    Returns:
+      A list of ShardRun, one per shard that was probed, in date order. The
+      pages of each shard are retrieved once it is started.
+    """
+    shard_query = gdata.analytics.client.DataFeedQuery(dict(query.query))
+    shard_query.query['start-date'], shard_query.query['end-date'] = shard
+    shard_query.query.pop('start-index', None)
+
+    # The shards are retrieved num_workers at a time, one page at a time each.
+    paginator = pagination.AutoPaginator(
+        self.my_client, self.my_auth_helper, verbose=self.verbose,
+        num_workers=1, converter=feed_parser.ParseDataFeed, cache=self.cache)
+    header = paginator.Probe(shard_query)
+
+    halves = header.contains_sampled_data and HalveDateRange(*shard)
+    if halves:
+      return [half_run for half in halves
+              for half_run in self.GetShardRuns(query, half)]
+
+    return [ShardRun(paginator, shard_query, header)]
+
+
+class ShardRun(object):
+  """The rows of one shard, whose pages are retrieved by a background thread.
+
+  Nothing is retrieved until the run is started. At most one page is then
+  retrieved ahead of the rows being consumed.
+
+  Attributes:
+    header: feed_parser.DataPage The result of AutoPaginator.Probe for the
+        shard, without rows.
+    num_rows: int The total results of the shard.
+    contains_sampled_data: boolean Whether the results of the shard are
+        sampled.
+  """
+
+  def __init__(self, paginator, query, header):
+    """Initializes this class.
+
+    Args:
+      paginator: pagination.AutoPaginator Retrieves the pages of the shard.
+      query: gdata.analytics.client.DataFeedQuery The query of the shard.
+      header: feed_parser.DataPage The result of paginator.Probe for query.
+    """
+    self.paginator = paginator
+    self.query = query
+    self.header = header
+    self.num_rows = int(header.total_results.text)
+    self.contains_sampled_data = header.contains_sampled_data
+    self.queue = Queue.Queue(maxsize=1)
+    self.stopped = threading.Event()
+    self.thread = None
+
+  def Start(self):
+    """Starts retrieving the pages of the shard, unless already started."""
+    if self.thread:
+      return
+    pages = self.paginator.GetDataPages(self.query, -1, header=self.header)
+    self.thread = threading.Thread(target=self._RetrievePages, args=(pages,))
+    self.thread.daemon = True
+    self.thread.start()
+
+  def GetRows(self):
+    """Yields the rows of every page of the shard, in page order.
+
+    The run is started if it was not already.
+
+    Raises:
+      The error of the retrieval of a page, if any.
+    """
+    self.Start()
+    while True:
+      page, error = self.queue.get()
+      if error:
+        raise error
+      if page is None:
+        return
+      for row in page.entry:
+        yield row
+
+  def Stop(self):
+    """Stops retrieving pages, once the rows are no longer needed."""
+    self.stopped.set()
+
+  def _RetrievePages(self, pages):
+    """Puts each page, then a None page or an error, on the queue."""
+    try:
+      while not self.stopped.is_set():
+        page = next(pages, None)
+        self._Put((page, None))
+        if page is None:
+          return
+    except Exception, error:
+      self._Put((None, error))
+    finally:
+      pages.close()
+
+  def _Put(self, item):
+    """Waits for room on the queue, unless the run is stopped."""
+    while not self.stopped.is_set():
+      try:
+        self.queue.put(item, timeout=0.1)
+        return
+      except Queue.Full:
+        pass
+
+
+def MergeRuns(runs, sort_key=None):
+  """Yields the rows of sorted runs in sort order.
+
+  Args:
+    runs: list of iterables of rows, each sorted.
+    sort_key: function (optional) Returns the sort key of a row. If None, the
+        rows of each run are yielded one run after the other.
+
+  Yields:
+    tuple Each row of every run.
+  """
+  if not sort_key:
+    for run in runs:
+      for row in run:
+        yield row
+    return
+
+  decorated_runs = [((sort_key(row), run_number, row) for row in run)
+                    for run_number, run in enumerate(runs)]
+  for _, _, row in heapq.merge(*decorated_runs):
+    yield row
+
+
+def SumRuns(runs, num_dims, metric_types):
+  """Returns the rows of runs with the metrics of equal rows summed.
+
+  Args:
+    runs: list of iterables of rows The rows to sum.
+    num_dims: int The number of dimension values at the start of each row.
+    metric_types: list The type of each metric reported by the API.
+
+  Returns:
+    A list with one row per distinct set of dimension values, in the order
+    first seen.
+  """
+  converters = [_GetNumberConverter(metric_type)
+                for metric_type in metric_types]
+  sums = collections.OrderedDict()
+  for run in runs:
+    for row in run:
+      dims = row[:num_dims]
+      values = [convert(value)
+                for convert, value in zip(converters, row[num_dims:])]
+      total = sums.get(dims)
+      if total is None:
+        sums[dims] = values
+      else:
+        for i, value in enumerate(values):
+          total[i] += value
+
+  return [dims + tuple(_FormatNumber(value) for value in values)
+          for dims, values in sums.iteritems()]
+
+
+def GetHeader(query, probe):
+  """Returns the names and types of the columns of a query.
+
+  A probe has no rows to take the names from, so the dimensions come from
+  the query and the metrics from the aggregates of the probe.
+
+  Args:
+    query: gdata.analytics.client.DataFeedQuery The query.
+    probe: feed_parser.DataPage The result of AutoPaginator.Probe for query.
+
+  Returns:
+    feed_parser.DataPage A page without rows, with the dimension_names,
+    metric_names and metric_types of the query.
+  """
+  header = feed_parser.DataPage()
+  header.dimension_names = _SplitNames(query.query.get('dimensions'))
+  header.metric_names = [metric.name for metric in probe.aggregates]
+  header.metric_types = [metric.type for metric in probe.aggregates]
+  return header
+
+
+def SplitDateRange(start_date, end_date, shard_size):
+  """Splits a date range into shards.
+
+  Weeks are counted from start_date. Months follow the calendar.
+
+  Args:
+    start_date: string The first day of the range. Format YYYY-MM-DD.
+    end_date: string The last day of the range. Format YYYY-MM-DD.
+    shard_size: string One of DAY, WEEK or MONTH.
+
+  Returns:
+    A list of (start-date, end-date) tuples which cover the range in order.
+
+  Raises:
+    ValueError if the dates or shard_size are invalid.
+  """
+  start = _ParseDate(start_date)
+  end = _ParseDate(end_date)
+  one_day = datetime.timedelta(days=1)
+
+  shards = []
+  while start <= end:
+    if shard_size == DAY:
+      shard_end = start
+    elif shard_size == WEEK:
+      shard_end = start + datetime.timedelta(days=6)
+    elif shard_size == MONTH:
+      next_month = (start.replace(day=28) + datetime.timedelta(days=4))
+      shard_end = next_month.replace(day=1) - one_day
+    else:
+      raise ValueError('Unknown shard size: %s' % shard_size)
+
+    shard_end = min(shard_end, end)
+    shards.append((_FormatDate(start), _FormatDate(shard_end)))
+    start = shard_end + one_day
+  return shards
+
+
+def HalveDateRange(start_date, end_date):
+  """Splits a date range into two shards.
+
+  Args:
+    start_date: string The first day of the range. Format YYYY-MM-DD.
+    end_date: string The last day of the range. Format YYYY-MM-DD.
+
+  Returns:
+    A list with two (start-date, end-date) tuples, or None if the range is a
+    single day.
+  """
+  start = _ParseDate(start_date)
+  end = _ParseDate(end_date)
+  if start >= end:
+    return None
+
+  middle = start + datetime.timedelta(days=(end - start).days // 2)
+  return [(_FormatDate(start), _FormatDate(middle)),
+          (_FormatDate(middle + datetime.timedelta(days=1)), _FormatDate(end))]
+
+
+def IsAdditiveMetric(name):
+  """Returns whether the values of a metric can be summed.
+
+  Ratios, averages and counts of unique visitors can not be summed across
+  rows or date ranges.
+
+  Args:
+    name: string The name of the metric, such as ga:visits.
+
+  Returns:
+    boolean True if the values of the metric can be summed.
+  """
+  return not _NON_ADDITIVE_METRIC.search(name)
+
+
+def GetSortKey(sort, dimension_names, metric_names, metric_types):
+  """Returns a function which returns the sort key of a row.
+
+  Args:
+    sort: string The sort parameter of the query, such as -ga:visits,ga:source.
+    dimension_names: list The names of the dimensions, in column order.
+    metric_names: list The names of the metrics, in column order.
+    metric_types: list The type of each metric reported by the API.
+
+  Returns:
+    A function which takes a row and returns its sort key, or None if sort is
+    empty.
+  """
+  fields = []
+  for field in _SplitNames(sort):
+    descending = field.startswith('-')
+    name = field.lstrip('-')
+    if name in dimension_names:
+      fields.append((dimension_names.index(name), None, descending))
+    else:
+      position = metric_names.index(name)
+      fields.append((len(dimension_names) + position,
+                     _GetNumberConverter(metric_types[position]), descending))
+
+  if not fields:
+    return None
+
+  def SortKey(row):
+    key = []
+    for position, convert, descending in fields:
+      value = row[position]
+      if convert:
+        value = convert(value)
+      if descending:
+        value = _Descending(value)
+      key.append(value)
+    return tuple(key)
+
+  return SortKey
+
+
+class _Descending(object):
+  """Wraps a value so it sorts in descending order."""
+
+  __slots__ = ('value',)
+
+  def __init__(self, value):
+    self.value = value
+
+  def __lt__(self, other):
+    return other.value < self.value
+
+  def __eq__(self, other):
+    return self.value == other.value
+
+
+def _GetNumberConverter(metric_type):
+  """Returns the function converting the values of a metric to numbers."""
+  if metric_type == INTEGER_TYPE:
+    return int
+  return float
+
+
+def _FormatNumber(value):
+  """Returns a summed metric value in the format used by the API."""
+  if isinstance(value, float):
+    return repr(value)
+  return str(value)
+
+
+def _StartRuns(runs, num_runs):
+  """Yields each run, once it and the next runs are started.
+
+  At most num_runs runs are started ahead of the run being consumed, so
+  they are retrieved while it is merged.
+  """
+  for index, run in enumerate(runs):
+    for next_run in runs[index:index + num_runs]:
+      next_run.Start()
+    yield run
+
+
+def _SpoolRows(rows):
+  """Writes rows to a temporary file, which is returned rewound."""
+  spool = tempfile.TemporaryFile()
+  for chunk in iter(lambda: list(itertools.islice(rows, SPOOL_CHUNK_ROWS)),
+                    []):
+    cPickle.dump(chunk, spool, cPickle.HIGHEST_PROTOCOL)
+  spool.seek(0)
+  return spool
+
+
+def _ReadSpool(spool):
+  """Yields the rows written to spool by _SpoolRows, then closes it."""
+  try:
+    while True:
+      try:
+        chunk = cPickle.load(spool)
+      except EOFError:
+        return
+      for row in chunk:
+        yield row
+  finally:
+    spool.close()
+
+
+def _GetDateOrder(sort):
+  """Returns 1 if sort starts with ga:date, -1 with -ga:date, 0 otherwise."""
+  fields = _SplitNames(sort)
+  if fields and fields[0].lstrip('-') == DATE_DIMENSION:
+    return -1 if fields[0].startswith('-') else 1
+  return 0
+
+
+def _SplitNames(names):
+  """Returns the names of a comma separated query parameter."""
+  return [name.strip() for name in (names or '').split(',') if name.strip()]
+
+
+def _ParseDate(date):
+  """Returns a datetime.date from a YYYY-MM-DD string."""
+  return datetime.datetime.strptime(date, DATE_FORMAT).date()
+
+
+def _FormatDate(date):
+  """Returns a YYYY-MM-DD string from a datetime.date."""
+  return date.strftime(DATE_FORMAT)
@@ -0,0 +1,256 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for date_sharding.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import datetime
+import threading
+import time
+import unittest
+import date_sharding
+import feed_parser
+import gdata.analytics.client
+import pagination
+
+
+class FakeShardClient(object):
+  """Returns one row per day and source, sorted by the query sort.
+
+  The visits of each row are the day of the month. Date ranges longer than
+  sampled_days are reported as sampled. Only the probes of each date range
+  are recorded in date_ranges.
+  """
+
+  SOURCES = ('a', 'b')
+
+  def __init__(self, sampled_days=None):
+    self.sampled_days = sampled_days
+    self.date_ranges = []
+    self.in_flight = 0
+    self.max_in_flight = 0
+    self.lock = threading.Lock()
+
+  def GetDataFeed(self, query, converter=None):
+    with self.lock:
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+    try:
+      time.sleep(0.001)
+      return self.GetPage(query)
+    finally:
+      with self.lock:
+        self.in_flight -= 1
+
+  def GetPage(self, query):
+    start = datetime.datetime.strptime(query.query['start-date'], '%Y-%m-%d')
+    end = datetime.datetime.strptime(query.query['end-date'], '%Y-%m-%d')
+    start_index = int(query.query.get('start-index') or 1)
+    max_results = int(query.query['max-results'])
+    if max_results == pagination.AutoPaginator.PROBE_MAX_RESULTS:
+      with self.lock:
+        self.date_ranges.append((query.query['start-date'],
+                                 query.query['end-date']))
+
+    with_date = 'ga:date' in query.query['dimensions']
+    rows = []
+    day = start
+    while day <= end:
+      for source in FakeShardClient.SOURCES:
+        visits = str(day.day)
+        if with_date:
+          rows.append((day.strftime('%Y%m%d'), source, visits))
+        else:
+          rows.append((source, visits))
+      day += datetime.timedelta(days=1)
+
+    if not with_date:
+      sums = {}
+      for source, visits in rows:
+        sums[source] = sums.get(source, 0) + int(visits)
+      rows = [(source, str(visits)) for source, visits in sums.items()]
+    sort_key = date_sharding.GetSortKey(
+        query.query.get('sort'), query.query['dimensions'].split(','),
+        ['ga:visits'], ['integer'])
+    rows.sort(key=sort_key)
+
+    page = feed_parser.DataPage()
+    page.dimension_names = query.query['dimensions'].split(',')
+    page.metric_names = ['ga:visits']
+    page.metric_types = ['integer']
+    page.total_results = feed_parser.TextElement(str(len(rows)))
+    page.aggregates = [feed_parser.Metric(
+        'ga:visits', 'integer', str(sum(int(row[-1]) for row in rows)))]
+    page.contains_sampled_data = bool(
+        self.sampled_days and (end - start).days + 1 > self.sampled_days)
+    page.entry = rows[start_index - 1:start_index - 1 + max_results]
+    return page
+
+
+class BlockingShardClient(FakeShardClient):
+  """Returns the pages after the first of the shard starting on blocked_date
+  only once released is set, or after a few seconds.
+  """
+
+  def __init__(self, blocked_date):
+    FakeShardClient.__init__(self)
+    self.blocked_date = blocked_date
+    self.released = threading.Event()
+    self.blocked_pages = 0
+
+  def GetPage(self, query):
+    start_index = int(query.query.get('start-index') or 1)
+    if (start_index > 1 and
+        query.query['start-date'] == self.blocked_date):
+      self.released.wait(5)
+      with self.lock:
+        self.blocked_pages += 1
+    return FakeShardClient.GetPage(self, query)
+
+
+class TestShardedPaginator(unittest.TestCase):
+
+  def setUp(self):
+    self.max_results = pagination.AutoPaginator.DEFAULT_MAX_RESULTS
+    self.rows_per_page = date_sharding.ShardedPaginator.ROWS_PER_PAGE
+
+  def tearDown(self):
+    pagination.AutoPaginator.DEFAULT_MAX_RESULTS = self.max_results
+    date_sharding.ShardedPaginator.ROWS_PER_PAGE = self.rows_per_page
+
+  def GetQuery(self, dimensions, sort, metrics='ga:visits'):
+    return gdata.analytics.client.DataFeedQuery({
+        'ids': 'ga:1',
+        'start-date': '2010-10-01',
+        'end-date': '2010-11-30',
+        'dimensions': dimensions,
+        'metrics': metrics,
+        'sort': sort})
+
+  def testMergeByDate(self):
+    my_client = FakeShardClient()
+    paginator = date_sharding.ShardedPaginator(my_client, None)
+    query = self.GetQuery('ga:date,ga:source', '-ga:visits,ga:date')
+
+    rows = [row for page in paginator.GetDataPages(query)
+            for row in page.entry]
+    self.assertEqual(2, len(my_client.date_ranges))
+    self.assertEqual(122, len(rows))
+    self.assertEqual(('20101031', 'a', '31'), rows[0])
+    self.assertEqual(('20101130', 'b', '30'), rows[5])
+    self.assertEqual(('20101101', 'b', '1'), rows[-1])
+
+  def testSumWithoutDate(self):
+    my_client = FakeShardClient()
+    paginator = date_sharding.ShardedPaginator(my_client, None,
+                                               shard_size=date_sharding.WEEK)
+    query = self.GetQuery('ga:source', '-ga:source')
+
+    rows = [row for page in paginator.GetDataPages(query)
+            for row in page.entry]
+    self.assertEqual(9, len(my_client.date_ranges))
+    self.assertEqual([('b', '961'), ('a', '961')], rows)
+
+  def testSplitSampledShards(self):
+    my_client = FakeShardClient(sampled_days=10)
+    paginator = date_sharding.ShardedPaginator(my_client, None)
+    query = self.GetQuery('ga:source', 'ga:source')
+
+    rows = [row for page in paginator.GetDataPages(query)
+            for row in page.entry]
+    self.assertEqual([('a', '961'), ('b', '961')], rows)
+    self.assertEqual(8, paginator.num_shards)
+    self.assertFalse(paginator.contains_sampled_data)
+
+  def testRowsAreYieldedBeforeLastShardCompletes(self):
+    pagination.AutoPaginator.DEFAULT_MAX_RESULTS = 20
+    date_sharding.ShardedPaginator.ROWS_PER_PAGE = 10
+    my_client = BlockingShardClient('2010-11-01')
+    paginator = date_sharding.ShardedPaginator(my_client, None)
+    query = self.GetQuery('ga:date,ga:source', 'ga:date')
+
+    pages = paginator.GetDataPages(query)
+    first_page = pages.next()
+    self.assertEqual(0, my_client.blocked_pages)
+    self.assertEqual(('20101001', 'a', '1'), first_page.entry[0])
+
+    my_client.released.set()
+    rows = first_page.entry + [row for page in pages for row in page.entry]
+    self.assertEqual(122, len(rows))
+    self.assertEqual(('20101130', 'b', '30'), rows[-1])
+
+  def testShardsAreRetrievedNumWorkersAtATime(self):
+    pagination.AutoPaginator.DEFAULT_MAX_RESULTS = 20
+    my_client = FakeShardClient()
+    paginator = date_sharding.ShardedPaginator(
+        my_client, None, shard_size=date_sharding.DAY, num_workers=2)
+
+    for sort in ('-ga:date', '-ga:visits,ga:date'):
+      query = self.GetQuery('ga:date,ga:source', sort)
+      rows = [row for page in paginator.GetDataPages(query)
+              for row in page.entry]
+      self.assertEqual(61, paginator.num_shards)
+      self.assertEqual(122, len(rows))
+      self.assertEqual(sorted(rows, key=date_sharding.GetSortKey(
+          sort, ['ga:date', 'ga:source'], ['ga:visits'], ['integer'])), rows)
+    self.assertTrue(my_client.max_in_flight <= 2)
+
+  def testNonAdditiveMetrics(self):
+    paginator = date_sharding.ShardedPaginator(FakeShardClient(), None)
+    query = self.GetQuery('ga:source', '', metrics='ga:visits,ga:bounceRate')
+    self.assertRaises(pagination.AutoPaginatorError,
+                      list, paginator.GetDataPages(query))
+
+  def testSplitDateRange(self):
+    self.assertEqual(
+        [('2010-01-30', '2010-01-31'), ('2010-02-01', '2010-02-28'),
+         ('2010-03-01', '2010-03-02')],
+        date_sharding.SplitDateRange('2010-01-30', '2010-03-02',
+                                     date_sharding.MONTH))
+    self.assertEqual(
+        [('2010-12-30', '2011-01-05'), ('2011-01-06', '2011-01-06')],
+        date_sharding.SplitDateRange('2010-12-30', '2011-01-06',
+                                     date_sharding.WEEK))
+    self.assertEqual(
+        [('2010-01-01', '2010-01-01'), ('2010-01-02', '2010-01-02')],
+        date_sharding.SplitDateRange('2010-01-01', '2010-01-02',
+                                     date_sharding.DAY))
+
+  def testHalveDateRange(self):
+    self.assertEqual([('2010-01-01', '2010-01-02'),
+                      ('2010-01-03', '2010-01-04')],
+                     date_sharding.HalveDateRange('2010-01-01', '2010-01-04'))
+    self.assertEqual(None,
+                     date_sharding.HalveDateRange('2010-01-01', '2010-01-01'))
+
+  def testIsAdditiveMetric(self):
+    self.assertTrue(date_sharding.IsAdditiveMetric('ga:visits'))
+    self.assertTrue(date_sharding.IsAdditiveMetric('ga:timeOnSite'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:avgTimeOnSite'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:visitBounceRate'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:pageviewsPerVisit'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:visitors'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:perVisitGoalValue'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:CPM'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:RPC'))
+    self.assertFalse(date_sharding.IsAdditiveMetric('ga:CTR'))
+    self.assertTrue(date_sharding.IsAdditiveMetric('ga:pageviews'))
+    self.assertTrue(date_sharding.IsAdditiveMetric('ga:adCost'))
+
+
+if __name__ == '__main__':
+  unittest.main()
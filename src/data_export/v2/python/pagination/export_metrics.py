@@ -0,0 +1,392 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measures where the time of an export goes, page by page.
+
+An ExportMetrics object given to an AutoPaginator records, for every page:
+  request_seconds: The time from sending a request to receiving the headers
+      of its response, for the last attempt.
+  parse_seconds: The time spent reading and converting the response body.
+  page_seconds: The total time of the page, with rate limiting and retries.
+  bytes_received and bytes_decoded: The size of the body on the wire, and
+      after decompression.
+  entries and retries.
+
+Pages served from a ResponseCache without a request are counted in
+cache_hits. Only their parse_seconds is recorded, so request_seconds and
+bytes_received measure the network alone. For the other pages of a cached
+export, parse_seconds also includes converting the saved body.
+
+Given to a FeedPrinter, it also records the write_seconds of each page. The
+times are kept in histograms and the rest in counters, which can be dumped
+as JSON or in the Prometheus text format once the export is done.
+
+Usage:
+  my_metrics = export_metrics.ExportMetrics()
+  paginator = pagination.AutoPaginator(my_client, my_auth_helper,
+                                       metrics=my_metrics)
+  printer = feed_printer.GetTsvFilePrinter('my_output.tsv')
+  printer.metrics = my_metrics
+  printer.OutputPages(paginator.GetDataPages(my_query, -1))
+  print my_metrics.ToJson()
+
+  ExportMetrics: Collects the counters and histograms of an export.
+  PageMetrics: The measurements of one page.
+  Histogram: Counts values in fixed buckets.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import bisect
+import json
+import threading
+import time
+
+import response_cache
+
+
+# Upper bounds, in seconds, of the buckets of the time histograms.
+DEFAULT_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                  30, 60)
+
+COUNTERS = ('pages', 'failed_pages', 'cache_hits', 'attempts', 'retries',
+            'entries', 'bytes_received', 'bytes_decoded', 'rows_written')
+HISTOGRAMS = ('request_seconds', 'parse_seconds', 'page_seconds',
+              'write_seconds')
+
+
+class ExportMetrics(object):
+  """Collects the counters and histograms of an export.
+
+  The object can be shared by every worker thread of an AutoPaginator.
+
+  Attributes:
+    counters: dict The value of each name in COUNTERS.
+    histograms: dict The Histogram of each name in HISTOGRAMS.
+  """
+
+  def __init__(self, bounds=DEFAULT_BOUNDS, on_page=None, clock=time.time):
+    """Initializes this class.
+
+    Args:
+      bounds: list of floats The upper bounds of the histogram buckets.
+      on_page: function (optional) Called with the PageMetrics of each page
+          once it has been retrieved or has failed.
+      clock: function Returns the current time in seconds.
+    """
+    self.on_page = on_page
+    self.clock = clock
+    self.lock = threading.Lock()
+    self.counters = dict((name, 0) for name in COUNTERS)
+    self.histograms = dict((name, Histogram(bounds)) for name in HISTOGRAMS)
+
+  def StartPage(self, query):
+    """Returns a new PageMetrics to measure the retrieval of a page.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query of the page.
+
+    Returns:
+      PageMetrics The measurements of the page, recorded once its Finish
+      method is called.
+    """
+    return PageMetrics(self, query)
+
+  def RecordPage(self, page_metrics):
+    """Adds the measurements of a finished page."""
+    with self.lock:
+      if page_metrics.error:
+        self.counters['failed_pages'] += 1
+      else:
+        self.counters['pages'] += 1
+        if page_metrics.cache_hit:
+          self.counters['cache_hits'] += 1
+        else:
+          self.histograms['request_seconds'].Add(page_metrics.request_seconds)
+        self.histograms['parse_seconds'].Add(page_metrics.parse_seconds)
+      self.counters['attempts'] += page_metrics.attempts
+      self.counters['retries'] += max(0, page_metrics.attempts - 1)
+      self.counters['entries'] += page_metrics.entries
+      self.counters['bytes_received'] += page_metrics.bytes_received
+      self.counters['bytes_decoded'] += page_metrics.bytes_decoded
+      self.histograms['page_seconds'].Add(page_metrics.page_seconds)
+
+    if self.on_page:
+      self.on_page(page_metrics)
+
+  def RecordWrite(self, seconds, rows):
+    """Adds the time taken to write the rows of a page.
+
+    Args:
+      seconds: float The time taken to write the rows.
+      rows: int The number of rows written.
+    """
+    with self.lock:
+      self.counters['rows_written'] += rows
+      self.histograms['write_seconds'].Add(seconds)
+
+  def GetSummary(self):
+    """Returns the counters and histograms as a dict of plain values."""
+    with self.lock:
+      return {
+          'counters': dict(self.counters),
+          'histograms': dict((name, histogram.GetSummary())
+                             for name, histogram
+                             in self.histograms.iteritems())}
+
+  def ToJson(self):
+    """Returns the counters and histograms as a JSON object."""
+    return json.dumps(self.GetSummary(), sort_keys=True, indent=2)
+
+  def ToPrometheus(self, prefix='ga_export'):
+    """Returns the counters and histograms in the Prometheus text format.
+
+    Args:
+      prefix: string The prefix of every metric name.
+
+    Returns:
+      string One sample per line.
+    """
+    lines = []
+    with self.lock:
+      for name in COUNTERS:
+        metric = '%s_%s_total' % (prefix, name)
+        lines.append('# TYPE %s counter' % metric)
+        lines.append('%s %d' % (metric, self.counters[name]))
+
+      for name in HISTOGRAMS:
+        histogram = self.histograms[name]
+        metric = '%s_%s' % (prefix, name)
+        lines.append('# TYPE %s histogram' % metric)
+        for bound, count in histogram.GetCumulativeCounts():
+          lines.append('%s_bucket{le="%s"} %d' % (metric, _FormatBound(bound),
+                                                  count))
+        lines.append('%s_sum %r' % (metric, histogram.sum))
+        lines.append('%s_count %d' % (metric, histogram.count))
+    return '\n'.join(lines) + '\n'
+
+
+class PageMetrics(object):
+  """The measurements of the retrieval of one page.
+
+  Attributes:
+    query: gdata.analytics.client.DataFeedQuery The query of the page.
+    attempts: int The number of requests made for the page.
+    request_seconds: float The time until the headers of the last response.
+    parse_seconds: float The time taken to read and convert the last response.
+    page_seconds: float The total time taken to retrieve the page.
+    bytes_received: int The body bytes received, as sent by the server.
+    bytes_decoded: int The body bytes after decompression.
+    entries: int The number of entries of the page.
+    cache_hit: boolean Whether the page was served from a ResponseCache
+        without a request.
+    error: Exception The error of the page, or None if it was retrieved.
+  """
+
+  def __init__(self, export_metrics, query):
+    """Initializes this class."""
+    self.export_metrics = export_metrics
+    self.query = query
+    self.attempts = 0
+    self.request_seconds = 0.0
+    self.parse_seconds = 0.0
+    self.page_seconds = 0.0
+    self.bytes_received = 0
+    self.bytes_decoded = 0
+    self.entries = 0
+    self.cache_hit = False
+    self.error = None
+    self.start = export_metrics.clock()
+
+  def StartAttempt(self, my_client, converter=None):
+    """Counts a request and returns a converter which measures its response.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The client making the
+          request. Used to parse the response if converter is not set.
+      converter: function (optional) Converts the response instead of the
+          gdata library, such as feed_parser.ParseDataFeed.
+
+    Returns:
+      function A converter to pass to the GetDataFeed method of the client.
+    """
+    clock = self.export_metrics.clock
+    self.attempts += 1
+    start = clock()
+
+    def MeasuredConverter(response):
+      """Converts response, timing it and counting its bytes."""
+      received = clock()
+      counted = _CountingResponse(response)
+      if converter:
+        result = converter(counted)
+      else:
+        result = response_cache.ParseResponseBody(my_client, counted.read())
+      self.request_seconds = received - start
+      self.parse_seconds = clock() - received
+      self.bytes_decoded = counted.bytes_read
+      self.bytes_received = getattr(response, 'bytes_received',
+                                    counted.bytes_read)
+      return result
+
+    return MeasuredConverter
+
+  def StartParse(self, my_client, converter=None, cache_hit=False):
+    """Returns a converter which measures the parse of a saved response body.
+
+    Used by a ResponseCache, whose responses are read by the converter of
+    StartAttempt and converted afterwards. The time taken is added to
+    parse_seconds.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The client whose API
+          version is used to parse the body if converter is not set.
+      converter: function (optional) Converts the response instead of the
+          gdata library, such as feed_parser.ParseDataFeed.
+      cache_hit: boolean Whether the body is served without a request.
+
+    Returns:
+      function A converter to pass to response_cache.ParseResponseBody.
+    """
+    clock = self.export_metrics.clock
+    if cache_hit:
+      self.cache_hit = True
+
+    def MeasuredConverter(response):
+      """Converts response, timing it."""
+      start = clock()
+      if converter:
+        result = converter(response)
+      else:
+        result = response_cache.ParseResponseBody(my_client, response.read())
+      self.parse_seconds += clock() - start
+      return result
+
+    return MeasuredConverter
+
+  def Finish(self, feed=None, error=None):
+    """Records the page in its ExportMetrics.
+
+    Args:
+      feed: The retrieved page, if it was retrieved.
+      error: Exception The error of the page, if it failed.
+    """
+    self.page_seconds = self.export_metrics.clock() - self.start
+    self.error = error
+    if feed is not None and feed.entry:
+      self.entries = len(feed.entry)
+    self.export_metrics.RecordPage(self)
+
+
+class Histogram(object):
+  """Counts values in buckets with fixed upper bounds.
+
+  Attributes:
+    bounds: tuple The upper bound of each bucket, in increasing order. Values
+        above the last bound are counted in an extra bucket.
+    counts: list The number of values in each bucket.
+    count: int The number of values.
+    sum: float The sum of the values.
+    max: float The largest value, or None if there are none.
+  """
+
+  def __init__(self, bounds=DEFAULT_BOUNDS):
+    """Initializes this class."""
+    self.bounds = tuple(bounds)
+    self.counts = [0] * (len(self.bounds) + 1)
+    self.count = 0
+    self.sum = 0.0
+    self.max = None
+
+  def Add(self, value):
+    """Counts a value."""
+    self.counts[bisect.bisect_left(self.bounds, value)] += 1
+    self.count += 1
+    self.sum += value
+    self.max = value if self.max is None else max(self.max, value)
+
+  def GetCumulativeCounts(self):
+    """Returns a list of (bound, count) tuples, like Prometheus buckets.
+
+    Each count is the number of values at most bound. The last bound is
+    float('inf').
+    """
+    cumulative = []
+    total = 0
+    for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+      total += count
+      cumulative.append((bound, total))
+    return cumulative
+
+  def GetPercentile(self, percent):
+    """Returns an upper bound of a percentile of the values.
+
+    Args:
+      percent: float The percentile, from 0 to 100.
+
+    Returns:
+      float The bound of the bucket holding the percentile, or the largest
+      value if it is above every bound. None if there are no values.
+    """
+    if not self.count:
+      return None
+    rank = percent / 100.0 * self.count
+    for bound, count in self.GetCumulativeCounts():
+      if count >= rank:
+        return min(bound, self.max)
+    return self.max
+
+  def GetSummary(self):
+    """Returns the histogram as a dict of plain values."""
+    return {
+        'count': self.count,
+        'sum': self.sum,
+        'mean': self.sum / self.count if self.count else None,
+        'max': self.max,
+        'p50': self.GetPercentile(50),
+        'p95': self.GetPercentile(95),
+        'p99': self.GetPercentile(99),
+        'buckets': [[_FormatBound(bound), count]
+                    for bound, count in self.GetCumulativeCounts()]}
+
+
+class _CountingResponse(object):
+  """Counts the bytes read from a response."""
+
+  def __init__(self, response):
+    """Initializes this class."""
+    self.response = response
+    self.bytes_read = 0
+
+  def read(self, amt=None):
+    """Reads from the response and counts the bytes read."""
+    if amt is None:
+      data = self.response.read()
+    else:
+      data = self.response.read(amt)
+    self.bytes_read += len(data)
+    return data
+
+  def __getattr__(self, name):
+    return getattr(self.response, name)
+
+
+def _FormatBound(bound):
+  """Returns the text of a bucket bound, +Inf for the last one."""
+  if bound == float('inf'):
+    return '+Inf'
+  return repr(bound)
@@ -0,0 +1,204 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for export_metrics.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import json
+import shutil
+import tempfile
+import unittest
+import export_metrics
+import feed_parser
+import feed_printer
+import gdata.analytics.client
+import mock_api_server
+import pagination
+import request_scheduler
+import response_cache
+
+
+def GetQuery():
+  """Returns a data feed query for the source of ga:1."""
+  return gdata.analytics.client.DataFeedQuery({
+      'ids': 'ga:1',
+      'dimensions': 'ga:source',
+      'metrics': 'ga:visits',
+      'start-date': '2011-01-01',
+      'end-date': '2011-01-31'})
+
+
+class TestHistogram(unittest.TestCase):
+
+  def testAdd(self):
+    histogram = export_metrics.Histogram([1, 2, 5])
+    for value in [0.5, 1, 1.5, 3, 3, 7]:
+      histogram.Add(value)
+
+    self.assertEqual([2, 1, 2, 1], histogram.counts)
+    self.assertEqual(6, histogram.count)
+    self.assertEqual(16, histogram.sum)
+    self.assertEqual(7, histogram.max)
+    self.assertEqual([(1, 2), (2, 3), (5, 5), (float('inf'), 6)],
+                     histogram.GetCumulativeCounts())
+
+  def testGetPercentile(self):
+    histogram = export_metrics.Histogram([1, 2, 5])
+    self.assertEqual(None, histogram.GetPercentile(50))
+
+    for value in [0.5, 1, 1.5, 3, 3, 7]:
+      histogram.Add(value)
+    self.assertEqual(1, histogram.GetPercentile(30))
+    self.assertEqual(2, histogram.GetPercentile(50))
+    self.assertEqual(7, histogram.GetPercentile(99))
+
+
+class TestExportMetrics(unittest.TestCase):
+
+  def setUp(self):
+    self.server = mock_api_server.MockApiServer(total_results=25000, seed=1)
+    self.server.Start()
+    self.my_client = self.server.GetClient()
+    self.pages = []
+    self.metrics = export_metrics.ExportMetrics(on_page=self.pages.append)
+
+  def tearDown(self):
+    self.my_client.http_client.Close()
+    self.server.Stop()
+
+  def testPages(self):
+    paginator = pagination.AutoPaginator(
+        self.my_client, None, num_workers=2,
+        converter=feed_parser.ParseDataFeed, metrics=self.metrics)
+    paginator.GetDataFeed(GetQuery(), -1)
+
+    counters = self.metrics.counters
+    self.assertEqual(3, counters['pages'])
+    self.assertEqual(3, counters['attempts'])
+    self.assertEqual(0, counters['retries'])
+    self.assertEqual(25000, counters['entries'])
+    self.assertEqual(self.my_client.http_client.bytes_received,
+                     counters['bytes_received'])
+    self.assertEqual(self.my_client.http_client.bytes_decoded,
+                     counters['bytes_decoded'])
+    self.assertEqual(3, self.metrics.histograms['request_seconds'].count)
+    self.assertEqual(3, self.metrics.histograms['parse_seconds'].count)
+    self.assertEqual([10000, 10000, 5000],
+                     sorted([page.entries for page in self.pages],
+                            reverse=True))
+
+  def testCachedPages(self):
+    cache_dir = tempfile.mkdtemp()
+    try:
+      cache = response_cache.ResponseCache(cache_dir)
+      for _ in range(2):
+        paginator = pagination.AutoPaginator(
+            self.my_client, None, converter=feed_parser.ParseDataFeed,
+            metrics=self.metrics, cache=cache)
+        paginator.GetDataFeed(GetQuery(), -1)
+    finally:
+      shutil.rmtree(cache_dir)
+
+    counters = self.metrics.counters
+    self.assertEqual(6, counters['pages'])
+    self.assertEqual(3, counters['cache_hits'])
+    self.assertEqual(3, counters['attempts'])
+    self.assertEqual(50000, counters['entries'])
+    self.assertEqual(self.my_client.http_client.bytes_received,
+                     counters['bytes_received'])
+    self.assertEqual(self.my_client.http_client.bytes_decoded,
+                     counters['bytes_decoded'])
+    self.assertEqual(3, self.metrics.histograms['request_seconds'].count)
+    self.assertEqual(6, self.metrics.histograms['parse_seconds'].count)
+    self.assertEqual([True] * 3,
+                     [page.cache_hit for page in self.pages[3:]])
+
+  def testDefaultConverter(self):
+    self.server.total_results = 20
+    paginator = pagination.AutoPaginator(self.my_client, None,
+                                         metrics=self.metrics)
+    feed = paginator.GetDataFeed(GetQuery(), -1)
+
+    self.assertEqual(20, len(feed.entry))
+    self.assertEqual(20, self.metrics.counters['entries'])
+    self.assertTrue(self.metrics.counters['bytes_decoded'] > 0)
+
+  def testRetries(self):
+    self.server.error_rate = 0.5
+    scheduler = request_scheduler.RequestScheduler(
+        requests_per_second=None, requests_per_profile_per_second=None,
+        requests_per_day=None, max_retries=20, base_delay=0)
+    paginator = pagination.AutoPaginator(
+        self.my_client, None, converter=feed_parser.ParseDataFeed,
+        scheduler=scheduler, metrics=self.metrics)
+    paginator.GetDataFeed(GetQuery(), -1)
+
+    counters = self.metrics.counters
+    self.assertEqual(3, counters['pages'])
+    self.assertEqual(self.server.errors, counters['retries'])
+    self.assertEqual(self.server.requests, counters['attempts'])
+
+  def testFailedPage(self):
+    self.server.error_rate = 1
+    paginator = pagination.AutoPaginator(self.my_client, None,
+                                         metrics=self.metrics)
+
+    self.assertRaises(pagination.AutoPaginatorError,
+                      paginator.GetDataFeed, GetQuery(), -1)
+    self.assertEqual(0, self.metrics.counters['pages'])
+    self.assertEqual(1, self.metrics.counters['failed_pages'])
+    self.assertTrue(self.pages[0].error)
+
+  def testFeedPrinter(self):
+    paginator = pagination.AutoPaginator(
+        self.my_client, None, converter=feed_parser.ParseDataFeed,
+        metrics=self.metrics)
+    output = cStringIO.StringIO()
+    printer = feed_printer.FeedPrinter(feed_printer.UnicodeWriter(output),
+                                       metrics=self.metrics)
+    printer.OutputPages(paginator.GetDataPages(GetQuery(), -1))
+
+    self.assertEqual(25000, self.metrics.counters['rows_written'])
+    self.assertEqual(3, self.metrics.histograms['write_seconds'].count)
+
+  def testToJson(self):
+    self.server.total_results = 20
+    paginator = pagination.AutoPaginator(self.my_client, None,
+                                         metrics=self.metrics)
+    paginator.GetDataFeed(GetQuery(), -1)
+    summary = json.loads(self.metrics.ToJson())
+
+    self.assertEqual(1, summary['counters']['pages'])
+    self.assertEqual(1, summary['histograms']['page_seconds']['count'])
+    self.assertEqual(['+Inf', 1],
+                     summary['histograms']['page_seconds']['buckets'][-1])
+
+  def testToPrometheus(self):
+    self.metrics.RecordWrite(0.2, 10)
+    lines = self.metrics.ToPrometheus().splitlines()
+
+    self.assertTrue('ga_export_rows_written_total 10' in lines)
+    self.assertTrue('# TYPE ga_export_write_seconds histogram' in lines)
+    self.assertTrue('ga_export_write_seconds_bucket{le="0.1"} 0' in lines)
+    self.assertTrue('ga_export_write_seconds_bucket{le="0.25"} 1' in lines)
+    self.assertTrue('ga_export_write_seconds_bucket{le="+Inf"} 1' in lines)
+    self.assertTrue('ga_export_write_seconds_count 1' in lines)
+
+
+if __name__ == '__main__':
+  unittest.main()
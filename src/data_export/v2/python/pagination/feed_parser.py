@@ -0,0 +1,284 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Fast streaming parser for the Data Export API Data Feed.
+
+The gdata library turns every entry of a Data Feed response into a tree of
+XML element objects. This module reads the response incrementally with
+expat and only keeps the values of the dxp:dimension and dxp:metric elements
+of each entry, along with the feed elements needed to paginate.
+
+Each row is a plain tuple and the column names are kept once per page.
+Dimension values repeat across rows, such as referral for ga:medium, so
+each distinct value is stored once and shared by every row with it. This
+makes a row about 50 times smaller than a gdata entry.
+
+To use it, pass ParseDataFeed as the converter of a client request:
+  page = my_client.GetDataFeed(query, converter=feed_parser.ParseDataFeed)
+
+  ParseDataFeed(): Parses a Data Feed response into a DataPage.
+  ParseDataFeedHeader(): Parses only the feed elements of a response.
+  InterningConverter: Parses responses sharing dimension values across pages.
+  DataFeedParser: Incremental parser for the Data Feed.
+  DataPage: The values of one page of the Data Feed.
+  Metric: The name, type and value of an aggregate metric.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import collections
+from xml.parsers import expat
+
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+DXP_NS = 'http://schemas.google.com/analytics/2009'
+OPEN_SEARCH_NS = 'http://a9.com/-/spec/opensearch/1.1/'
+GD_NS = 'http://schemas.google.com/g/2005'
+
+# Element names as reported by expat, with a space between the namespace and
+# the local name.
+_FEED = ATOM_NS + ' feed'
+_ENTRY = ATOM_NS + ' entry'
+_DIMENSION = DXP_NS + ' dimension'
+_METRIC = DXP_NS + ' metric'
+_AGGREGATES = DXP_NS + ' aggregates'
+_CONTAINS_SAMPLED_DATA = DXP_NS + ' containsSampledData'
+_TOTAL_RESULTS = OPEN_SEARCH_NS + ' totalResults'
+_START_INDEX = OPEN_SEARCH_NS + ' startIndex'
+_ITEMS_PER_PAGE = OPEN_SEARCH_NS + ' itemsPerPage'
+_ETAG = GD_NS + ' etag'
+
+_TEXT_ELEMENTS = frozenset([_CONTAINS_SAMPLED_DATA, _TOTAL_RESULTS,
+                            _START_INDEX, _ITEMS_PER_PAGE])
+
+READ_SIZE = 64 * 1024
+
+Metric = collections.namedtuple('Metric', 'name type value')
+
+# Mirrors the text elements of gdata.analytics.data.DataFeed, such as
+# feed.total_results.text, so a DataPage can be paginated like a DataFeed.
+TextElement = collections.namedtuple('TextElement', 'text')
+
+
+def ParseDataFeed(response, values=None):
+  """Parses a Data Feed response into a DataPage.
+
+  Args:
+    response: A file like object with the XML of a Data Feed, usually the
+        HTTP response of the API request.
+    values: dict (optional) The table of distinct dimension values, shared
+        with the parsers of other pages.
+
+  Returns:
+    DataPage The values in the response.
+  """
+  parser = DataFeedParser(values=values)
+  while True:
+    data = response.read(READ_SIZE)
+    if not data:
+      break
+    parser.Feed(data)
+  return parser.Close()
+
+
+def ParseDataFeedHeader(response):
+  """Parses only the feed elements of a Data Feed response.
+
+  The entries are skipped, so the page has the total results, aggregates
+  and sampling of the query but no rows.
+
+  Args:
+    response: A file like object with the XML of a Data Feed.
+
+  Returns:
+    DataPage The feed elements of the response, with an empty entry list.
+  """
+  parser = DataFeedParser(header_only=True)
+  while True:
+    data = response.read(READ_SIZE)
+    if not data:
+      break
+    parser.Feed(data)
+  return parser.Close()
+
+
+class InterningConverter(object):
+  """Parses Data Feed responses, sharing dimension values across pages.
+
+  By default each page has its own table of distinct dimension values, which
+  is dropped with the page. When every page is kept, as by
+  AutoPaginator.GetDataFeed, a converter shared by the pages also stores a
+  value seen on several pages only once. The table is never emptied, so it
+  should not be used to stream the pages of a large export.
+
+  Usage:
+    paginator = pagination.AutoPaginator(
+        my_client, my_auth_helper,
+        converter=feed_parser.InterningConverter())
+
+  Attributes:
+    values: dict The distinct dimension values of every page parsed.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.values = {}
+
+  def __call__(self, response):
+    """Parses a Data Feed response into a DataPage."""
+    return ParseDataFeed(response, values=self.values)
+
+
+class DataFeedParser(object):
+  """Incremental parser for the Data Feed.
+
+  Data can be fed as it is received. Only the values of the elements in
+  DataPage are kept in memory, and each distinct dimension value only once.
+  """
+
+  def __init__(self, header_only=False, values=None):
+    """Initializes this class.
+
+    Args:
+      header_only: boolean Whether to skip the entries of the feed.
+      values: dict (optional) The table of distinct dimension values. Defaults
+          to a new table for this page.
+    """
+    self.page = DataPage()
+    self.header_only = header_only
+    self.values = {} if values is None else values
+    self.in_aggregates = False
+    self.text = None
+    self.dimensions = None
+    self.metrics = None
+
+    self.parser = expat.ParserCreate(namespace_separator=' ')
+    self.parser.buffer_text = True
+    self.parser.StartElementHandler = self._StartElement
+    self.parser.EndElementHandler = self._EndElement
+
+  def Feed(self, data):
+    """Parses the next chunk of the response.
+
+    Args:
+      data: str The next bytes of the XML response.
+    """
+    self.parser.Parse(data, False)
+
+  def Close(self):
+    """Finishes parsing the response.
+
+    Returns:
+      DataPage The values in the response.
+    """
+    self.parser.Parse('', True)
+    return self.page
+
+  def _StartElement(self, name, attrs):
+    """Stores the values of the dimension and metric elements."""
+    if self.dimensions is not None:
+      if name == _DIMENSION:
+        value = attrs['value']
+        # setdefault is atomic, so parsers in several threads can share
+        # the table.
+        self.dimensions.append(self.values.setdefault(value, value))
+        if not self.page.entry:
+          self.page.dimension_names.append(attrs['name'])
+      elif name == _METRIC:
+        self.metrics.append(attrs['value'])
+        if not self.page.entry:
+          self.page.metric_names.append(attrs['name'])
+          self.page.metric_types.append(attrs.get('type'))
+
+    elif name == _ENTRY:
+      if self.header_only:
+        return
+      self.dimensions = []
+      self.metrics = []
+    elif name == _METRIC and self.in_aggregates:
+      self.page.aggregates.append(
+          Metric(attrs['name'], attrs.get('type'), attrs['value']))
+    elif name in _TEXT_ELEMENTS:
+      # Text is only collected for a few elements, so the handler is only
+      # set while inside one of them.
+      self.text = []
+      self.parser.CharacterDataHandler = self.text.append
+    elif name == _AGGREGATES:
+      self.in_aggregates = True
+    elif name == _FEED:
+      self.page.etag = attrs.get(_ETAG)
+
+  def _EndElement(self, name):
+    """Stores each row and the text of the feed elements."""
+    if name == _ENTRY:
+      if self.header_only:
+        return
+      self.page.entry.append(tuple(self.dimensions + self.metrics))
+      self.dimensions = None
+      self.metrics = None
+    elif self.text is not None:
+      text = ''.join(self.text).strip()
+      self.text = None
+      self.parser.CharacterDataHandler = None
+      if name == _TOTAL_RESULTS:
+        self.page.total_results = TextElement(text)
+      elif name == _START_INDEX:
+        self.page.start_index = int(text)
+      elif name == _ITEMS_PER_PAGE:
+        self.page.items_per_page = int(text)
+      elif name == _CONTAINS_SAMPLED_DATA:
+        self.page.contains_sampled_data = text == 'true'
+    elif name == _AGGREGATES:
+      self.in_aggregates = False
+
+
+class DataPage(object):
+  """The values of one page of the Data Feed.
+
+  The attribute names match gdata.analytics.data.DataFeed where they can, so
+  AutoPaginator and FeedPrinter accept either object.
+
+  Attributes:
+    etag: string The gd:etag of the feed.
+    total_results: TextElement The openSearch:totalResults of the feed.
+    start_index: int The openSearch:startIndex of the feed.
+    items_per_page: int The openSearch:itemsPerPage of the feed.
+    contains_sampled_data: boolean Whether the results are sampled.
+    aggregates: list of Metric The totals of each metric for the whole query.
+    dimension_names: list The names of the dimensions, in column order.
+    metric_names: list The names of the metrics, in column order.
+    metric_types: list The type of each metric, such as integer or currency.
+    entry: list One tuple of values per row, with the dimension values
+        followed by the metric values.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.etag = None
+    self.total_results = None
+    self.start_index = None
+    self.items_per_page = None
+    self.contains_sampled_data = False
+    self.aggregates = []
+    self.dimension_names = []
+    self.metric_names = []
+    self.metric_types = []
+    self.entry = []
+
+  def GetHeaders(self):
+    """Returns the names of the dimensions followed by the metrics."""
+    return self.dimension_names + self.metric_names
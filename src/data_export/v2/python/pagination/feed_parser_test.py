@@ -0,0 +1,108 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for feed_parser.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import os
+import unittest
+import atom.core
+import feed_parser
+import feed_printer
+import gdata.analytics.data
+
+
+DATA_FEED_FILE_NAME = os.path.join(os.path.dirname(__file__), '..', '..',
+                                   '..', '..', 'v2', 'dataFeedResponse.xml')
+
+
+class TestDataFeedParser(unittest.TestCase):
+
+  def setUp(self):
+    self.xml = open(DATA_FEED_FILE_NAME).read()
+
+  def testParseDataFeed(self):
+    page = feed_parser.ParseDataFeed(cStringIO.StringIO(self.xml))
+
+    self.assertEqual('6451', page.total_results.text)
+    self.assertEqual(1, page.start_index)
+    self.assertEqual(5, page.items_per_page)
+    self.assertFalse(page.contains_sampled_data)
+    self.assertEqual('W/"DUINSHcycSp7I2A9WxRWFEQ."', page.etag)
+    self.assertEqual(
+        [feed_parser.Metric('ga:visits', 'integer', '136540'),
+         feed_parser.Metric('ga:bounces', 'integer', '101535')],
+        page.aggregates)
+    self.assertEqual(['ga:source', 'ga:medium', 'ga:visits', 'ga:bounces'],
+                     page.GetHeaders())
+    self.assertEqual(['integer', 'integer'], page.metric_types)
+    self.assertEqual(5, len(page.entry))
+    self.assertEqual(('blogger.com', 'referral', '68140', '61095'),
+                     page.entry[0])
+
+  def testParseDataFeedInChunks(self):
+    parser = feed_parser.DataFeedParser()
+    for i in range(0, len(self.xml), 7):
+      parser.Feed(self.xml[i:i + 7])
+    page = parser.Close()
+
+    self.assertEqual('6451', page.total_results.text)
+    self.assertEqual(5, len(page.entry))
+
+  def testParseDataFeedHeader(self):
+    page = feed_parser.ParseDataFeedHeader(cStringIO.StringIO(self.xml))
+
+    self.assertEqual('6451', page.total_results.text)
+    self.assertFalse(page.contains_sampled_data)
+    self.assertEqual(
+        [feed_parser.Metric('ga:visits', 'integer', '136540'),
+         feed_parser.Metric('ga:bounces', 'integer', '101535')],
+        page.aggregates)
+    self.assertEqual([], page.entry)
+    self.assertEqual([], page.GetHeaders())
+
+  def testDimensionValuesAreShared(self):
+    page = feed_parser.ParseDataFeed(cStringIO.StringIO(self.xml))
+    mediums = [row[1] for row in page.entry if row[1] == 'referral']
+
+    self.assertTrue(len(mediums) > 1)
+    self.assertTrue(all(medium is mediums[0] for medium in mediums))
+
+  def testInterningConverter(self):
+    converter = feed_parser.InterningConverter()
+    first_page = converter(cStringIO.StringIO(self.xml))
+    second_page = converter(cStringIO.StringIO(self.xml))
+
+    self.assertEqual(first_page.entry, second_page.entry)
+    self.assertTrue(first_page.entry[0][0] is second_page.entry[0][0])
+    self.assertFalse(
+        feed_parser.ParseDataFeed(cStringIO.StringIO(self.xml)).entry[0][0]
+        is first_page.entry[0][0])
+
+  def testMatchesGdataFeed(self):
+    page = feed_parser.ParseDataFeed(cStringIO.StringIO(self.xml))
+    feed = atom.core.parse(self.xml, gdata.analytics.data.DataFeed)
+
+    self.assertEqual(feed_printer.GetHeaders(feed.entry[0]),
+                     page.GetHeaders())
+    self.assertEqual([tuple(feed_printer.GetRow(entry))
+                      for entry in feed.entry], page.entry)
+
+
+if __name__ == '__main__':
+  unittest.main()
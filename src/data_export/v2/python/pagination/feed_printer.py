@@ -14,15 +14,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-"""Utility to convert a Data Export API feed into TSV.
+"""Utility to convert a Data Export API feed into TSV and other formats.
 
 This provides utitlites to both print TSV files to the standard output
-as well as directly to a file.
+as well as directly to a file. The FeedPrinter writes to a Sink, so the same
+pages can also be written as JSON Lines or gzipped TSV. See columnar_file
+for a compact binary sink.
 
   GetTsvFilePrinter: Returns an instantiated object to output to files.
   GetTsvScreenPrinter: Returns an instantiated object to output to the screen.
+  GetGzipTsvFilePrinter: Returns an object to output to gzipped files.
+  GetJsonLinesFilePrinter: Returns an object to output to JSON Lines files.
   UnicodeWriter(): Utf-8 encodes output.
   FeedPrinter(): Converts the Data Export API response into tabular data.
+  Sink: Interface of the destinations of a FeedPrinter.
+  TsvSink: Writes rows through a UnicodeWriter.
+  GzipTsvSink: Writes rows to a gzipped TSV file.
+  JsonLinesSink: Writes each row as a JSON object.
+  GetHeaders(): Returns the column names of a Data Feed entry.
+  GetRow(): Returns the column values of a Data Feed entry.
 """
 
 __author__ = 'api.nickm@google.com (Nick Mihailovski)'
@@ -31,7 +41,14 @@ __author__ = 'api.nickm@google.com (Nick Mihailovski)'
 import codecs
 import cStringIO
 import csv
+import gzip
+import itertools
+import json
+import re
 import sys
+import time
+
+import feed_parser
 
 
 def GetTsvFilePrinter(file_name):
@@ -45,7 +62,7 @@ def GetTsvFilePrinter(file_name):
   """
   my_handle = open(file_name, 'wb')
   writer = UnicodeWriter(my_handle, dialect='excel-tab')
-  return FeedPrinter(writer)
+  return FeedPrinter(TsvSink(writer, owns_stream=True))
 
 
 def GetTsvScreenPrinter():
@@ -54,14 +71,44 @@ def GetTsvScreenPrinter():
   return FeedPrinter(writer)
 
 
+def GetGzipTsvFilePrinter(file_name):
+  """Returns a Feed Printer object to output gzipped TSV to file_name.
+
+  Args:
+    file_name: string The name of the file to output to.
+
+  Returns:
+    The newly created FeedPrinter object.
+  """
+  return FeedPrinter(GzipTsvSink(file_name))
+
+
+def GetJsonLinesFilePrinter(file_name):
+  """Returns a Feed Printer object to output JSON Lines to file_name.
+
+  Args:
+    file_name: string The name of the file to output to.
+
+  Returns:
+    The newly created FeedPrinter object.
+  """
+  return FeedPrinter(JsonLinesSink(open(file_name, 'wb'), owns_stream=True))
+
+
 # Wrapper to output to utf-8. Taken mostly / directly from Python docs:
 # http://docs.python.org/library/csv.html
 class UnicodeWriter(object):
   """A CSV writer which uses the csv module to output csv compatible formats.
 
   Will write rows to CSV file "f", which is encoded in the given encoding.
+  Rows are formatted BATCH_SIZE at a time and each batch is encoded and
+  written to "f" with a single call. Batches without any value that needs
+  quoting are joined directly, which gives the same output as the csv module
+  much faster.
   """
 
+  BATCH_SIZE = 1000
+
   def __init__(self, f, dialect=csv.excel, encoding='utf-8', **kwds):
     # Redirect output to a queue
     self.queue = cStringIO.StringIO()
@@ -69,8 +116,50 @@ class UnicodeWriter(object):
     self.stream = f
     self.encoder = codecs.getincrementalencoder(encoding)()
 
+    dialect = self.writer.dialect
+    self.delimiter = unicode(dialect.delimiter)
+    self.lineterminator = unicode(dialect.lineterminator)
+    if dialect.quoting == csv.QUOTE_MINIMAL:
+      special = [dialect.delimiter, dialect.quotechar, dialect.escapechar]
+      special.extend(dialect.lineterminator)
+      self.needs_quoting = re.compile(u'[%s]' % re.escape(
+          u''.join(unicode(c) for c in special if c)))
+    else:
+      self.needs_quoting = None
+
   def writerow(self, row):
-    self.writer.writerow([s.encode('utf-8') for s in row])
+    self.writerows([row])
+
+  def writerows(self, rows):
+    rows = iter(rows)
+    while True:
+      batch = list(itertools.islice(rows, UnicodeWriter.BATCH_SIZE))
+      if not batch:
+        return
+      if self._IsPlain(batch):
+        self.stream.write(self.encoder.encode(
+            self.lineterminator.join([self.delimiter.join(row)
+                                      for row in batch]) +
+            self.lineterminator))
+      else:
+        self._WriteQuoted(batch)
+
+  def _IsPlain(self, batch):
+    """Returns whether the csv module would write batch without quoting."""
+    if not self.needs_quoting:
+      return False
+    # The csv module quotes a row made of a single empty value.
+    if [row for row in batch if len(row) == 1 and not row[0]]:
+      return False
+    try:
+      values = u''.join(itertools.chain.from_iterable(batch))
+    except (TypeError, UnicodeDecodeError):
+      return False
+    return not self.needs_quoting.search(values)
+
+  def _WriteQuoted(self, batch):
+    """Writes batch through the csv module."""
+    self.writer.writerows([[s.encode('utf-8') for s in row] for row in batch])
     # Fetch UTF-8 output from the queue ...
     data = self.queue.getvalue()
     data = data.decode('utf-8')
@@ -81,21 +170,24 @@ class UnicodeWriter(object):
     # empty queue
     self.queue.truncate(0)
 
-  def writerows(self, rows):
-    for row in rows:
-      self.writerow(row)
-
 
 class FeedPrinter(object):
   """Utility class to output a the data feed as tabular data."""
 
-  def __init__(self, writer):
+  def __init__(self, writer, metrics=None):
     """Initializes the class.
 
     Args:
-      writer: An instance of UnicodeWriter.
+      writer: An instance of UnicodeWriter or of a Sink.
+      metrics: export_metrics.ExportMetrics (optional) Records the time taken
+          to write each page.
     """
     self.writer = writer
+    self.metrics = metrics
+    if isinstance(writer, Sink):
+      self.sink = writer
+    else:
+      self.sink = TsvSink(writer)
 
   def Output(self, feed):
     """Outputs rows of data retrieved from the Data Export API.
@@ -106,22 +198,214 @@ class FeedPrinter(object):
     Args:
       feed: gdata.analytics.data.DataFeed The feed to output.
     """
-    # Write the headers.
-    if feed and feed.entry:
-      row = []
-      for dim in feed.entry[0].dimension:
-        row.append(dim.name)
-      for met in feed.entry[0].metric:
-        row.append(met.name)
-      self.writer.writerow(row)
-
-    # Write the data.
-    for entry in feed.entry:
-      row = []
-      for dim in entry.dimension:
-        row.append(dim.value)
-      for met in entry.metric:
-        row.append(met.value)
-      self.writer.writerow(row)
+    if feed:
+      self.OutputPages([feed])
+
+  def OutputPages(self, pages):
+    """Outputs rows of data from each page of a Data Export API query.
+
+    Each page is written as soon as it is retrieved from pages, so this can
+    consume AutoPaginator.GetDataPages without holding every page in memory.
+    The dimension and metric names are written once, before the first row.
+
+    Args:
+      pages: iterable of gdata.analytics.data.DataFeed The pages to output.
+    """
+    wrote_headers = False
+    for page in pages:
+      if not page.entry:
+        continue
+
+      # Pages parsed by feed_parser already hold each row as a tuple.
+      if isinstance(page, feed_parser.DataPage):
+        dimension_names = page.dimension_names
+        metric_names = page.metric_names
+        metric_types = page.metric_types
+        rows = page.entry
+      else:
+        first_entry = page.entry[0]
+        num_dims = len(first_entry.dimension)
+        headers = GetHeaders(first_entry)
+        dimension_names = headers[:num_dims]
+        metric_names = headers[num_dims:]
+        metric_types = [met.type for met in first_entry.metric]
+        rows = [GetRow(entry) for entry in page.entry]
+
+      start = time.time()
+      if not wrote_headers:
+        self.sink.WriteHeaders(dimension_names, metric_names, metric_types)
+        wrote_headers = True
+      self.sink.WriteRows(rows)
+      if self.metrics:
+        self.metrics.RecordWrite(time.time() - start, len(rows))
+
+  def Close(self):
+    """Flushes the sink and closes its file, if it opened one."""
+    self.sink.Close()
+
+
+class Sink(object):
+  """Interface of the destinations a FeedPrinter writes rows to.
+
+  A sink receives the column names once, then the rows of each page as soon
+  as the page is retrieved, so it never needs to hold a whole export.
+  """
+
+  def WriteHeaders(self, dimension_names, metric_names, metric_types):
+    """Starts the output with the names and types of the columns.
+
+    Args:
+      dimension_names: list The names of the dimensions.
+      metric_names: list The names of the metrics.
+      metric_types: list The type of each metric reported by the API.
+    """
+    raise NotImplementedError
+
+  def WriteRows(self, rows):
+    """Writes rows of dimension values followed by metric values.
+
+    Args:
+      rows: list of sequences of strings The rows of one page.
+    """
+    raise NotImplementedError
+
+  def Close(self):
+    """Flushes the output and closes its file, if the sink owns it."""
+    pass
+
+
+class TsvSink(Sink):
+  """Writes rows through a UnicodeWriter, with the column names first."""
+
+  def __init__(self, writer, owns_stream=False):
+    """Initializes the class.
+
+    Args:
+      writer: UnicodeWriter The writer of the rows.
+      owns_stream: boolean Whether Close closes the stream of writer.
+    """
+    self.writer = writer
+    self.owns_stream = owns_stream
+
+  def WriteHeaders(self, dimension_names, metric_names, metric_types):
+    self.writer.writerow(list(dimension_names) + list(metric_names))
+
+  def WriteRows(self, rows):
+    self.writer.writerows(rows)
+
+  def Close(self):
+    if self.owns_stream:
+      self.writer.stream.close()
+    else:
+      self.writer.stream.flush()
+
+
+class GzipTsvSink(TsvSink):
+  """Writes rows to a gzipped TSV file as they arrive."""
+
+  DEFAULT_COMPRESS_LEVEL = 6
+
+  def __init__(self, file_name, compresslevel=DEFAULT_COMPRESS_LEVEL):
+    """Initializes the class.
+
+    Args:
+      file_name: string The name of the file to output to.
+      compresslevel: int The gzip compression level, from 1 to 9. Lower
+          levels are faster but compress less.
+    """
+    stream = gzip.GzipFile(file_name, 'wb', compresslevel)
+    TsvSink.__init__(self, UnicodeWriter(stream, dialect='excel-tab'),
+                     owns_stream=True)
+
+
+class JsonLinesSink(Sink):
+  """Writes each row as a JSON object on its own line.
+
+  Each object maps the column names to their values. Metric values are
+  written as JSON numbers, dimension values as strings.
+  """
+
+  def __init__(self, stream, owns_stream=False):
+    """Initializes the class.
+
+    Args:
+      stream: file The file to output to.
+      owns_stream: boolean Whether Close closes stream.
+    """
+    self.stream = stream
+    self.owns_stream = owns_stream
+    self.keys = []
+    self.formatters = []
+
+  def WriteHeaders(self, dimension_names, metric_names, metric_types):
+    names = list(dimension_names) + list(metric_names)
+    self.keys = [json.dumps(name) + ':' for name in names]
+    # Metrics of unknown type are written as floats.
+    metric_types = list(metric_types)
+    metric_types += [None] * (len(metric_names) - len(metric_types))
+    self.formatters = ([_FormatJsonString] * len(dimension_names) +
+                       [_GetJsonNumberFormatter(metric_type)
+                        for metric_type in metric_types])
+
+  def WriteRows(self, rows):
+    lines = []
+    pairs = zip(self.keys, self.formatters)
+    for row in rows:
+      lines.append('{%s}\n' % ','.join([
+          key + formatter(value)
+          for (key, formatter), value in zip(pairs, row)]))
+    self.stream.write(''.join(lines))
+
+  def Close(self):
+    if self.owns_stream:
+      self.stream.close()
+    else:
+      self.stream.flush()
+
+
+def GetHeaders(entry):
+  """Returns the dimension and metric names of a Data Feed entry.
+
+  Args:
+    entry: gdata.analytics.data.DataEntry The entry with the names.
+
+  Returns:
+    A list with the dimension names followed by the metric names.
+  """
+  return ([dim.name for dim in entry.dimension] +
+          [met.name for met in entry.metric])
+
+
+def GetRow(entry):
+  """Returns the dimension and metric values of a Data Feed entry.
+
+  Args:
+    entry: gdata.analytics.data.DataEntry The entry with the values.
+
+  Returns:
+    A list with the dimension values followed by the metric values.
+  """
+  return ([dim.value for dim in entry.dimension] +
+          [met.value for met in entry.metric])
+
+
+def _FormatJsonString(value):
+  """Returns a dimension value as a JSON string."""
+  return json.encoder.encode_basestring_ascii(value)
+
+
+def _FormatJsonInteger(value):
+  """Returns an integer metric value as a JSON number."""
+  return str(int(value))
+
+
+def _FormatJsonFloat(value):
+  """Returns a metric value as a JSON number."""
+  return json.dumps(float(value))
 
 
+def _GetJsonNumberFormatter(metric_type):
+  """Returns the function which formats the values of a type of metric."""
+  if metric_type == 'integer':
+    return _FormatJsonInteger
+  return _FormatJsonFloat
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for feed_printer.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import codecs
+import cStringIO
+import csv
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import atom.core
+import feed_parser
+import feed_parser_test
+import feed_printer
+import gdata.analytics.data
+
+
+ROWS = [[u'(direct)', u'(none)', u'1'],
+        [u'google', u'organic', u'caf\xe9 \u65e5\u672c'],
+        [u'tab\there', u'quote "q"', u'new\nline'],
+        [u'', u'\U0001f600', u'-0.5']]
+
+
+class RowWriter(object):
+  """Writes one row at a time, the way UnicodeWriter used to."""
+
+  def __init__(self, f, dialect=csv.excel, encoding='utf-8'):
+    self.queue = cStringIO.StringIO()
+    self.writer = csv.writer(self.queue, dialect=dialect)
+    self.stream = f
+    self.encoder = codecs.getincrementalencoder(encoding)()
+
+  def writerow(self, row):
+    self.writer.writerow([s.encode('utf-8') for s in row])
+    data = self.queue.getvalue().decode('utf-8')
+    self.stream.write(self.encoder.encode(data))
+    self.queue.truncate(0)
+
+
+class TestUnicodeWriter(unittest.TestCase):
+
+  def GetOutputs(self, rows, **kwds):
+    expected = cStringIO.StringIO()
+    writer = RowWriter(expected, **kwds)
+    for row in rows:
+      writer.writerow(row)
+
+    actual = cStringIO.StringIO()
+    feed_printer.UnicodeWriter(actual, **kwds).writerows(rows)
+    return expected.getvalue(), actual.getvalue()
+
+  def testSameOutput(self):
+    rows = ROWS * 1001
+    for dialect in ('excel-tab', 'excel'):
+      expected, actual = self.GetOutputs(rows, dialect=dialect)
+      self.assertEqual(expected, actual)
+
+  def testPlainRows(self):
+    rows = [[u'google', u'caf\xe9'], [u'a', u'b']] * 2500
+    for dialect in ('excel-tab', 'excel'):
+      expected, actual = self.GetOutputs(rows, dialect=dialect)
+      self.assertEqual(expected, actual)
+
+  def testSingleEmptyValue(self):
+    expected, actual = self.GetOutputs([[u'a'], [u''], []],
+                                       dialect='excel-tab')
+    self.assertEqual(expected, actual)
+
+  def testOtherEncoding(self):
+    expected, actual = self.GetOutputs(ROWS * 3, dialect='excel-tab',
+                                       encoding='utf-16')
+    self.assertEqual(expected, actual)
+    self.assertEqual(1, actual.count(codecs.BOM_UTF16))
+
+    expected, actual = self.GetOutputs([[u'a', u'b']] * 3,
+                                       dialect='excel-tab', encoding='utf-16')
+    self.assertEqual(expected, actual)
+
+  def testWriteRow(self):
+    actual = cStringIO.StringIO()
+    writer = feed_printer.UnicodeWriter(actual, dialect='excel-tab')
+    for row in ROWS:
+      writer.writerow(row)
+    self.assertEqual(self.GetOutputs(ROWS, dialect='excel-tab')[0],
+                     actual.getvalue())
+
+
+class TestFeedPrinter(unittest.TestCase):
+
+  def testOutputPages(self):
+    pages = []
+    for start in (0, 2):
+      page = feed_parser.DataPage()
+      page.dimension_names = ['ga:source', 'ga:medium']
+      page.metric_names = ['ga:visits']
+      page.entry = [tuple(row) for row in ROWS[start:start + 2]]
+      pages.append(page)
+    pages.insert(1, feed_parser.DataPage())
+
+    output = cStringIO.StringIO()
+    printer = feed_printer.FeedPrinter(
+        feed_printer.UnicodeWriter(output, dialect='excel-tab'))
+    printer.OutputPages(pages)
+
+    lines = output.getvalue().split('\r\n')
+    self.assertEqual('ga:source\tga:medium\tga:visits', lines[0])
+    self.assertEqual('google\torganic\tcaf\xc3\xa9 \xe6\x97\xa5\xe6\x9c\xac',
+                     lines[2])
+    self.assertEqual(1, output.getvalue().count('ga:source'))
+
+  def testOutputGdataFeed(self):
+    xml = open(feed_parser_test.DATA_FEED_FILE_NAME).read()
+    outputs = []
+    for page in (atom.core.parse(xml, gdata.analytics.data.DataFeed),
+                 feed_parser.ParseDataFeed(cStringIO.StringIO(xml))):
+      output = cStringIO.StringIO()
+      feed_printer.FeedPrinter(feed_printer.UnicodeWriter(
+          output, dialect='excel-tab')).Output(page)
+      outputs.append(output.getvalue())
+
+    self.assertEqual('ga:source\tga:medium\tga:visits\tga:bounces',
+                     outputs[0].split('\r\n')[0])
+    self.assertEqual(outputs[1], outputs[0])
+
+
+class TestSinks(unittest.TestCase):
+
+  def setUp(self):
+    self.output_dir = tempfile.mkdtemp()
+    page = feed_parser.DataPage()
+    page.dimension_names = ['ga:source', 'ga:medium']
+    page.metric_names = ['ga:visits', 'ga:bounceRate']
+    page.metric_types = ['integer', 'percent']
+    page.entry = [(u'google', u'caf\xe9 "q"', u'12', u'45.5'),
+                  (u'(direct)', u'(none)', u'3', u'0.0')]
+    self.pages = [page]
+
+  def tearDown(self):
+    shutil.rmtree(self.output_dir)
+
+  def testJsonLines(self):
+    file_name = os.path.join(self.output_dir, 'out.jsonl')
+    printer = feed_printer.GetJsonLinesFilePrinter(file_name)
+    printer.OutputPages(self.pages)
+    printer.Close()
+
+    lines = open(file_name, 'rb').read().splitlines()
+    self.assertEqual([{'ga:source': u'google', 'ga:medium': u'caf\xe9 "q"',
+                       'ga:visits': 12, 'ga:bounceRate': 45.5},
+                      {'ga:source': u'(direct)', 'ga:medium': u'(none)',
+                       'ga:visits': 3, 'ga:bounceRate': 0.0}],
+                     [json.loads(line) for line in lines])
+    self.assertTrue(lines[0].startswith('{"ga:source":"google",'))
+
+  def testGzipTsv(self):
+    tsv_name = os.path.join(self.output_dir, 'out.tsv')
+    gzip_name = os.path.join(self.output_dir, 'out.tsv.gz')
+    for printer in (feed_printer.GetTsvFilePrinter(tsv_name),
+                    feed_printer.GetGzipTsvFilePrinter(gzip_name)):
+      printer.OutputPages(self.pages)
+      printer.Close()
+
+    self.assertEqual(open(tsv_name, 'rb').read(),
+                     gzip.open(gzip_name, 'rb').read())
+
+
+if __name__ == '__main__':
+  unittest.main()
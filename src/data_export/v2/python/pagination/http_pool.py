@@ -0,0 +1,322 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides an HTTP client which reuses connections and requests gzip.
+
+The default gdata HTTP client opens a new connection, with its own TLS
+handshake, for every request and downloads the Atom XML uncompressed. The
+PooledHttpClient keeps finished connections open and reuses them for the
+next request to the same host. It asks the server to gzip the response and
+decompresses it as it is read, so a converter such as
+feed_parser.ParseDataFeed never holds the whole response in memory.
+
+The client can be shared by all the worker threads of an AutoPaginator.
+Each request takes an idle connection or opens a new one, so requests never
+wait for each other. At most max_idle connections per host are kept open.
+
+Usage:
+  my_client = gdata.analytics.client.AnalyticsClient(
+      source=APP_NAME, http_client=http_pool.PooledHttpClient())
+
+  PooledHttpClient: Makes HTTP requests over pooled keep-alive connections.
+  PooledResponse: A response which decompresses its body as it is read.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import httplib
+import socket
+import threading
+import zlib
+
+import atom.http_core
+
+
+# Requests which can be sent again if a reused connection turns out to have
+# been closed by the server.
+_IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD'])
+
+
+class PooledHttpClient(atom.http_core.HttpClient):
+  """Makes HTTP requests over pooled keep-alive connections.
+
+  Attributes:
+    DEFAULT_MAX_IDLE: int The default number of idle connections kept open
+        per host.
+    requests: int The number of requests made.
+    connections_opened: int The number of connections opened.
+    bytes_received: int The number of body bytes received, as sent by the
+        server.
+    bytes_decoded: int The number of body bytes after decompression.
+  """
+
+  DEFAULT_MAX_IDLE = 10
+
+  def __init__(self, max_idle=DEFAULT_MAX_IDLE, gzip=True, timeout=None):
+    """Initializes this class.
+
+    Args:
+      max_idle: int The number of idle connections kept open per host. Should
+          be at least the number of worker threads.
+      gzip: boolean Whether to ask the server to gzip responses.
+      timeout: float (optional) The socket timeout in seconds of new
+          connections.
+    """
+    self.max_idle = max_idle
+    self.gzip = gzip
+    self.timeout = timeout
+    self.lock = threading.Lock()
+    self.idle = {}
+
+    self.requests = 0
+    self.connections_opened = 0
+    self.bytes_received = 0
+    self.bytes_decoded = 0
+
+  def _http_request(self, method, uri, headers=None, body_parts=None):
+    """Makes an HTTP request over an idle or new connection.
+
+    Args:
+      method: str example: 'GET', 'POST', 'PUT', 'DELETE', etc.
+      uri: str or atom.http_core.Uri
+      headers: dict of strings mapping to strings which will be sent as HTTP
+          headers in the request.
+      body_parts: list of strings, objects with a read method, or objects
+          which can be converted to strings using str.
+
+    Returns:
+      PooledResponse The response of the server.
+    """
+    if isinstance(uri, (str, unicode)):
+      uri = atom.http_core.Uri.parse_uri(uri)
+    headers = dict(headers or {})
+    if self.gzip:
+      headers['Accept-Encoding'] = 'gzip'
+    body = _JoinBodyParts(body_parts)
+    key = (uri.scheme, uri.host, uri.port)
+    path = uri._get_relative_path()
+
+    response = None
+    connection = self.GetIdleConnection(key)
+    if connection:
+      try:
+        response = self._Send(connection, method, path, body, headers)
+      except (socket.error, httplib.HTTPException):
+        connection.close()
+        if method not in _IDEMPOTENT_METHODS:
+          raise
+
+    if not response:
+      connection = self._get_connection(uri, headers=headers)
+      with self.lock:
+        self.connections_opened += 1
+      response = self._Send(connection, method, path, body, headers)
+
+    with self.lock:
+      self.requests += 1
+    return PooledResponse(self, key, connection, response)
+
+  def _get_connection(self, uri, headers=None):
+    """Opens a new connection to the host of uri."""
+    connection = atom.http_core.HttpClient._get_connection(self, uri, headers)
+    if self.timeout is not None:
+      connection.timeout = self.timeout
+    if self.debug:
+      connection.debuglevel = 1
+    return connection
+
+  def _Send(self, connection, method, path, body, headers):
+    """Sends a request over connection and returns the raw response."""
+    connection.request(method, path, body, headers)
+    return connection.getresponse()
+
+  def GetIdleConnection(self, key):
+    """Returns an idle connection to a host or None if there is none.
+
+    Args:
+      key: tuple The scheme, host and port of the connection.
+
+    Returns:
+      httplib.HTTPConnection The most recently used idle connection.
+    """
+    with self.lock:
+      connections = self.idle.get(key)
+      if connections:
+        return connections.pop()
+    return None
+
+  def ReleaseConnection(self, key, connection):
+    """Returns a connection whose response was read to the idle pool.
+
+    The connection is closed instead if max_idle connections to its host are
+    already idle.
+
+    Args:
+      key: tuple The scheme, host and port of the connection.
+      connection: httplib.HTTPConnection The connection.
+    """
+    with self.lock:
+      connections = self.idle.setdefault(key, [])
+      if len(connections) < self.max_idle:
+        connections.append(connection)
+        return
+    connection.close()
+
+  def Close(self):
+    """Closes every idle connection."""
+    with self.lock:
+      idle = self.idle
+      self.idle = {}
+    for connections in idle.values():
+      for connection in connections:
+        connection.close()
+
+
+class PooledResponse(object):
+  """A response which decompresses its body as it is read.
+
+  Once the whole body is read, the connection goes back to the pool of its
+  client. A response which is closed before then also closes its connection.
+
+  Attributes:
+    READ_SIZE: int The number of bytes read from the socket, and the most
+        bytes decompressed, at a time.
+    status: int The HTTP status code.
+    reason: string The HTTP reason phrase.
+    version: int The HTTP version of the server.
+    msg: httplib.HTTPMessage The headers of the response.
+    bytes_received: int The number of body bytes received so far.
+    bytes_decoded: int The number of body bytes decompressed so far.
+  """
+
+  READ_SIZE = 64 * 1024
+
+  def __init__(self, http_client, key, connection, response):
+    """Initializes this class.
+
+    Args:
+      http_client: PooledHttpClient The client which made the request.
+      key: tuple The scheme, host and port of the connection.
+      connection: httplib.HTTPConnection The connection of the request.
+      response: httplib.HTTPResponse The raw response.
+    """
+    self.http_client = http_client
+    self.key = key
+    self.connection = connection
+    self.response = response
+    self.status = response.status
+    self.reason = response.reason
+    self.version = response.version
+    self.msg = response.msg
+    self.buffer = ''
+    self.done = False
+    self.bytes_received = 0
+    self.bytes_decoded = 0
+
+    if (response.getheader('content-encoding') or '').lower() == 'gzip':
+      # The 16 tells zlib to expect a gzip header and trailer.
+      self.decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    else:
+      self.decoder = None
+
+  def getheader(self, name, default=None):
+    """Returns the value of a header or default if it is missing."""
+    return self.response.getheader(name, default)
+
+  def getheaders(self):
+    """Returns a list of (name, value) tuples of the headers."""
+    return self.response.getheaders()
+
+  def read(self, amt=None):
+    """Reads the decompressed body of the response.
+
+    Args:
+      amt: int (optional) The most bytes to return. The whole remaining body
+          is returned if not set.
+
+    Returns:
+      str The bytes read, or an empty string at the end of the body.
+    """
+    if amt is None or amt < 0:
+      chunks = [self.buffer]
+      while not self.done:
+        chunks.append(self._ReadChunk())
+      self.buffer = ''
+      return ''.join(chunks)
+
+    while len(self.buffer) < amt and not self.done:
+      self.buffer += self._ReadChunk()
+    data = self.buffer[:amt]
+    self.buffer = self.buffer[amt:]
+    return data
+
+  def close(self):
+    """Closes the connection if the body was not read to the end."""
+    if not self.done:
+      self.done = True
+      self.connection.close()
+
+  def _ReadChunk(self):
+    """Returns the next decompressed chunk of the body."""
+    if self.decoder and self.decoder.unconsumed_tail:
+      data = self.decoder.unconsumed_tail
+    else:
+      data = self.response.read(PooledResponse.READ_SIZE)
+      if not data:
+        if self.decoder:
+          data = self.decoder.flush()
+        self._Finish()
+        self._CountBytes(0, len(data))
+        return data
+      self._CountBytes(len(data), 0)
+
+    if self.decoder:
+      data = self.decoder.decompress(data, PooledResponse.READ_SIZE)
+    self._CountBytes(0, len(data))
+    return data
+
+  def _CountBytes(self, received, decoded):
+    """Adds to the byte counters of this response and of the client."""
+    self.bytes_received += received
+    self.bytes_decoded += decoded
+    with self.http_client.lock:
+      self.http_client.bytes_received += received
+      self.http_client.bytes_decoded += decoded
+
+  def _Finish(self):
+    """Releases the connection once the whole body has been read."""
+    self.done = True
+    if self.response.will_close:
+      self.connection.close()
+    else:
+      self.http_client.ReleaseConnection(self.key, self.connection)
+
+
+def _JoinBodyParts(body_parts):
+  """Returns the body of a request as a single string, or None if empty."""
+  if not body_parts:
+    return None
+
+  parts = []
+  for part in body_parts:
+    if isinstance(part, (str, unicode)):
+      parts.append(part)
+    elif hasattr(part, 'read'):
+      parts.append(part.read())
+    else:
+      parts.append(str(part))
+  return ''.join(parts) or None
@@ -0,0 +1,145 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for http_pool.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import BaseHTTPServer
+import cStringIO
+import gzip
+import SocketServer
+import threading
+import unittest
+import atom.http_core
+import http_pool
+
+
+BODY = ''.join('<dxp:dimension name="ga:source" value="source %d"/>\n' % i
+               for i in range(20000))
+
+
+class GzipHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Responds with BODY over keep-alive connections, gzipped if accepted."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    body = BODY
+    self.send_response(200)
+    if 'gzip' in (self.headers.getheader('Accept-Encoding') or ''):
+      buf = cStringIO.StringIO()
+      gzip_file = gzip.GzipFile(fileobj=buf, mode='wb')
+      gzip_file.write(body)
+      gzip_file.close()
+      body = buf.getvalue()
+      self.send_header('Content-Encoding', 'gzip')
+    if self.path == '/close':
+      self.send_header('Connection', 'close')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """Serves each connection on its own thread."""
+
+  daemon_threads = True
+
+  def handle_error(self, request, client_address):
+    # Clients may close a connection without reading the whole response.
+    pass
+
+
+class TestPooledHttpClient(unittest.TestCase):
+
+  def setUp(self):
+    self.server = Server(('127.0.0.1', 0), GzipHandler)
+    self.thread = threading.Thread(target=self.server.serve_forever,
+                                   args=(0.05,))
+    self.thread.start()
+    self.uri = 'http://127.0.0.1:%d' % self.server.server_port
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.thread.join()
+
+  def Get(self, http_client, path='/feed'):
+    return http_client.request(
+        atom.http_core.HttpRequest(uri=self.uri + path, method='GET'))
+
+  def testReusesConnection(self):
+    http_client = http_pool.PooledHttpClient()
+    for _ in range(3):
+      self.assertEqual(BODY, self.Get(http_client).read())
+    self.assertEqual(3, http_client.requests)
+    self.assertEqual(1, http_client.connections_opened)
+    http_client.Close()
+
+  def testGzip(self):
+    http_client = http_pool.PooledHttpClient()
+    response = self.Get(http_client)
+    self.assertEqual('gzip', response.getheader('Content-Encoding'))
+
+    chunks = []
+    chunk = response.read(1000)
+    while chunk:
+      self.assertTrue(len(chunk) <= 1000)
+      chunks.append(chunk)
+      chunk = response.read(1000)
+    self.assertEqual(BODY, ''.join(chunks))
+    self.assertEqual(len(BODY), http_client.bytes_decoded)
+    self.assertTrue(http_client.bytes_received * 10 < len(BODY))
+    self.assertEqual(http_client.bytes_received, response.bytes_received)
+    self.assertEqual(len(BODY), response.bytes_decoded)
+
+  def testWithoutGzip(self):
+    http_client = http_pool.PooledHttpClient(gzip=False)
+    response = self.Get(http_client)
+    self.assertEqual(None, response.getheader('Content-Encoding'))
+    self.assertEqual(BODY, response.read())
+    self.assertEqual(len(BODY), http_client.bytes_received)
+
+  def testConnectionClose(self):
+    http_client = http_pool.PooledHttpClient()
+    self.Get(http_client, '/close').read()
+    self.Get(http_client, '/close').read()
+    self.assertEqual(2, http_client.connections_opened)
+    self.assertEqual({}, dict((key, value) for key, value
+                              in http_client.idle.items() if value))
+
+  def testUnreadResponseIsNotReused(self):
+    http_client = http_pool.PooledHttpClient()
+    self.Get(http_client).close()
+    self.assertEqual(BODY, self.Get(http_client).read())
+    self.assertEqual(2, http_client.connections_opened)
+
+  def testStaleConnectionIsReplaced(self):
+    http_client = http_pool.PooledHttpClient()
+    self.Get(http_client).read()
+    for connections in http_client.idle.values():
+      for connection in connections:
+        connection.sock.close()
+    self.assertEqual(BODY, self.Get(http_client).read())
+    self.assertEqual(2, http_client.connections_opened)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,515 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keeps an export of a rolling date window up to date with few requests.
+
+The rows of the export are stored by ga:date, one columnar file per day, in
+a PartitionedStore. The manifest of the store records which days it holds
+and when each day was retrieved. Analytics keeps processing the data of a
+day for a while, so a day retrieved less than settling_days after it ended
+may still change.
+
+Each Sync only queries the days of the window which are missing from the
+store or were retrieved before they settled, with ga:date added to the
+dimensions. Consecutive days are retrieved in one query, and the rows are
+split by day to replace just those files. A nightly sync of a 90 day window
+then requests 2 days instead of 90.
+
+Each retrieval of a day is written to a new file, named after the day and
+a random suffix. The manifest, which names the file of each day, is then
+replaced in one step, and only after that are the files it no longer names
+deleted. A sync which fails at any point leaves the store as it was, with
+at worst some files which no manifest names.
+
+Usage:
+  store = incremental_sync.PartitionedStore('my_export')
+  sync = incremental_sync.IncrementalSync(paginator, store)
+  sync.Sync(my_query)
+  printer.OutputPages(store.GetDataPages())
+
+  IncrementalSync: Retrieves the days of a query missing from a store.
+  PartitionedStore: Stores the rows of an export in one file per day.
+  GetStaleDates(): Returns the days of a window which need to be retrieved.
+  GetDateRanges(): Groups days into ranges of consecutive days.
+  AddDateDimension(): Returns dimensions with ga:date added.
+  IncrementalSyncError: Raised when a query can not be synced to a store.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import datetime
+import json
+import os
+import tempfile
+
+import atomic_file
+import columnar_file
+import data_table
+import date_sharding
+import feed_parser
+import feed_printer
+import gdata.analytics.client
+
+
+# The days after the end of a day during which its data may still change.
+SETTLING_DAYS = 2
+
+# The most dimensions the API accepts in one query.
+MAX_DIMENSIONS = 7
+
+# Parameters which do not change the rows of a day.
+_IGNORED_PARAMS = frozenset(['start-date', 'end-date', 'start-index',
+                             'max-results', 'prettyprint'])
+
+
+class IncrementalSync(object):
+  """Retrieves the days of a query which are missing from a store.
+
+  Attributes:
+    paginator: pagination.AutoPaginator The paginator used to retrieve the
+        pages.
+    store: PartitionedStore The store to keep up to date.
+    settling_days: int The days after which the data of a day is final.
+    queries: int The number of queries made by the last Sync.
+  """
+
+  def __init__(self, paginator, store, settling_days=SETTLING_DAYS):
+    """Initializes this class.
+
+    Args:
+      paginator: pagination.AutoPaginator The paginator used to retrieve the
+          pages.
+      store: PartitionedStore The store to keep up to date.
+      settling_days: int The days after the end of a day during which its
+          data may still change.
+    """
+    self.paginator = paginator
+    self.store = store
+    self.settling_days = settling_days
+    self.queries = 0
+
+  def Sync(self, query, today=None, prune=False):
+    """Retrieves the days of the date range of query not final in the store.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to export. Its
+          start-date and end-date set the window to keep up to date. ga:date
+          is added to its dimensions.
+      today: datetime.date (optional) The current day. Defaults to the date
+          of this machine.
+      prune: boolean Whether to delete the days of the store before the
+          start of the window.
+
+    Returns:
+      A list of the days retrieved, as YYYY-MM-DD strings.
+
+    Raises:
+      IncrementalSyncError: If the store holds a different query, or the
+          query has too many dimensions.
+      AutoPaginatorError: If an error occurs with the API request. The days
+          retrieved before the error are kept.
+    """
+    self.queries = 0
+    today = today or datetime.date.today()
+    params = dict(query.query)
+    params['dimensions'] = ','.join(AddDateDimension(params.get('dimensions')))
+    start_date = params['start-date']
+    end_date = params['end-date']
+
+    query_key = GetQueryKey(params)
+    manifest = self.store.LoadManifest()
+    if manifest.get('query_key', query_key) != query_key:
+      raise IncrementalSyncError(
+          msg='The store %s holds a different query.' % self.store.store_dir)
+
+    stale_dates = GetStaleDates(start_date, end_date,
+                                self.store.GetPartitions(), today,
+                                self.settling_days)
+    synced = _FormatDate(today)
+    for range_start, range_end in GetDateRanges(stale_dates):
+      params['start-date'] = range_start
+      params['end-date'] = range_end
+      self.queries += 1
+      pages = self.paginator.GetDataPages(
+          gdata.analytics.client.DataFeedQuery(dict(params)), -1)
+      self.store.ReplacePartitions(
+          _GetDates(range_start, range_end), pages, synced, query_key)
+
+    if prune:
+      self.store.DeletePartitions(
+          [date for date in self.store.GetPartitions() if date < start_date])
+    return stale_dates
+
+
+class PartitionedStore(object):
+  """Stores the rows of an export in one columnar file per day.
+
+  Attributes:
+    MANIFEST_FILE_NAME: string The name of the manifest in the store.
+    store_dir: string The directory with the files and the manifest.
+  """
+
+  MANIFEST_FILE_NAME = 'manifest.json'
+
+  def __init__(self, store_dir):
+    """Initializes this class.
+
+    Args:
+      store_dir: string The directory of the store. It is created if it does
+          not exist.
+    """
+    self.store_dir = store_dir
+    if not os.path.isdir(store_dir):
+      os.makedirs(store_dir)
+
+  def LoadManifest(self):
+    """Returns the manifest of the store, or an empty dict if there is none."""
+    try:
+      manifest_file = open(self._GetPath(self.MANIFEST_FILE_NAME))
+    except IOError:
+      return {}
+    try:
+      return json.load(manifest_file)
+    finally:
+      manifest_file.close()
+
+  def GetPartitions(self):
+    """Returns a dict with the number of rows and sync day of each day.
+
+    Each value is a dict with the rows of the day and the day it was synced,
+    as a YYYY-MM-DD string.
+    """
+    return self.LoadManifest().get('partitions', {})
+
+  def ReplacePartitions(self, dates, pages, synced, query_key=None):
+    """Replaces the rows of some days with the rows of pages.
+
+    The rows are written to new files as the pages are retrieved. Once
+    every page has been written, the manifest is replaced by one which names
+    the new files, and the files of the days it replaced are deleted. So a
+    failure before the manifest is saved leaves the store as it was.
+
+    Args:
+      dates: list The days to replace, as YYYY-MM-DD strings. The days without
+          rows in pages are recorded as empty.
+      pages: iterable of gdata.analytics.data.DataFeed or feed_parser.DataPage
+          The pages of a query with ga:date in its dimensions.
+      synced: string The day the pages were retrieved, as YYYY-MM-DD.
+      query_key: string (optional) The query the store holds.
+
+    Raises:
+      IncrementalSyncError: If the pages have no ga:date dimension or have
+          rows of other days.
+    """
+    writer = _PartitionWriter(self.store_dir, dates)
+    try:
+      for page in pages:
+        writer.WritePage(page)
+      writer.Close()
+    except:
+      writer.Discard()
+      raise
+
+    manifest = self.LoadManifest()
+    if query_key:
+      manifest['query_key'] = query_key
+    partitions = manifest.setdefault('partitions', {})
+    old_paths = []
+    for date in dates:
+      if date in partitions:
+        old_paths.append(self._GetPartitionPath(date, partitions[date]))
+      partitions[date] = {'rows': writer.num_rows.get(date, 0),
+                          'synced': synced}
+      path = writer.paths.get(date)
+      if path:
+        partitions[date]['file'] = os.path.basename(path)
+
+    try:
+      self.SaveManifest(manifest)
+    except:
+      writer.Discard()
+      raise
+    self._DeleteFiles(old_paths)
+
+  def DeletePartitions(self, dates):
+    """Deletes the rows of some days from the store."""
+    if not dates:
+      return
+    manifest = self.LoadManifest()
+    partitions = manifest.get('partitions', {})
+    old_paths = [self._GetPartitionPath(date, partitions.pop(date))
+                 for date in dates if date in partitions]
+    self.SaveManifest(manifest)
+    self._DeleteFiles(old_paths)
+
+  def GetDataPages(self, start_date=None, end_date=None):
+    """Yields the rows of each stored day, in date order.
+
+    Args:
+      start_date: string (optional) The first day to read, as YYYY-MM-DD.
+      end_date: string (optional) The last day to read, as YYYY-MM-DD.
+
+    Yields:
+      feed_parser.DataPage One page per day with rows, with the values as
+      strings like the pages of the API.
+    """
+    for date, partition in sorted(self.GetPartitions().iteritems()):
+      if ((start_date and date < start_date) or
+          (end_date and date > end_date) or not partition['rows']):
+        continue
+      partition_file = open(self._GetPartitionPath(date, partition), 'rb')
+      try:
+        table = columnar_file.ReadDataTable(partition_file)
+      finally:
+        partition_file.close()
+      yield _GetDataPage(table)
+
+  def GetDataTable(self, start_date=None, end_date=None):
+    """Returns a data_table.DataTable with the rows of the stored days."""
+    return data_table.GetDataTable(self.GetDataPages(start_date, end_date))
+
+  def SaveManifest(self, manifest):
+    """Replaces the manifest of the store."""
+    atomic_file.WriteAtomically(self._GetPath(self.MANIFEST_FILE_NAME),
+                                json.dumps(manifest, sort_keys=True))
+
+  def _GetPath(self, file_name):
+    """Returns the path of a file in the store."""
+    return os.path.join(self.store_dir, file_name)
+
+  def _GetPartitionPath(self, date, partition):
+    """Returns the path of the file of a day, named by its partition.
+
+    The partitions of stores written before the files had a random suffix
+    have no file name.
+    """
+    return self._GetPath(partition.get('file') or '%s.gacol' % date)
+
+  def _DeleteFiles(self, paths):
+    """Deletes the files no longer named by the manifest."""
+    for path in paths:
+      if os.path.exists(path):
+        os.remove(path)
+
+
+def GetStaleDates(start_date, end_date, partitions, today,
+                  settling_days=SETTLING_DAYS):
+  """Returns the days of a window which need to be retrieved.
+
+  Args:
+    start_date: string The first day of the window, as YYYY-MM-DD.
+    end_date: string The last day of the window, as YYYY-MM-DD.
+    partitions: dict The stored days, as returned by
+        PartitionedStore.GetPartitions.
+    today: datetime.date The current day.
+    settling_days: int The days after the end of a day during which its data
+        may still change.
+
+  Returns:
+    A list of the days missing from partitions or synced before they
+    settled, in date order, as YYYY-MM-DD strings.
+  """
+  settling = datetime.timedelta(days=settling_days)
+  stale_dates = []
+  for date in _GetDates(start_date, end_date):
+    partition = partitions.get(date)
+    if partition:
+      synced = _ParseDate(partition['synced'])
+      if synced - _ParseDate(date) >= settling:
+        continue
+    if _ParseDate(date) <= today:
+      stale_dates.append(date)
+  return stale_dates
+
+
+def GetDateRanges(dates):
+  """Groups days into ranges of consecutive days.
+
+  Args:
+    dates: list The days, in date order, as YYYY-MM-DD strings.
+
+  Returns:
+    A list of (start_date, end_date) tuples.
+  """
+  one_day = datetime.timedelta(days=1)
+  ranges = []
+  for date in dates:
+    if (ranges and _ParseDate(ranges[-1][1]) + one_day ==
+        _ParseDate(date)):
+      ranges[-1] = (ranges[-1][0], date)
+    else:
+      ranges.append((date, date))
+  return ranges
+
+
+def AddDateDimension(dimensions):
+  """Returns the dimension names of a query with ga:date added.
+
+  Args:
+    dimensions: string The comma separated dimensions of the query.
+
+  Returns:
+    A list of the dimension names, with ga:date first unless it was already
+    there.
+
+  Raises:
+    IncrementalSyncError: If there is no room for ga:date.
+  """
+  names = _SplitNames(dimensions)
+  if date_sharding.DATE_DIMENSION in names:
+    return names
+  if len(names) >= MAX_DIMENSIONS:
+    raise IncrementalSyncError(
+        msg='Can not add %s to a query with %d dimensions.' % (
+            date_sharding.DATE_DIMENSION, len(names)))
+  return [date_sharding.DATE_DIMENSION] + names
+
+
+def GetQueryKey(params):
+  """Returns the parameters of a query other than its dates, as a string."""
+  return json.dumps(sorted((name, str(value))
+                           for name, value in params.iteritems()
+                           if name not in _IGNORED_PARAMS and
+                           value is not None))
+
+
+class IncrementalSyncError(Exception):
+  """Raised when a query can not be synced to a store."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+class _PartitionWriter(object):
+  """Splits the rows of pages by day into new columnar files."""
+
+  def __init__(self, store_dir, dates):
+    """Initializes this class."""
+    self.store_dir = store_dir
+    self.dates = frozenset(dates)
+    self.sinks = {}
+    self.files = {}
+    self.paths = {}
+    self.num_rows = {}
+
+  def WritePage(self, page):
+    """Appends the rows of a page to the file of their day."""
+    if not page.entry:
+      return
+
+    if isinstance(page, feed_parser.DataPage):
+      dimension_names = page.dimension_names
+      metric_names = page.metric_names
+      metric_types = page.metric_types
+      rows = page.entry
+    else:
+      first_entry = page.entry[0]
+      dimension_names = [dim.name for dim in first_entry.dimension]
+      metric_names = [met.name for met in first_entry.metric]
+      metric_types = [met.type for met in first_entry.metric]
+      rows = [feed_printer.GetRow(entry) for entry in page.entry]
+
+    if date_sharding.DATE_DIMENSION not in dimension_names:
+      raise IncrementalSyncError(
+          msg='The pages have no %s dimension.' % date_sharding.DATE_DIMENSION)
+    date_index = dimension_names.index(date_sharding.DATE_DIMENSION)
+
+    rows_by_value = {}
+    for row in rows:
+      rows_by_value.setdefault(row[date_index], []).append(row)
+
+    for value, date_rows in rows_by_value.iteritems():
+      # ga:date values are YYYYMMDD.
+      date = '%s-%s-%s' % (value[:4], value[4:6], value[6:])
+      if date not in self.dates:
+        raise IncrementalSyncError(msg='Unexpected rows of %s.' % date)
+      sink = self.sinks.get(date)
+      if not sink:
+        handle, path = tempfile.mkstemp(dir=self.store_dir,
+                                        prefix='%s.' % date, suffix='.gacol')
+        self.paths[date] = path
+        self.files[date] = os.fdopen(handle, 'wb')
+        sink = columnar_file.ColumnarSink(self.files[date])
+        sink.WriteHeaders(dimension_names, metric_names, metric_types)
+        self.sinks[date] = sink
+      sink.WriteRows(date_rows)
+      self.num_rows[date] = self.num_rows.get(date, 0) + len(date_rows)
+
+  def Close(self):
+    """Finishes every file and flushes it to disk."""
+    for date, sink in self.sinks.iteritems():
+      sink.Close()
+      os.fsync(self.files[date].fileno())
+      self.files.pop(date).close()
+    self.sinks = {}
+
+  def Discard(self):
+    """Deletes every file written."""
+    for partition_file in self.files.itervalues():
+      try:
+        partition_file.close()
+      except IOError:
+        pass
+    self.sinks = {}
+    self.files = {}
+    for path in self.paths.itervalues():
+      if os.path.exists(path):
+        os.remove(path)
+
+
+def _GetDates(start_date, end_date):
+  """Returns every day from start_date to end_date, as YYYY-MM-DD strings."""
+  start = _ParseDate(start_date)
+  end = _ParseDate(end_date)
+  return [_FormatDate(start + datetime.timedelta(days=days))
+          for days in xrange((end - start).days + 1)]
+
+
+def _ParseDate(date):
+  """Returns a datetime.date from a YYYY-MM-DD string."""
+  return datetime.datetime.strptime(date, date_sharding.DATE_FORMAT).date()
+
+
+def _FormatDate(date):
+  """Returns a YYYY-MM-DD string from a datetime.date."""
+  return date.strftime(date_sharding.DATE_FORMAT)
+
+
+def _SplitNames(names):
+  """Returns the names of a comma separated query parameter."""
+  return [name.strip() for name in (names or '').split(',') if name.strip()]
+
+
+def _GetDataPage(table):
+  """Returns the rows of a DataTable as a page with string values."""
+  page = feed_parser.DataPage()
+  page.dimension_names = list(table.dimension_names)
+  page.metric_names = list(table.metric_names)
+  page.metric_types = list(table.metric_types)
+  page.start_index = 1
+  page.items_per_page = table.num_rows
+  page.total_results = feed_parser.TextElement(str(table.num_rows))
+
+  num_dims = len(table.dimensions)
+  formats = [unicode if column.typecode == data_table.INTEGER_TYPECODE
+             else repr for column in table.metrics]
+  page.entry = [row[:num_dims] + tuple(format_value(value) for format_value,
+                                       value in zip(formats, row[num_dims:]))
+                for row in table.GetRows()]
+  return page
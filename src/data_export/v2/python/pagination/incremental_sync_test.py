@@ -0,0 +1,251 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for incremental_sync.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+import feed_parser
+import gdata.analytics.client
+import incremental_sync
+
+
+class FakePaginator(object):
+  """Returns two rows per day, whose visits are the version of the data."""
+
+  def __init__(self, empty_dates=(), fail=False):
+    self.version = 1
+    self.empty_dates = empty_dates
+    self.fail = fail
+    self.queries = []
+
+  def GetDataPages(self, query, num_pages):
+    self.queries.append(dict(query.query))
+    start = datetime.datetime.strptime(query.query['start-date'], '%Y-%m-%d')
+    end = datetime.datetime.strptime(query.query['end-date'], '%Y-%m-%d')
+    dimension_names = query.query['dimensions'].split(',')
+
+    date = start
+    while date <= end:
+      page = feed_parser.DataPage()
+      page.dimension_names = dimension_names
+      page.metric_names = ['ga:visits', 'ga:visitBounceRate']
+      page.metric_types = ['integer', 'percent']
+      if date.strftime('%Y-%m-%d') not in self.empty_dates:
+        page.entry = [
+            (date.strftime('%Y%m%d'), source, str(self.version), '0.25')
+            for source in ('google', 'yahoo')]
+      yield page
+      if self.fail:
+        raise IOError('The connection was reset.')
+      date += datetime.timedelta(days=1)
+
+
+def GetQuery(start_date, end_date, dimensions='ga:source'):
+  return gdata.analytics.client.DataFeedQuery({
+      'ids': 'ga:1',
+      'start-date': start_date,
+      'end-date': end_date,
+      'dimensions': dimensions,
+      'metrics': 'ga:visits,ga:visitBounceRate'})
+
+
+class TestIncrementalSync(unittest.TestCase):
+
+  def setUp(self):
+    self.store_dir = tempfile.mkdtemp()
+    self.store = incremental_sync.PartitionedStore(self.store_dir)
+    self.paginator = FakePaginator()
+    self.sync = incremental_sync.IncrementalSync(self.paginator, self.store)
+
+  def tearDown(self):
+    shutil.rmtree(self.store_dir)
+
+  def GetFiles(self, date=''):
+    """Returns the files of the store whose names start with date."""
+    return sorted(file_name for file_name in os.listdir(self.store_dir)
+                  if file_name.startswith(date))
+
+  def testFirstSyncRetrievesWindowInOneQuery(self):
+    dates = self.sync.Sync(GetQuery('2011-01-01', '2011-01-10'),
+                           today=datetime.date(2011, 1, 20))
+
+    self.assertEquals(10, len(dates))
+    self.assertEquals(1, self.sync.queries)
+    self.assertEquals('ga:date,ga:source',
+                      self.paginator.queries[0]['dimensions'])
+    partitions = self.store.GetPartitions()
+    self.assertEquals(10, len(partitions))
+    partition = partitions['2011-01-05']
+    self.assertEquals(2, partition['rows'])
+    self.assertEquals('2011-01-20', partition['synced'])
+    self.assertEquals([partition['file']], self.GetFiles('2011-01-05'))
+
+  def testNightlySyncRetrievesOnlyNewAndSettlingDays(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-03-31'),
+                   today=datetime.date(2011, 3, 31))
+    self.paginator.version = 2
+
+    dates = self.sync.Sync(GetQuery('2011-01-02', '2011-04-01'),
+                           today=datetime.date(2011, 4, 1))
+
+    # 03-30 and 03-31 were retrieved before they settled.
+    self.assertEquals(['2011-03-30', '2011-03-31', '2011-04-01'], dates)
+    self.assertEquals(1, self.sync.queries)
+    self.assertEquals('2011-03-30', self.paginator.queries[-1]['start-date'])
+    self.assertEquals('2011-04-01', self.paginator.queries[-1]['end-date'])
+
+    table = self.store.GetDataTable('2011-03-29', '2011-04-01')
+    self.assertEquals([1, 1, 2, 2, 2, 2, 2, 2], list(table.metrics[0]))
+
+  def testSettledStoreMakesNoQueries(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-10'),
+                   today=datetime.date(2011, 1, 20))
+    self.assertEquals([], self.sync.Sync(GetQuery('2011-01-01', '2011-01-10'),
+                                         today=datetime.date(2011, 1, 21)))
+    self.assertEquals(0, self.sync.queries)
+
+  def testMissingDaysAreRetrievedInConsecutiveRanges(self):
+    self.store.SaveManifest({'partitions': {
+        '2011-01-02': {'rows': 0, 'synced': '2011-01-20'},
+        '2011-01-03': {'rows': 0, 'synced': '2011-01-20'}}})
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-05'),
+                   today=datetime.date(2011, 1, 20))
+
+    self.assertEquals([('2011-01-01', '2011-01-01'),
+                       ('2011-01-04', '2011-01-05')],
+                      [(query['start-date'], query['end-date'])
+                       for query in self.paginator.queries])
+
+  def testEmptyDaysAreRecorded(self):
+    self.paginator.empty_dates = ('2011-01-02',)
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-03'),
+                   today=datetime.date(2011, 1, 20))
+
+    self.assertEquals(0, self.store.GetPartitions()['2011-01-02']['rows'])
+    self.assertEquals([], self.GetFiles('2011-01-02'))
+    self.assertEquals(4, self.store.GetDataTable().num_rows)
+
+  def testDataPagesHaveApiValues(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-01'),
+                   today=datetime.date(2011, 1, 20))
+    pages = list(self.store.GetDataPages())
+
+    self.assertEquals(1, len(pages))
+    self.assertEquals(['ga:date', 'ga:source'], pages[0].dimension_names)
+    self.assertEquals(['integer', 'percent'], pages[0].metric_types)
+    self.assertEquals([(u'20110101', u'google', u'1', '0.25'),
+                       (u'20110101', u'yahoo', u'1', '0.25')], pages[0].entry)
+
+  def testPrune(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-10'),
+                   today=datetime.date(2011, 1, 20))
+    self.sync.Sync(GetQuery('2011-01-05', '2011-01-10'),
+                   today=datetime.date(2011, 1, 20), prune=True)
+
+    self.assertEquals('2011-01-05', min(self.store.GetPartitions()))
+    self.assertEquals([], self.GetFiles('2011-01-01'))
+
+  def testFailedSyncLeavesStoreUnchanged(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-03'),
+                   today=datetime.date(2011, 1, 2))
+    self.paginator.fail = True
+    self.paginator.version = 2
+
+    self.assertRaises(IOError, self.sync.Sync,
+                      GetQuery('2011-01-01', '2011-01-03'),
+                      today=datetime.date(2011, 1, 3))
+    self.assertEquals([1] * 4, list(self.store.GetDataTable().metrics[0]))
+    self.assertEquals(
+        sorted([partition['file'] for partition
+                in self.store.GetPartitions().itervalues()] +
+               ['manifest.json']), self.GetFiles())
+
+  def testFailedManifestLeavesStoreUnchanged(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-02'),
+                   today=datetime.date(2011, 1, 20))
+    files = self.GetFiles()
+
+    def FailingSaveManifest(manifest):
+      raise IOError('No space left on device.')
+
+    self.store.SaveManifest = FailingSaveManifest
+    self.paginator.version = 2
+    self.assertRaises(IOError, self.store.ReplacePartitions,
+                      ['2011-01-01', '2011-01-02'],
+                      self.paginator.GetDataPages(
+                          GetQuery('2011-01-01', '2011-01-02',
+                                   'ga:date,ga:source'), -1),
+                      '2011-01-21')
+    self.assertEquals(files, self.GetFiles())
+    self.assertEquals([1] * 4, list(self.store.GetDataTable().metrics[0]))
+
+  def testReplacedFilesAreDeleted(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-02'),
+                   today=datetime.date(2011, 1, 2))
+    self.paginator.version = 2
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-02'),
+                   today=datetime.date(2011, 1, 20))
+
+    self.assertEquals(1, len(self.GetFiles('2011-01-01')))
+    self.assertEquals(1, len(self.GetFiles('2011-01-02')))
+    self.assertEquals([2, 2, 2, 2],
+                      list(self.store.GetDataTable().metrics[0]))
+
+  def testDifferentQueryIsRejected(self):
+    self.sync.Sync(GetQuery('2011-01-01', '2011-01-03'),
+                   today=datetime.date(2011, 1, 20))
+    self.assertRaises(incremental_sync.IncrementalSyncError, self.sync.Sync,
+                      GetQuery('2011-01-01', '2011-01-03', 'ga:medium'),
+                      today=datetime.date(2011, 1, 20))
+
+
+class TestFunctions(unittest.TestCase):
+
+  def testGetStaleDates(self):
+    partitions = {
+        '2011-01-01': {'rows': 5, 'synced': '2011-01-03'},
+        '2011-01-02': {'rows': 5, 'synced': '2011-01-03'}}
+    self.assertEquals(
+        ['2011-01-02', '2011-01-03'],
+        incremental_sync.GetStaleDates('2011-01-01', '2011-01-05',
+                                       partitions, datetime.date(2011, 1, 3)))
+
+  def testGetDateRanges(self):
+    self.assertEquals(
+        [('2011-01-30', '2011-02-01'), ('2011-02-03', '2011-02-03')],
+        incremental_sync.GetDateRanges(['2011-01-30', '2011-01-31',
+                                        '2011-02-01', '2011-02-03']))
+    self.assertEquals([], incremental_sync.GetDateRanges([]))
+
+  def testAddDateDimension(self):
+    self.assertEquals(['ga:date', 'ga:source'],
+                      incremental_sync.AddDateDimension('ga:source'))
+    self.assertEquals(['ga:source', 'ga:date'],
+                      incremental_sync.AddDateDimension('ga:source,ga:date'))
+    self.assertEquals(['ga:date'], incremental_sync.AddDateDimension(None))
+    self.assertRaises(incremental_sync.IncrementalSyncError,
+                      incremental_sync.AddDateDimension,
+                      ','.join('ga:customVarValue%d' % i for i in range(7)))
+
+
+if __name__ == '__main__':
+  unittest.main()
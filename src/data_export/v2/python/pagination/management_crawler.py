@@ -0,0 +1,521 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Lists every account, web property, profile, goal and segment of a user.
+
+The Management API has one feed per level of the hierarchy. Each feed
+accepts ~all in place of the ids of the levels above it, so the whole
+hierarchy takes one request per feed and per page of 1,000 entries, however
+many accounts the user has. The ManagementCrawler makes these requests
+concurrently, parses each response with expat and links the entries into a
+ManagementTree by their ids.
+
+The tree can be saved to a cache file and is reused until its time to live
+expires, so the table ids of a large organisation are available at once to
+drive bulk exports.
+
+Usage:
+  crawler = management_crawler.ManagementCrawler(
+      my_client, cache_file='management.json')
+  tree = crawler.GetTree()
+  jobs = bulk_export.GetExportJobs(tree.GetTableIds(), QUERIES)
+
+  ManagementCrawler: Crawls the Management API feeds concurrently.
+  ManagementTree: The entries of every feed, linked by their ids.
+  ParseManagementFeed(): Parses a Management API response.
+  ManagementFeedParser: Incremental parser for the Management API feeds.
+  ManagementPage: The entries of one page of a Management API feed.
+  ManagementCrawlerError: Raised when a feed can not be retrieved.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import json
+from multiprocessing import pool
+import re
+import time
+from xml.parsers import expat
+
+import atomic_file
+import gdata.analytics.client
+import gdata.client
+
+
+ATOM_NS = 'http://www.w3.org/2005/Atom'
+DXP_NS = 'http://schemas.google.com/analytics/2009'
+GA_NS = 'http://schemas.google.com/ga/2009'
+
+ACCOUNTS = 'accounts'
+WEB_PROPERTIES = 'webproperties'
+PROFILES = 'profiles'
+GOALS = 'goals'
+SEGMENTS = 'segments'
+
+# The feeds in the order of the hierarchy. Segments belong to the user.
+FEEDS = (ACCOUNTS, WEB_PROPERTIES, PROFILES, GOALS, SEGMENTS)
+
+# Element names as reported by expat, with a space between the namespace and
+# the local name. The feeds use an older openSearch namespace than the Data
+# Feed, so those elements are matched by their local name.
+_ENTRY = ATOM_NS + ' entry'
+_ID = ATOM_NS + ' id'
+_PROPERTY = DXP_NS + ' property'
+_SEGMENT = DXP_NS + ' segment'
+_DEFINITION = DXP_NS + ' definition'
+_GOAL = GA_NS + ' goal'
+_DESTINATION = GA_NS + ' destination'
+_TOTAL_RESULTS = ' totalResults'
+_START_INDEX = ' startIndex'
+_ITEMS_PER_PAGE = ' itemsPerPage'
+
+_FEED_TEXT_ELEMENTS = frozenset([_TOTAL_RESULTS, _START_INDEX,
+                                 _ITEMS_PER_PAGE])
+_ENTRY_TEXT_ELEMENTS = frozenset([_ID, _DEFINITION])
+
+# Matches the ids of the parents of an entry in its atom:id.
+_PARENT_IDS = re.compile(
+    r'/accounts/([^/]+)(?:/webproperties/([^/]+))?(?:/profiles/([^/]+))?')
+
+READ_SIZE = 64 * 1024
+
+
+class ManagementCrawler(object):
+  """Crawls the Management API feeds concurrently.
+
+  Attributes:
+    DEFAULT_NUM_WORKERS: int The default number of requests made at the same
+        time.
+    DEFAULT_TTL: int The default number of seconds a cached tree is used.
+    MAX_RESULTS: int The number of entries requested per page.
+  """
+
+  DEFAULT_NUM_WORKERS = 8
+  DEFAULT_TTL = 24 * 60 * 60
+  MAX_RESULTS = 1000
+
+  def __init__(self, my_client, num_workers=DEFAULT_NUM_WORKERS,
+               scheduler=None, cache_file=None, ttl=DEFAULT_TTL):
+    """Initializes this class.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient An authorized client.
+      num_workers: int The number of requests made at the same time.
+      scheduler: request_scheduler.RequestScheduler (optional) Rate limits
+          and retries the requests.
+      cache_file: string (optional) The file the tree is saved to and loaded
+          from.
+      ttl: int The number of seconds a saved tree is used before the feeds
+          are crawled again.
+    """
+    self.my_client = my_client
+    self.num_workers = num_workers
+    self.scheduler = scheduler
+    self.cache_file = cache_file
+    self.ttl = ttl
+
+  def GetTree(self, account_ids=None, refresh=False):
+    """Returns the tree from the cache file, or crawls and saves it.
+
+    Args:
+      account_ids: list of strings (optional) Only crawls these accounts.
+          Every account is crawled if not set.
+      refresh: boolean Whether to crawl even if the cached tree is fresh.
+
+    Returns:
+      ManagementTree The entries of every feed.
+
+    Raises:
+      ManagementCrawlerError: If a feed could not be retrieved.
+    """
+    if self.cache_file and not refresh:
+      tree = self.LoadTree(account_ids)
+      if tree:
+        return tree
+
+    tree = self.Crawl(account_ids)
+    if self.cache_file:
+      self.SaveTree(tree)
+    return tree
+
+  def Crawl(self, account_ids=None):
+    """Retrieves every page of every feed concurrently.
+
+    The first page of each feed is requested at once. The remaining pages,
+    known from the total results of the first, are requested next.
+
+    Args:
+      account_ids: list of strings (optional) Only crawls these accounts,
+          with one request per account for each feed below the accounts.
+          Every account is crawled with ~all if not set.
+
+    Returns:
+      ManagementTree The entries of every feed.
+
+    Raises:
+      ManagementCrawlerError: If a feed could not be retrieved.
+    """
+    if account_ids:
+      requests = [(ACCOUNTS, None), (SEGMENTS, None)]
+      requests += [(kind, account_id)
+                   for kind in (WEB_PROPERTIES, PROFILES, GOALS)
+                   for account_id in account_ids]
+    else:
+      requests = [(kind, None) for kind in FEEDS]
+
+    first_requests = [request + (1,) for request in requests]
+    workers = pool.ThreadPool(self.num_workers)
+    try:
+      first_pages = workers.map(self._GetPage, first_requests)
+
+      more_requests = []
+      for request, page in zip(requests, first_pages):
+        for start_index in xrange(1 + ManagementCrawler.MAX_RESULTS,
+                                  page.total_results + 1,
+                                  ManagementCrawler.MAX_RESULTS):
+          more_requests.append(request + (start_index,))
+      more_pages = workers.map(self._GetPage, more_requests)
+    finally:
+      workers.terminate()
+      workers.join()
+
+    tree = ManagementTree()
+    for (kind, _, _), page in zip(first_requests + more_requests,
+                                  first_pages + more_pages):
+      tree.AddEntries(kind, page.entry)
+
+    if account_ids:
+      tree.accounts = [account for account in tree.accounts
+                       if account.get('accountId') in account_ids]
+    tree.account_ids = account_ids and sorted(account_ids)
+    return tree
+
+  def GetQuery(self, kind, account_id=None, start_index=1):
+    """Returns the query of a page of a feed.
+
+    Args:
+      kind: string The feed, one of FEEDS.
+      account_id: string (optional) The account to list the entries of.
+          Defaults to ~all.
+      start_index: int The index of the first entry of the page.
+
+    Returns:
+      The gdata.analytics.client query of the page.
+    """
+    params = {'max-results': str(ManagementCrawler.MAX_RESULTS),
+              'start-index': str(start_index)}
+    account_id = account_id or '~all'
+    if kind == ACCOUNTS:
+      return gdata.analytics.client.AccountQuery(params)
+    if kind == WEB_PROPERTIES:
+      return gdata.analytics.client.WebPropertyQuery(account_id, params)
+    if kind == PROFILES:
+      return gdata.analytics.client.ProfileQuery(account_id, '~all', params)
+    if kind == GOALS:
+      return gdata.analytics.client.GoalQuery(account_id, '~all', '~all',
+                                              params)
+    return gdata.analytics.client.AdvSegQuery(params)
+
+  def LoadTree(self, account_ids=None):
+    """Returns the tree saved in the cache file if it is still fresh.
+
+    Args:
+      account_ids: list of strings (optional) The accounts the tree must have
+          been crawled for.
+
+    Returns:
+      ManagementTree The saved tree, or None if there is none, it expired or
+      it was crawled for other accounts.
+    """
+    try:
+      with open(self.cache_file) as cache:
+        saved = json.load(cache)
+      tree = ManagementTree.FromDict(saved)
+    except (IOError, ValueError, KeyError, TypeError):
+      return None
+
+    if time.time() - tree.created > self.ttl:
+      return None
+    if tree.account_ids != (account_ids and sorted(account_ids)):
+      return None
+    return tree
+
+  def SaveTree(self, tree):
+    """Atomically writes a tree to the cache file."""
+    atomic_file.WriteAtomically(self.cache_file, json.dumps(tree.ToDict()))
+
+  def _GetPage(self, request):
+    """Retrieves the page of a (kind, account_id, start_index) request."""
+    query = self.GetQuery(*request)
+    try:
+      if self.scheduler:
+        return self.scheduler.Execute(self._FetchPage, query)
+      return self._FetchPage(query)
+    except (gdata.client.Unauthorized, gdata.client.RequestError), error:
+      raise ManagementCrawlerError(
+          msg='There was an error with this query: %s\nError: %s' %
+          (query, error))
+
+  def _FetchPage(self, query):
+    """Retrieves and parses a page without error handling."""
+    return self.my_client.GetManagementFeed(query,
+                                            converter=ParseManagementFeed)
+
+
+class ManagementTree(object):
+  """The entries of every Management API feed, linked by their ids.
+
+  Each entry is a dict of its dxp:property values, named without their ga:
+  or dxp: prefix, such as accountId, profileName or tableId. Goals also have
+  the name, number, value, active and type of their ga:goal element and
+  segments the segmentId, name and definition of their dxp:segment element.
+  Every entry below the accounts has the ids of its parents.
+
+  Attributes:
+    accounts: list of dicts The entries of the Account Feed.
+    web_properties: list of dicts The entries of the Web Property Feed.
+    profiles: list of dicts The entries of the Profile Feed.
+    goals: list of dicts The entries of the Goal Feed.
+    segments: list of dicts The entries of the Advanced Segment Feed.
+    account_ids: list The accounts crawled, or None for every account.
+    created: float The time the tree was crawled.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.accounts = []
+    self.web_properties = []
+    self.profiles = []
+    self.goals = []
+    self.segments = []
+    self.account_ids = None
+    self.created = time.time()
+
+  def AddEntries(self, kind, entries):
+    """Adds the entries of a page of a feed.
+
+    Args:
+      kind: string The feed of the page, one of FEEDS.
+      entries: list of dicts The entries of the page.
+    """
+    self._GetEntries(kind).extend(entries)
+
+  def GetWebProperties(self, account_id=None):
+    """Returns the web properties of an account, or of every account."""
+    return _Filter(self.web_properties, accountId=account_id)
+
+  def GetProfiles(self, account_id=None, web_property_id=None):
+    """Returns the profiles of an account or web property, or every one."""
+    return _Filter(self.profiles, accountId=account_id,
+                   webPropertyId=web_property_id)
+
+  def GetGoals(self, profile_id=None):
+    """Returns the goals of a profile, or of every profile."""
+    return _Filter(self.goals, profileId=profile_id)
+
+  def GetTableIds(self, account_id=None, web_property_id=None):
+    """Returns the table ids of the profiles of an account or web property.
+
+    Args:
+      account_id: string (optional) Only returns the profiles of this account.
+      web_property_id: string (optional) Only returns the profiles of this
+          web property.
+
+    Returns:
+      list The table ids, such as ga:1174, to use in Data Feed queries.
+    """
+    return [profile['tableId'] for profile
+            in self.GetProfiles(account_id, web_property_id)
+            if 'tableId' in profile]
+
+  def ToDict(self):
+    """Returns the tree as a dict which can be saved as JSON."""
+    saved = dict((kind, self._GetEntries(kind)) for kind in FEEDS)
+    saved['account_ids'] = self.account_ids
+    saved['created'] = self.created
+    return saved
+
+  @classmethod
+  def FromDict(cls, saved):
+    """Returns the tree saved by ToDict."""
+    tree = cls()
+    for kind in FEEDS:
+      tree.AddEntries(kind, saved[kind])
+    tree.account_ids = saved['account_ids']
+    tree.created = saved['created']
+    return tree
+
+  def _GetEntries(self, kind):
+    """Returns the list of the entries of a feed."""
+    if kind == WEB_PROPERTIES:
+      return self.web_properties
+    return getattr(self, kind)
+
+
+def ParseManagementFeed(response):
+  """Parses a Management API response into a ManagementPage.
+
+  Args:
+    response: A file like object with the XML of a Management API feed,
+        usually the HTTP response of the API request.
+
+  Returns:
+    ManagementPage The entries of the response.
+  """
+  parser = ManagementFeedParser()
+  while True:
+    data = response.read(READ_SIZE)
+    if not data:
+      break
+    parser.Feed(data)
+  return parser.Close()
+
+
+class ManagementFeedParser(object):
+  """Incremental parser for the Management API feeds.
+
+  Only the ids, properties, goals and segments of each entry are kept.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.page = ManagementPage()
+    self.entry = None
+    self.text = None
+
+    self.parser = expat.ParserCreate(namespace_separator=' ')
+    self.parser.buffer_text = True
+    self.parser.StartElementHandler = self._StartElement
+    self.parser.EndElementHandler = self._EndElement
+
+  def Feed(self, data):
+    """Parses the next chunk of the response.
+
+    Args:
+      data: str The next bytes of the XML response.
+    """
+    self.parser.Parse(data, False)
+
+  def Close(self):
+    """Finishes parsing the response.
+
+    Returns:
+      ManagementPage The entries of the response.
+    """
+    self.parser.Parse('', True)
+    return self.page
+
+  def _StartElement(self, name, attrs):
+    """Stores the properties, goals and segments of each entry."""
+    if self.entry is not None:
+      if name == _PROPERTY:
+        self.entry[_StripPrefix(attrs['name'])] = attrs['value']
+      elif name == _GOAL:
+        self.entry['name'] = attrs.get('name')
+        self.entry['number'] = attrs.get('number')
+        self.entry['value'] = attrs.get('value')
+        self.entry['active'] = attrs.get('active') == 'true'
+        self.entry['type'] = 'engagement'
+      elif name == _DESTINATION:
+        self.entry['type'] = 'destination'
+      elif name == _SEGMENT:
+        self.entry['segmentId'] = attrs.get('id')
+        self.entry['name'] = attrs.get('name')
+      elif name in _ENTRY_TEXT_ELEMENTS:
+        self._StartText()
+    elif name == _ENTRY:
+      self.entry = {}
+    elif name[name.find(' '):] in _FEED_TEXT_ELEMENTS:
+      self._StartText()
+
+  def _EndElement(self, name):
+    """Stores each entry and the text of the feed elements."""
+    if name == _ENTRY:
+      self.page.entry.append(self.entry)
+      self.entry = None
+      return
+    if self.text is None:
+      return
+
+    text = ''.join(self.text).strip()
+    self.text = None
+    self.parser.CharacterDataHandler = None
+    if name == _ID:
+      _AddParentIds(self.entry, text)
+    elif name == _DEFINITION:
+      self.entry['definition'] = text
+    elif name.endswith(_TOTAL_RESULTS):
+      self.page.total_results = int(text)
+    elif name.endswith(_START_INDEX):
+      self.page.start_index = int(text)
+    elif name.endswith(_ITEMS_PER_PAGE):
+      self.page.items_per_page = int(text)
+
+  def _StartText(self):
+    """Collects the text of the current element."""
+    self.text = []
+    self.parser.CharacterDataHandler = self.text.append
+
+
+class ManagementPage(object):
+  """The entries of one page of a Management API feed.
+
+  Attributes:
+    total_results: int The openSearch:totalResults of the feed.
+    start_index: int The openSearch:startIndex of the feed.
+    items_per_page: int The openSearch:itemsPerPage of the feed.
+    entry: list of dicts The values of each entry.
+  """
+
+  def __init__(self):
+    """Initializes this class."""
+    self.total_results = 0
+    self.start_index = None
+    self.items_per_page = None
+    self.entry = []
+
+
+class ManagementCrawlerError(Exception):
+  """Raised when a Management API feed can not be retrieved."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _StripPrefix(name):
+  """Returns a property name without its ga: or dxp: prefix."""
+  return name[name.find(':') + 1:]
+
+
+def _AddParentIds(entry, entry_id):
+  """Adds the ids of the parents found in the atom:id of an entry."""
+  match = _PARENT_IDS.search(entry_id)
+  if not match:
+    return
+  for key, value in zip(('accountId', 'webPropertyId', 'profileId'),
+                        match.groups()):
+    if value:
+      entry.setdefault(key, value)
+
+
+def _Filter(entries, **values):
+  """Returns the entries with the given values, ignoring None values."""
+  values = dict((key, value) for key, value in values.iteritems()
+                if value is not None)
+  return [entry for entry in entries
+          if all(entry.get(key) == value for key, value in values.iteritems())]
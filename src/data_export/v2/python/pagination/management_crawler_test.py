@@ -0,0 +1,244 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for management_crawler.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import gdata.client
+import management_crawler
+
+
+BASE_URI = 'https://www.google.com/analytics/feeds/datasources/ga'
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns='http://www.w3.org/2005/Atom'
+    xmlns:dxp='http://schemas.google.com/analytics/2009'
+    xmlns:ga='http://schemas.google.com/ga/2009'
+    xmlns:openSearch='http://a9.com/-/spec/opensearchrss/1.0/'>
+  <id>%s</id>
+  <openSearch:totalResults>%d</openSearch:totalResults>
+  <openSearch:startIndex>%d</openSearch:startIndex>
+  <openSearch:itemsPerPage>1000</openSearch:itemsPerPage>
+%s</feed>
+"""
+
+ACCOUNT = """<entry><id>%(base)s/accounts/%(account)s</id>
+<dxp:property name='ga:accountId' value='%(account)s'/>
+<dxp:property name='ga:accountName' value='Account %(account)s'/></entry>
+"""
+
+WEB_PROPERTY = """<entry>
+<id>%(base)s/accounts/%(account)s/webproperties/UA-%(account)s-1</id>
+<dxp:property name='ga:accountId' value='%(account)s'/>
+<dxp:property name='ga:webPropertyId' value='UA-%(account)s-1'/></entry>
+"""
+
+PROFILE = """<entry>
+<id>%(base)s/accounts/%(account)s/webproperties/UA-%(account)s-1/profiles/%(profile)d</id>
+<dxp:property name='ga:accountId' value='%(account)s'/>
+<dxp:property name='ga:webPropertyId' value='UA-%(account)s-1'/>
+<dxp:property name='ga:profileName' value='Profile &amp; %(profile)d'/>
+<dxp:property name='ga:profileId' value='%(profile)d'/>
+<dxp:property name='dxp:tableId' value='ga:%(profile)d'/></entry>
+"""
+
+GOAL = """<entry>
+<id>%(base)s/accounts/%(account)s/webproperties/UA-%(account)s-1/profiles/%(profile)d/goals/1</id>
+<ga:goal active='true' name='Order' number='1' value='10.0'>
+<ga:destination expression='/thanks' matchType='head'/></ga:goal>
+<dxp:property name='ga:profileId' value='%(profile)d'/></entry>
+"""
+
+SEGMENT = """<entry><id>%(base)s/segments/gaid::-1</id>
+<dxp:segment id='gaid::-1' name='All Visits'>
+<dxp:definition>ga:visits&gt;0</dxp:definition></dxp:segment></entry>
+"""
+
+
+class MockClient(object):
+  """Serves Management API feeds for accounts of 1,250 profiles each."""
+
+  PROFILES_PER_ACCOUNT = 1250
+
+  def __init__(self, account_ids, error=None):
+    self.account_ids = account_ids
+    self.error = error
+    self.lock = threading.Lock()
+    self.paths = []
+
+  def GetManagementFeed(self, query, converter=None):
+    with self.lock:
+      self.paths.append((query.path, int(query.query['start-index'])))
+    if self.error:
+      raise self.error
+
+    entries = []
+    for values in self.GetEntryValues(query.path):
+      template = values.pop('template')
+      values['base'] = BASE_URI
+      entries.append(template % values)
+
+    start_index = int(query.query['start-index'])
+    max_results = int(query.query['max-results'])
+    page = entries[start_index - 1:start_index - 1 + max_results]
+    body = FEED % (BASE_URI + query.path, len(entries), start_index,
+                   ''.join(page))
+    return converter(cStringIO.StringIO(body))
+
+  def GetEntryValues(self, path):
+    """Returns the values of the entries of a feed, one dict per entry."""
+    if path.endswith('/segments'):
+      return [{'template': SEGMENT}]
+    if path.endswith('/accounts'):
+      return [{'template': ACCOUNT, 'account': account_id}
+              for account_id in self.account_ids]
+
+    account_id = path.split('/')[6]
+    account_ids = self.account_ids if account_id == '~all' else [account_id]
+    if path.endswith('/webproperties'):
+      return [{'template': WEB_PROPERTY, 'account': account_id}
+              for account_id in account_ids]
+
+    template = GOAL if path.endswith('/goals') else PROFILE
+    return [{'template': template, 'account': account_id,
+             'profile': int(account_id) * 10000 + profile}
+            for account_id in account_ids
+            for profile in range(MockClient.PROFILES_PER_ACCOUNT)]
+
+
+class TestManagementCrawler(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.cache_file = os.path.join(self.temp_dir, 'management.json')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def testCrawl(self):
+    my_client = MockClient(['1', '2'])
+    crawler = management_crawler.ManagementCrawler(my_client)
+    tree = crawler.Crawl()
+
+    self.assertEqual(2, len(tree.accounts))
+    self.assertEqual(2, len(tree.web_properties))
+    self.assertEqual(2500, len(tree.profiles))
+    self.assertEqual(2500, len(tree.goals))
+    self.assertEqual(1, len(tree.segments))
+    # One request per feed, plus two more pages of profiles and goals.
+    self.assertEqual(9, len(my_client.paths))
+
+    profile = tree.profiles[0]
+    self.assertEqual('1', profile['accountId'])
+    self.assertEqual('UA-1-1', profile['webPropertyId'])
+    self.assertEqual('Profile & 10000', profile['profileName'])
+    self.assertEqual('ga:10000', profile['tableId'])
+
+    goal = tree.GetGoals('10001')[0]
+    self.assertEqual('1', goal['accountId'])
+    self.assertEqual('UA-1-1', goal['webPropertyId'])
+    self.assertEqual('Order', goal['name'])
+    self.assertEqual('destination', goal['type'])
+    self.assertTrue(goal['active'])
+
+    segment = tree.segments[0]
+    self.assertEqual('gaid::-1', segment['segmentId'])
+    self.assertEqual('ga:visits>0', segment['definition'])
+
+  def testGetTableIds(self):
+    crawler = management_crawler.ManagementCrawler(MockClient(['1', '2']))
+    tree = crawler.Crawl()
+
+    self.assertEqual(2500, len(tree.GetTableIds()))
+    table_ids = tree.GetTableIds(account_id='2')
+    self.assertEqual(1250, len(table_ids))
+    self.assertEqual('ga:20000', table_ids[0])
+    self.assertEqual([], tree.GetTableIds(web_property_id='UA-3-1'))
+
+  def testCrawlAccounts(self):
+    my_client = MockClient(['1', '2', '3'])
+    crawler = management_crawler.ManagementCrawler(my_client)
+    tree = crawler.Crawl(['3'])
+
+    self.assertEqual(['3'], [account['accountId']
+                             for account in tree.accounts])
+    self.assertEqual(1250, len(tree.profiles))
+    self.assertTrue(('/analytics/feeds/datasources/ga/accounts/3/webproperties'
+                     '/~all/profiles', 1001) in my_client.paths)
+
+  def testCache(self):
+    my_client = MockClient(['1'])
+    crawler = management_crawler.ManagementCrawler(
+        my_client, cache_file=self.cache_file)
+    tree = crawler.GetTree()
+    num_requests = len(my_client.paths)
+
+    cached = crawler.GetTree()
+    self.assertEqual(num_requests, len(my_client.paths))
+    self.assertEqual(tree.GetTableIds(), cached.GetTableIds())
+    self.assertEqual(tree.goals, cached.goals)
+
+    crawler.GetTree(refresh=True)
+    self.assertEqual(2 * num_requests, len(my_client.paths))
+
+  def testCacheExpires(self):
+    my_client = MockClient(['1'])
+    crawler = management_crawler.ManagementCrawler(
+        my_client, cache_file=self.cache_file, ttl=60)
+    tree = crawler.Crawl()
+    tree.created = time.time() - 120
+    crawler.SaveTree(tree)
+
+    self.assertEqual(None, crawler.LoadTree())
+    crawler.GetTree()
+    self.assertTrue(crawler.LoadTree())
+
+  def testCacheOfOtherAccounts(self):
+    crawler = management_crawler.ManagementCrawler(
+        MockClient(['1', '2']), cache_file=self.cache_file)
+    crawler.GetTree(['1'])
+
+    self.assertTrue(crawler.LoadTree(['1']))
+    self.assertEqual(None, crawler.LoadTree())
+    self.assertEqual(None, crawler.LoadTree(['2']))
+
+  def testCorruptCache(self):
+    with open(self.cache_file, 'w') as cache:
+      cache.write('{"accounts": [')
+    crawler = management_crawler.ManagementCrawler(
+        MockClient(['1']), cache_file=self.cache_file)
+
+    self.assertEqual(None, crawler.LoadTree())
+    self.assertEqual(1, len(crawler.GetTree().accounts))
+
+  def testError(self):
+    error = gdata.client.RequestError('Forbidden')
+    crawler = management_crawler.ManagementCrawler(MockClient(['1'], error))
+
+    self.assertRaises(management_crawler.ManagementCrawlerError,
+                      crawler.Crawl)
+
+
+if __name__ == '__main__':
+  unittest.main()
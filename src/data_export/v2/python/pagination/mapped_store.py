@@ -0,0 +1,371 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides an export file which can be read at random with mmap.
+
+Unlike TSV, or the blocks of a columnar_file, each column of a mapped store
+is stored contiguously with a fixed width per row: integer metrics as 8 byte
+integers, other metrics as 8 byte floats and dimensions as 4 byte codes into
+a dictionary of their distinct values. The dictionary has an index of the
+offset of each value. So the position of any row of any column is computed
+rather than searched for, and opening a store only reads its footer, no
+matter the size of the file.
+
+The MappedStoreSink spools each column to a temporary file while the pages
+arrive, then joins them into the store when it is closed.
+
+File layout, all numbers little endian:
+  MAGIC
+  Columns: the codes of each dimension, then the values of each metric,
+      each aligned to 8 bytes.
+  Dictionaries: for each dimension, the offsets of its values as 8 byte
+      integers, with one extra offset at the end, then the UTF-8 values.
+  Footer: a JSON object with the names, types and offsets of the columns.
+  Trailer: the offset of the footer as an 8 byte integer, then MAGIC.
+
+Usage:
+  printer = mapped_store.GetMappedStoreFilePrinter('my_output.gamap')
+  printer.OutputPages(paginator.GetDataPages(my_query, -1))
+  printer.Close()
+
+  store = mapped_store.MappedStore('my_output.gamap')
+  visits = store.GetMetric('ga:visits', 2000000, 2010000)
+  rows = store.GetRows(2000000, 2010000)
+
+  GetMappedStoreFilePrinter(): Returns an object to output to a mapped store.
+  MappedStoreSink: Writes the rows of each page to a mapped store.
+  MappedStore: Reads columns and rows of a mapped store with mmap.
+  MappedStoreError: Raised when a file is not a valid mapped store.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+
+import data_table
+import feed_printer
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+MAGIC = 'GAMAP\x00\x01\n'
+
+# The struct format of each type of column.
+INTEGER_FORMAT = 'q'
+FLOAT_FORMAT = 'd'
+CODE_FORMAT = 'i'
+OFFSET_FORMAT = 'Q'
+
+_TRAILER = struct.Struct('<Q%ds' % len(MAGIC))
+_ALIGNMENT = 8
+
+
+def GetMappedStoreFilePrinter(file_name):
+  """Returns a Feed Printer object to output a mapped store to file_name.
+
+  Args:
+    file_name: string The name of the file to output to.
+
+  Returns:
+    The newly created FeedPrinter object.
+  """
+  return feed_printer.FeedPrinter(MappedStoreSink(file_name))
+
+
+class MappedStoreSink(feed_printer.Sink):
+  """Writes the rows of each page to a mapped store.
+
+  The file only appears under file_name, complete, once the sink is closed.
+  """
+
+  def __init__(self, file_name):
+    """Initializes the class.
+
+    Args:
+      file_name: string The name of the file to output to.
+    """
+    self.file_name = file_name
+    self.spool_dir = os.path.dirname(os.path.abspath(file_name))
+    self.dimension_names = []
+    self.metric_names = []
+    self.metric_types = []
+    self.dimensions = []
+    self.formats = []
+    self.spools = []
+    self.num_rows = 0
+
+  def WriteHeaders(self, dimension_names, metric_names, metric_types):
+    metric_types = list(metric_types)
+    metric_types += [None] * (len(metric_names) - len(metric_types))
+    self.dimension_names = list(dimension_names)
+    self.metric_names = list(metric_names)
+    self.metric_types = metric_types
+    self.dimensions = [data_table.DimensionColumn() for _ in dimension_names]
+    self.formats = ([CODE_FORMAT] * len(dimension_names) +
+                    [_GetFormat(metric_type) for metric_type in metric_types])
+    self.spools = [tempfile.TemporaryFile(dir=self.spool_dir)
+                   for _ in self.formats]
+
+  def WriteRows(self, rows):
+    if not rows:
+      return
+
+    columns = zip(*rows)
+    num_dims = len(self.dimensions)
+    for column, values in zip(self.dimensions, columns[:num_dims]):
+      column.Extend(values)
+    columns[:num_dims] = [column.codes for column in self.dimensions]
+
+    for spool, struct_format, values in zip(self.spools, self.formats,
+                                            columns):
+      if struct_format == INTEGER_FORMAT:
+        values = map(int, values)
+      elif struct_format == FLOAT_FORMAT:
+        values = map(float, values)
+      spool.write(struct.pack('<%d%s' % (len(values), struct_format), *values))
+
+    # Only the distinct values are kept in memory.
+    for column in self.dimensions:
+      del column.codes[:]
+    self.num_rows += len(rows)
+
+  def Close(self):
+    """Joins the spooled columns into the store."""
+    handle, temp_path = tempfile.mkstemp(dir=self.spool_dir, suffix='.tmp')
+    output = os.fdopen(handle, 'wb')
+    try:
+      output.write(MAGIC)
+      offsets = []
+      for spool in self.spools:
+        _Align(output)
+        offsets.append(output.tell())
+        spool.seek(0)
+        shutil.copyfileobj(spool, output)
+        spool.close()
+
+      num_dims = len(self.dimensions)
+      dimensions = []
+      for name, column, codes_offset in zip(self.dimension_names,
+                                            self.dimensions, offsets):
+        _Align(output)
+        dimensions.append({'name': name, 'codes_offset': codes_offset,
+                           'num_values': len(column.values),
+                           'offsets_offset': output.tell()})
+        values = [value.encode('utf-8') for value in column.values]
+        value_offsets = [0]
+        for value in values:
+          value_offsets.append(value_offsets[-1] + len(value))
+        output.write(struct.pack('<%d%s' % (len(value_offsets), OFFSET_FORMAT),
+                                 *value_offsets))
+        output.write(''.join(values))
+
+      metrics = [{'name': name, 'type': metric_type, 'format': struct_format,
+                  'offset': offset}
+                 for name, metric_type, struct_format, offset
+                 in zip(self.metric_names, self.metric_types,
+                        self.formats[num_dims:], offsets[num_dims:])]
+
+      footer_offset = output.tell()
+      output.write(json.dumps({'num_rows': self.num_rows,
+                               'dimensions': dimensions,
+                               'metrics': metrics}))
+      output.write(_TRAILER.pack(footer_offset, MAGIC))
+      output.close()
+    except:
+      output.close()
+      os.remove(temp_path)
+      raise
+    os.rename(temp_path, self.file_name)
+
+
+class MappedStore(object):
+  """Reads the columns and rows of a mapped store with mmap.
+
+  Opening a store only reads its footer. Columns and rows are read from the
+  mapped file when requested, and only the requested range is read.
+
+  Attributes:
+    dimension_names: list The names of the dimensions, in column order.
+    metric_names: list The names of the metrics, in column order.
+    metric_types: list The type of each metric reported by the API.
+    num_rows: int The number of rows in the store.
+  """
+
+  def __init__(self, file_name):
+    """Opens a mapped store.
+
+    Args:
+      file_name: string The name of the file to open.
+
+    Raises:
+      MappedStoreError: If the file is not a valid mapped store.
+    """
+    store_file = open(file_name, 'rb')
+    try:
+      size = os.fstat(store_file.fileno()).st_size
+      if size < len(MAGIC) + _TRAILER.size:
+        raise MappedStoreError(msg='%s is not a mapped store.' % file_name)
+      self.map = mmap.mmap(store_file.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+      store_file.close()
+
+    footer_offset, magic = _TRAILER.unpack_from(self.map, size - _TRAILER.size)
+    if magic != MAGIC or self.map[:len(MAGIC)] != MAGIC:
+      self.Close()
+      raise MappedStoreError(msg='%s is not a mapped store.' % file_name)
+
+    footer = json.loads(self.map[footer_offset:size - _TRAILER.size])
+    self.num_rows = footer['num_rows']
+    self.dimensions = footer['dimensions']
+    self.metrics = footer['metrics']
+    self.dimension_names = [dim['name'] for dim in self.dimensions]
+    self.metric_names = [met['name'] for met in self.metrics]
+    self.metric_types = [met['type'] for met in self.metrics]
+    self.values = [{} for _ in self.dimensions]
+
+  def __len__(self):
+    return self.num_rows
+
+  def GetMetric(self, name, start=0, stop=None):
+    """Returns the values of a metric for a range of rows.
+
+    Args:
+      name: string The name of the metric.
+      start: int The position of the first row.
+      stop: int (optional) The position after the last row. Defaults to the
+          end of the store.
+
+    Returns:
+      A numpy.ndarray which reads the mapped file without copying it if NumPy
+      is installed. Otherwise a tuple of the values.
+    """
+    metric = self.metrics[self.metric_names.index(name)]
+    return self._ReadColumn(metric['offset'], metric['format'], start, stop)
+
+  def GetDimensionCodes(self, name, start=0, stop=None):
+    """Returns the dictionary codes of a dimension for a range of rows.
+
+    Args:
+      name: string The name of the dimension.
+      start: int The position of the first row.
+      stop: int (optional) The position after the last row. Defaults to the
+          end of the store.
+
+    Returns:
+      A numpy.ndarray or tuple of codes, as in GetMetric. Use
+      GetDimensionValue to get the value of a code.
+    """
+    dimension = self.dimensions[self.dimension_names.index(name)]
+    return self._ReadColumn(dimension['codes_offset'], CODE_FORMAT, start,
+                            stop)
+
+  def GetDimensionValue(self, name, code):
+    """Returns the value of a dimension with the dictionary code code."""
+    dim_index = self.dimension_names.index(name)
+    return self._GetValue(dim_index, code)
+
+  def GetRows(self, start=0, stop=None):
+    """Returns the values of a range of rows.
+
+    Args:
+      start: int The position of the first row.
+      stop: int (optional) The position after the last row. Defaults to the
+          end of the store.
+
+    Returns:
+      A list of tuples with the dimension values followed by the metric
+      values of each row.
+    """
+    columns = []
+    for dim_index, dimension in enumerate(self.dimensions):
+      codes = self._ReadColumn(dimension['codes_offset'], CODE_FORMAT, start,
+                               stop)
+      if numpy:
+        codes = codes.tolist()
+      columns.append([self._GetValue(dim_index, code) for code in codes])
+    for metric in self.metrics:
+      values = self._ReadColumn(metric['offset'], metric['format'], start, stop)
+      if numpy:
+        values = values.tolist()
+      columns.append(values)
+    return zip(*columns)
+
+  def Close(self):
+    """Unmaps the file."""
+    self.map.close()
+
+  def _ReadColumn(self, offset, struct_format, start, stop):
+    """Returns the values of a column for a range of rows."""
+    start, stop, _ = slice(start, stop).indices(self.num_rows)
+    count = max(0, stop - start)
+    item_size = struct.calcsize('<' + struct_format)
+    offset += start * item_size
+    if numpy:
+      return numpy.frombuffer(self.map, dtype='<' + struct_format, count=count,
+                              offset=offset)
+    return struct.unpack_from('<%d%s' % (count, struct_format), self.map,
+                              offset)
+
+  def _GetValue(self, dim_index, code):
+    """Returns the value of a dimension code, reading it once."""
+    values = self.values[dim_index]
+    value = values.get(code)
+    if value is None:
+      dimension = self.dimensions[dim_index]
+      if not 0 <= code < dimension['num_values']:
+        raise IndexError('Dimension code %d is out of range.' % code)
+      offsets_offset = dimension['offsets_offset']
+      begin, end = struct.unpack_from(
+          '<2' + OFFSET_FORMAT, self.map,
+          offsets_offset + code * struct.calcsize('<' + OFFSET_FORMAT))
+      values_offset = (offsets_offset + (dimension['num_values'] + 1) *
+                       struct.calcsize('<' + OFFSET_FORMAT))
+      value = self.map[values_offset + begin:
+                       values_offset + end].decode('utf-8')
+      values[code] = value
+    return value
+
+
+class MappedStoreError(Exception):
+  """Raised when a file is not a valid mapped store."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _GetFormat(metric_type):
+  """Returns the struct format used to store a type of metric."""
+  if data_table.GetTypecode(metric_type) == data_table.INTEGER_TYPECODE:
+    return INTEGER_FORMAT
+  return FLOAT_FORMAT
+
+
+def _Align(output):
+  """Pads output so the next write starts on an aligned offset."""
+  padding = -output.tell() % _ALIGNMENT
+  if padding:
+    output.write('\0' * padding)
@@ -0,0 +1,96 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for mapped_store.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import shutil
+import tempfile
+import unittest
+import feed_parser
+import mapped_store
+
+
+def GetPages(num_rows, page_size):
+  """Returns pages of ga:source, ga:visits and ga:bounceRate rows."""
+  pages = []
+  for start in range(0, num_rows, page_size):
+    page = feed_parser.DataPage()
+    page.dimension_names = ['ga:source']
+    page.metric_names = ['ga:visits', 'ga:bounceRate']
+    page.metric_types = ['integer', 'percent']
+    page.entry = [(u'source %d \xe9' % (i % 7), unicode(i), u'%d.5' % i)
+                  for i in range(start, min(start + page_size, num_rows))]
+    pages.append(page)
+  return pages
+
+
+class TestMappedStore(unittest.TestCase):
+
+  def setUp(self):
+    self.output_dir = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.output_dir, 'out.gamap')
+
+  def tearDown(self):
+    shutil.rmtree(self.output_dir)
+
+  def Write(self, pages):
+    printer = mapped_store.GetMappedStoreFilePrinter(self.file_name)
+    printer.OutputPages(pages)
+    printer.Close()
+    return mapped_store.MappedStore(self.file_name)
+
+  def testRandomAccess(self):
+    store = self.Write(GetPages(25000, 10000))
+    self.assertEqual(25000, len(store))
+    self.assertEqual(['ga:source'], store.dimension_names)
+    self.assertEqual(['integer', 'percent'], store.metric_types)
+
+    self.assertEqual(range(12000, 12010),
+                     list(store.GetMetric('ga:visits', 12000, 12010)))
+    self.assertEqual([24998.5, 24999.5],
+                     list(store.GetMetric('ga:bounceRate', 24998)))
+    self.assertEqual(25000, len(store.GetMetric('ga:visits')))
+
+    self.assertEqual([(u'source 0 \xe9', 19999, 19999.5),
+                      (u'source 1 \xe9', 20000, 20000.5)],
+                     store.GetRows(19999, 20001))
+    codes = store.GetDimensionCodes('ga:source', 0, 8)
+    self.assertEqual([0, 1, 2, 3, 4, 5, 6, 0], list(codes))
+    self.assertEqual(u'source 3 \xe9',
+                     store.GetDimensionValue('ga:source', codes[3]))
+    self.assertRaises(IndexError, store.GetDimensionValue, 'ga:source', 7)
+    self.assertEqual([], store.GetRows(30000, 30010))
+    store.Close()
+
+    self.assertEqual(['out.gamap'], os.listdir(self.output_dir))
+
+  def testEmpty(self):
+    store = self.Write([])
+    self.assertEqual(0, len(store))
+    self.assertEqual([], store.GetRows())
+    store.Close()
+
+  def testInvalidFile(self):
+    open(self.file_name, 'wb').write('not a mapped store' * 10)
+    self.assertRaises(mapped_store.MappedStoreError,
+                      mapped_store.MappedStore, self.file_name)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,347 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides a local stand-in for the Data Export API.
+
+The MockApiServer answers data feed requests for any dimensions and metrics
+with generated rows, in the same Atom and dxp format as
+v2/dataFeedResponse.xml. Every query matches total_results rows. The
+responses can be slowed down, made to fail at random and limited to a
+smaller page size, so paginators can be tested and benchmarked without
+making requests to the real API.
+
+Row i of a query, counting from 1, has the value NAME-(i * (d + 7) %
+cardinality) for its d-th dimension and i * (m + 1) for its m-th metric,
+divided by 100 for metrics which are not integers.
+
+Usage:
+  server = mock_api_server.MockApiServer(total_results=100000, latency=0.2)
+  server.Start()
+  my_client = server.GetClient()
+  paginator = pagination.AutoPaginator(my_client, None)
+  ...
+  server.Stop()
+
+  MockApiServer: Serves generated data feeds from a local port.
+  MockHttpClient: Sends every request to a MockApiServer.
+  GetMetricType(): Returns the type the server reports for a metric.
+  GetDataFeedBody(): Returns the body of a generated data feed.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import BaseHTTPServer
+import cgi
+import cStringIO
+import gzip
+import random
+import SocketServer
+import threading
+import time
+import urlparse
+
+import atom.http_core
+import gdata.analytics.client
+import http_pool
+
+
+DATA_FEED_PATH = '/analytics/feeds/data'
+
+_FEED_HEADER = (
+    "<?xml version='1.0' encoding='UTF-8'?>\n"
+    "<feed xmlns='http://www.w3.org/2005/Atom' "
+    "xmlns:dxp='http://schemas.google.com/analytics/2009' "
+    "xmlns:openSearch='http://a9.com/-/spec/opensearch/1.1/' "
+    "xmlns:gd='http://schemas.google.com/g/2005' "
+    "gd:etag='W/&quot;%(etag)s&quot;' gd:kind='analytics#data'>\n"
+    "<id>http://www.google.com/analytics/feeds/data?ids=%(ids)s</id>\n"
+    "<updated>2008-10-31T16:59:59.999-07:00</updated>\n"
+    "<title>Google Analytics Data for Profile %(profile)s</title>\n"
+    "<author><name>Google Analytics</name></author>\n"
+    "<generator version='1.0'>Google Analytics</generator>\n"
+    "<openSearch:totalResults>%(total_results)d</openSearch:totalResults>\n"
+    "<openSearch:startIndex>%(start_index)d</openSearch:startIndex>\n"
+    "<openSearch:itemsPerPage>%(items_per_page)d</openSearch:itemsPerPage>\n"
+    "<dxp:aggregates>%(aggregates)s</dxp:aggregates>\n"
+    "<dxp:containsSampledData>false</dxp:containsSampledData>\n"
+    "<dxp:dataSource><dxp:property name='ga:profileId' value='%(profile)s'/>"
+    "<dxp:tableId>%(ids)s</dxp:tableId>"
+    "<dxp:tableName>www.example.com</dxp:tableName></dxp:dataSource>\n"
+    "<dxp:endDate>%(end_date)s</dxp:endDate>\n"
+    "<dxp:startDate>%(start_date)s</dxp:startDate>\n")
+
+_ENTRY = (
+    "<entry gd:etag='W/&quot;C0UEQX47eSp7I2A9WxRWFEw.&quot;' "
+    "gd:kind='analytics#datarow'>\n"
+    "<id>http://www.google.com/analytics/feeds/data?ids=%s&amp;%s</id>\n"
+    "<updated>2008-10-30T17:00:00.001-07:00</updated>\n"
+    "<title>%s</title>\n"
+    "<link rel='alternate' type='text/html' "
+    "href='http://www.google.com/analytics'/>\n"
+    "%s%s</entry>\n")
+
+_DIMENSION = "<dxp:dimension name='%s' value='%s'/>\n"
+_METRIC = ("<dxp:metric confidenceInterval='0.0' name='%s' type='%s' "
+           "value='%s'/>\n")
+
+
+class MockApiServer(object):
+  """Serves generated data feeds from a local port.
+
+  Attributes:
+    DEFAULT_CARDINALITY: int The default number of distinct values of each
+        dimension.
+    port: int The port the server listens on, once started.
+    requests: int The number of data feed requests received.
+    errors: int The number of errors returned on purpose.
+  """
+
+  DEFAULT_CARDINALITY = 1000
+
+  def __init__(self, total_results=10000, latency=0, jitter=0, error_rate=0,
+               error_status=503, max_page_size=10000,
+               cardinality=DEFAULT_CARDINALITY, port=0, seed=None):
+    """Initializes this class.
+
+    Args:
+      total_results: int The number of rows every query matches.
+      latency: float The seconds to wait before each response.
+      jitter: float The most seconds added at random to latency.
+      error_rate: float The share of requests, from 0 to 1, which fail.
+      error_status: int The HTTP status of the failed requests.
+      max_page_size: int The most rows returned per page, whatever the
+          max-results of the query.
+      cardinality: int The number of distinct values of each dimension.
+      port: int The port to listen on. 0 picks a free port.
+      seed: (optional) The seed of the random latency and errors.
+    """
+    self.total_results = total_results
+    self.latency = latency
+    self.jitter = jitter
+    self.error_rate = error_rate
+    self.error_status = error_status
+    self.max_page_size = max_page_size
+    self.cardinality = cardinality
+    self.port = port
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    self.requests = 0
+    self.errors = 0
+    self.http_server = None
+    self.thread = None
+
+  def Start(self):
+    """Starts serving requests on a background thread."""
+    self.http_server = _HttpServer(('127.0.0.1', self.port), _RequestHandler)
+    self.http_server.mock = self
+    self.port = self.http_server.server_port
+    self.thread = threading.Thread(target=self.http_server.serve_forever,
+                                   args=(0.05,))
+    self.thread.daemon = True
+    self.thread.start()
+
+  def Stop(self):
+    """Stops serving requests."""
+    self.http_server.shutdown()
+    self.http_server.server_close()
+    self.thread.join()
+
+  def GetClient(self, app_name='MockApiServer', gzip=True):
+    """Returns a client which makes its requests to this server.
+
+    Args:
+      app_name: string The name of the application.
+      gzip: boolean Whether the client asks for gzipped responses.
+
+    Returns:
+      gdata.analytics.client.AnalyticsClient The client.
+    """
+    return gdata.analytics.client.AnalyticsClient(
+        source=app_name, http_client=MockHttpClient(self.port, gzip=gzip))
+
+  def GetResponse(self, path, params):
+    """Returns the status and body of the response to a request.
+
+    Args:
+      path: string The path of the request.
+      params: dict The query parameters of the request.
+
+    Returns:
+      A (status, body) tuple.
+    """
+    with self.lock:
+      self.requests += 1
+      delay = self.latency + self.random.uniform(0, self.jitter)
+      failed = self.random.random() < self.error_rate
+      if failed:
+        self.errors += 1
+    if delay:
+      time.sleep(delay)
+
+    if path != DATA_FEED_PATH:
+      return 404, 'Not Found'
+    if failed:
+      return self.error_status, (
+          "<errors xmlns='http://schemas.google.com/g/2005'><error>"
+          "<domain>GData</domain><code>backendError</code>"
+          "<internalReason>Mock error</internalReason></error></errors>")
+
+    start_index = int(params.get('start-index') or 1)
+    max_results = min(int(params.get('max-results') or 1000),
+                      self.max_page_size)
+    return 200, GetDataFeedBody(params, self.total_results, start_index,
+                                max_results, self.cardinality)
+
+
+class MockHttpClient(http_pool.PooledHttpClient):
+  """Sends every request to a MockApiServer on this machine."""
+
+  def __init__(self, port, **kwargs):
+    """Initializes this class.
+
+    Args:
+      port: int The port of the MockApiServer.
+      kwargs: The arguments of http_pool.PooledHttpClient.
+    """
+    http_pool.PooledHttpClient.__init__(self, **kwargs)
+    self.port = port
+
+  def _http_request(self, method, uri, headers=None, body_parts=None):
+    """Makes the request to the MockApiServer, whatever the host of uri."""
+    if isinstance(uri, (str, unicode)):
+      uri = atom.http_core.Uri.parse_uri(uri)
+    uri = atom.http_core.Uri(scheme='http', host='127.0.0.1', port=self.port,
+                             path=uri.path, query=uri.query)
+    return http_pool.PooledHttpClient._http_request(self, method, uri, headers,
+                                                    body_parts)
+
+
+def GetMetricType(name):
+  """Returns the type the server reports for a metric.
+
+  Args:
+    name: string The name of the metric, such as ga:visits.
+
+  Returns:
+    string time, percent, currency or integer.
+  """
+  if name.startswith('ga:avg') and 'Time' in name:
+    return 'time'
+  if name.startswith('ga:avg') or name.endswith('Rate'):
+    return 'percent'
+  if name.endswith('Revenue') or name.endswith('Value'):
+    return 'currency'
+  return 'integer'
+
+
+def GetDataFeedBody(params, total_results, start_index, max_results,
+                    cardinality=MockApiServer.DEFAULT_CARDINALITY):
+  """Returns the body of a generated data feed.
+
+  Args:
+    params: dict The query parameters, with at least ids and metrics.
+    total_results: int The number of rows the query matches.
+    start_index: int The index of the first row of the page, from 1.
+    max_results: int The most rows in the page.
+    cardinality: int The number of distinct values of each dimension.
+
+  Returns:
+    str The Atom XML of the page.
+  """
+  ids = params.get('ids', 'ga:0')
+  dimension_names = [name for name in params.get('dimensions', '').split(',')
+                     if name]
+  metric_names = [name for name in params.get('metrics', '').split(',')
+                  if name]
+  metric_types = [GetMetricType(name) for name in metric_names]
+  end_index = min(start_index + max_results, total_results + 1)
+
+  # The sum of i * (m + 1) over every row.
+  row_sum = total_results * (total_results + 1) // 2
+  aggregates = ''.join(
+      _METRIC % (name, metric_type,
+                 _FormatMetric(row_sum * (m + 1), metric_type))
+      for m, (name, metric_type) in enumerate(zip(metric_names, metric_types)))
+
+  chunks = [_FEED_HEADER % {
+      'etag': 'mock%d' % total_results, 'ids': ids, 'profile': ids[3:],
+      'total_results': total_results, 'start_index': start_index,
+      'items_per_page': max(0, end_index - start_index),
+      'aggregates': aggregates,
+      'start_date': params.get('start-date', ''),
+      'end_date': params.get('end-date', '')}]
+
+  short_names = [name[3:] for name in dimension_names]
+  for i in xrange(start_index, end_index):
+    values = ['%s-%d' % (short_name, i * (d + 7) % cardinality)
+              for d, short_name in enumerate(short_names)]
+    pairs = ['%s=%s' % pair for pair in zip(dimension_names, values)]
+    chunks.append(_ENTRY % (
+        ids, '&amp;'.join(pairs), ' | '.join(pairs),
+        ''.join(_DIMENSION % pair for pair in zip(dimension_names, values)),
+        ''.join(_METRIC % (name, metric_type,
+                           _FormatMetric(i * (m + 1), metric_type))
+                for m, (name, metric_type)
+                in enumerate(zip(metric_names, metric_types)))))
+  chunks.append('</feed>\n')
+  return ''.join(chunks)
+
+
+def _FormatMetric(value, metric_type):
+  """Returns the text of a generated metric value."""
+  if metric_type == 'integer':
+    return str(value)
+  return repr(value / 100.0)
+
+
+class _HttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+  """Serves each connection on its own thread."""
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def handle_error(self, request, client_address):
+    # Clients may close a connection without reading the whole response.
+    pass
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+  """Answers requests with the responses of the MockApiServer."""
+
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    url = urlparse.urlparse(self.path)
+    params = dict((name, values[-1]) for name, values
+                  in cgi.parse_qs(url.query).iteritems())
+    status, body = self.server.mock.GetResponse(url.path, params)
+
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/atom+xml; charset=UTF-8')
+    if 'gzip' in (self.headers.getheader('Accept-Encoding') or ''):
+      buf = cStringIO.StringIO()
+      gzip_file = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=1)
+      gzip_file.write(body)
+      gzip_file.close()
+      body = buf.getvalue()
+      self.send_header('Content-Encoding', 'gzip')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
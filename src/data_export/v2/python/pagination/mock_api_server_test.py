@@ -0,0 +1,135 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for mock_api_server.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import unittest
+import feed_parser
+import gdata.analytics.client
+import mock_api_server
+import pagination
+
+
+def GetQuery(**params):
+  """Returns a data feed query for the source and medium of ga:1."""
+  query = {
+      'ids': 'ga:1',
+      'dimensions': 'ga:source,ga:medium',
+      'metrics': 'ga:visits,ga:bounceRate',
+      'start-date': '2011-01-01',
+      'end-date': '2011-01-31'}
+  query.update(params)
+  return gdata.analytics.client.DataFeedQuery(query)
+
+
+class TestMockApiServer(unittest.TestCase):
+
+  def setUp(self):
+    self.server = None
+    self.my_client = None
+
+  def tearDown(self):
+    if self.my_client:
+      self.my_client.http_client.Close()
+    if self.server:
+      self.server.Stop()
+
+  def StartServer(self, **kwargs):
+    """Starts a MockApiServer and returns a client of it."""
+    self.server = mock_api_server.MockApiServer(**kwargs)
+    self.server.Start()
+    self.my_client = self.server.GetClient()
+    return self.my_client
+
+  def testDataFeed(self):
+    my_client = self.StartServer(total_results=250)
+    feed = my_client.GetDataFeed(GetQuery(**{'max-results': '3'}))
+
+    self.assertEqual('250', feed.total_results.text)
+    self.assertEqual('1', feed.start_index.text)
+    self.assertEqual(3, len(feed.entry))
+    self.assertEqual('source-7', feed.entry[0].GetDimension('ga:source').value)
+    self.assertEqual('medium-8', feed.entry[0].GetDimension('ga:medium').value)
+    self.assertEqual('3', feed.entry[2].GetMetric('ga:visits').value)
+    self.assertEqual('0.06', feed.entry[2].GetMetric('ga:bounceRate').value)
+    self.assertEqual('percent', feed.entry[2].GetMetric('ga:bounceRate').type)
+    self.assertEqual('31375', feed.aggregates.GetMetric('ga:visits').value)
+
+  def testLastPage(self):
+    my_client = self.StartServer(total_results=250)
+    feed = my_client.GetDataFeed(GetQuery(**{'start-index': '201'}))
+
+    self.assertEqual(50, len(feed.entry))
+    self.assertEqual('250', feed.entry[-1].GetMetric('ga:visits').value)
+
+  def testMaxPageSize(self):
+    my_client = self.StartServer(total_results=250, max_page_size=100)
+    feed = my_client.GetDataFeed(GetQuery(**{'max-results': '1000'}))
+
+    self.assertEqual(100, len(feed.entry))
+    self.assertEqual('100', feed.items_per_page.text)
+
+  def testCardinality(self):
+    my_client = self.StartServer(total_results=100, cardinality=5)
+    feed = my_client.GetDataFeed(GetQuery())
+
+    sources = set(entry.GetDimension('ga:source').value
+                  for entry in feed.entry)
+    self.assertEqual(5, len(sources))
+
+  def testAutoPaginator(self):
+    my_client = self.StartServer(total_results=25000)
+    paginator = pagination.AutoPaginator(my_client, None, num_workers=3,
+                                         converter=feed_parser.ParseDataFeed)
+    rows = [row for page in paginator.GetDataPages(GetQuery(), -1)
+            for row in page.entry]
+
+    self.assertEqual(25000, len(rows))
+    self.assertEqual(3, self.server.requests)
+    self.assertEqual((u'source-0', u'medium-0', u'25000', u'500.0'), rows[-1])
+    self.assertTrue(my_client.http_client.bytes_received <
+                    my_client.http_client.bytes_decoded)
+
+  def testErrors(self):
+    my_client = self.StartServer(error_rate=1)
+    paginator = pagination.AutoPaginator(my_client, None)
+
+    self.assertRaises(pagination.AutoPaginatorError,
+                      paginator.GetDataFeed, GetQuery(), -1)
+    self.assertEqual(1, self.server.errors)
+
+  def testNotFound(self):
+    server = mock_api_server.MockApiServer()
+    status, _ = server.GetResponse('/analytics/feeds/accounts', {})
+    self.assertEqual(404, status)
+
+
+class TestGetMetricType(unittest.TestCase):
+
+  def testGetMetricType(self):
+    self.assertEqual('integer', mock_api_server.GetMetricType('ga:visits'))
+    self.assertEqual('percent',
+                     mock_api_server.GetMetricType('ga:visitBounceRate'))
+    self.assertEqual('time',
+                     mock_api_server.GetMetricType('ga:avgTimeOnSite'))
+    self.assertEqual('currency',
+                     mock_api_server.GetMetricType('ga:transactionRevenue'))
+
+
+if __name__ == '__main__':
+  unittest.main()
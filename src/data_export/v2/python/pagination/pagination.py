@@ -29,7 +29,14 @@ from __future__ import division
 __author__ = 'api.nickm@google.com (Nick Mihailovski)'
 
 
+import collections
+import functools
 import math
+from multiprocessing import pool
+
+import credential_pool
+import feed_parser
+import gdata.analytics.client
 import gdata.client
 
 
@@ -41,23 +48,49 @@ class AutoPaginator(object):
         in the query start-index parameter.
     DEFAULT_MAX_RESULTS: int The number of max_results returned by the Data
         Export API if no max_results query paramater is specified.
+    DEFAULT_NUM_WORKERS: int The number of pages fetched at the same time.
+        1 means each page is retrieved one after the other.
+    PROBE_MAX_RESULTS: int The max-results of the query made by Probe.
   """
 
   DEFAULT_START_INDEX = 1
   DEFAULT_MAX_RESULTS = 10000
+  DEFAULT_NUM_WORKERS = 1
+  PROBE_MAX_RESULTS = 1
 
-  def __init__(self, my_client, my_auth_helper, verbose=False):
+  def __init__(self, my_client, my_auth_helper, verbose=False,
+               num_workers=DEFAULT_NUM_WORKERS, converter=None, cache=None,
+               scheduler=None, metrics=None, probe=False):
     """initializes this class.
 
     Args:
       my_client: gdata.analytics.client.AnalyticsClient The main object to
           make requests to the API.
-      my_auth_helper: auth.AuthRoutine implementation.
+      my_auth_helper: auth.AuthRoutine implementation. None if my_client is
+          a credential_pool.CredentialPool.
       verbose: boolean Whether to print the queries that are being executed.
+      num_workers: int The number of pages to retrieve from the API at the
+          same time. Pages are still returned in order.
+      converter: function (optional) Converts each API response instead of
+          the gdata library, such as feed_parser.ParseDataFeed.
+      cache: response_cache.ResponseCache (optional) Where to save and reuse
+          the API responses.
+      scheduler: request_scheduler.RequestScheduler (optional) Rate limits
+          and retries the API requests.
+      metrics: export_metrics.ExportMetrics (optional) Records the latency,
+          size and retries of each page.
+      probe: boolean Whether GetDataPages first calls Probe, so that every
+          page, including the first one, is retrieved concurrently.
     """
     self.my_client = my_client
     self.my_auth_helper = my_auth_helper
     self.verbose = verbose
+    self.num_workers = num_workers
+    self.converter = converter
+    self.cache = cache
+    self.scheduler = scheduler
+    self.metrics = metrics
+    self.probe = probe
     self.start_index = None
     self.total_results = None
     self.max_pages = None
@@ -82,25 +115,164 @@ class AutoPaginator(object):
     Raises:
       AutoPaginatorError if an error occurs with the API request.
     """
+    pages = self.GetDataPages(query, num_pages)
+    feed = pages.next()
+    for page in pages:
+      feed.entry.extend(page.entry)
+
+    return feed
+
+  def GetDataPages(self, query, num_pages, header=None):
+    """Yields each page of the Data Feed results as it is retrieved.
+
+    Unlike GetDataFeed, the entries of each page are never merged into a
+    single feed, so only the pages being retrieved or consumed are held in
+    memory. The pagination attributes of this object are set once the first
+    page has been yielded.
+
+    Without a header, the first page is retrieved on its own to find the
+    number of pages. With a header, or if self.probe is set, every page is
+    known up front and retrieved by GetPages, so the first page no longer
+    delays the others.
+
+    Args:
+      query: gdata.analytics.client.DataQuery The query to pagniate.
+          The start-index is respected. The max-results will be overwritten to
+          the maximum number of results allowed by the API.
+      num_pages: int The number of pages to retrieve from the API.
+          if -1: return all pages in the result.
+          if >0: return a specific number of pages in the result.
+      header: feed_parser.DataPage (optional) The result of Probe for query.
+
+    Yields:
+      gdata.analytics.data.DataFeed One object per page, in page order.
+
+    Raises:
+      AutoPaginatorError if an error occurs with the API request.
+    """
+    if header is None and self.probe:
+      header = self.Probe(query)
+
+    if header is not None:
+      query.query['max-results'] = AutoPaginator.DEFAULT_MAX_RESULTS
+      self.SetPagination(query, header.total_results.text, num_pages)
+      # A query without results still returns its empty first page.
+      start_indicies = [self.start_index] + self.GetStartIndicies()
+      for page in self.GetPages(query, start_indicies):
+        yield page
+      return
+
     # Issue the first query to see how many results the API returns.
     query.query['max-results'] = AutoPaginator.DEFAULT_MAX_RESULTS
     feed = self.GetData(query)
 
     # Determine the number of pages we need to retrieve.
-    self.start_index = int(query.query.get('start-index') or
-                           AutoPaginator.DEFAULT_START_INDEX)
-    self.total_results = self.GetIndexedTotalResults(feed.total_results.text)
-    self.max_pages = self.GetMaxPages()
-    self.num_pages = self.DetermineNumPages(num_pages)
+    self.SetPagination(query, feed.total_results.text, num_pages)
+    yield feed
 
     # Retrieve the data for the remaining queries.
     start_indicies = self.GetStartIndicies()
-    for start_index in start_indicies:
-      query.query['start-index'] = str(start_index)
-      page = self.GetData(query)
-      feed.entry.extend(page.entry)
+    for page in self.GetPages(query, start_indicies):
+      yield page
 
-    return feed
+  def GetPages(self, query, start_indicies):
+    """Yields one page of data for each start index.
+
+    If self.num_workers is greater than 1, the pages are retrieved
+    concurrently by a pool of threads. Each page is requested with its own
+    copy of the query so the workers never share the start-index parameter.
+    At most self.num_workers pages are requested ahead of the page being
+    yielded, which bounds the number of pages held in memory.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to paginate.
+      start_indicies: list The start index of each page to retrieve.
+
+    Yields:
+      gdata.analytics.data.DataFeed One object per start index, in the same
+      order as start_indicies.
+
+    Raises:
+      AutoPaginatorError if an error occurs with any of the API requests.
+    """
+    page_queries = [self.GetPageQuery(query, start_index)
+                    for start_index in start_indicies]
+
+    if self.num_workers <= 1 or len(page_queries) <= 1:
+      for page_query in page_queries:
+        yield self.GetData(page_query)
+      return
+
+    workers = pool.ThreadPool(min(self.num_workers, len(page_queries)))
+    try:
+      pending = collections.deque()
+      for page_query in page_queries:
+        pending.append(workers.apply_async(self.GetData, (page_query,)))
+        if len(pending) > self.num_workers:
+          yield pending.popleft().get()
+
+      while pending:
+        yield pending.popleft().get()
+
+    finally:
+      workers.terminate()
+      workers.join()
+
+  def Probe(self, query):
+    """Retrieves the totals of a query without its rows.
+
+    A page of PROBE_MAX_RESULTS entries is requested and only its feed
+    elements are parsed, which is much cheaper than the first page of
+    DEFAULT_MAX_RESULTS entries.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to probe. It is
+          not modified.
+
+    Returns:
+      feed_parser.DataPage A page without entries, with the total_results,
+      aggregates and contains_sampled_data of the query.
+
+    Raises:
+      AutoPaginatorError if an error occurs with the API request.
+    """
+    probe_query = gdata.analytics.client.DataFeedQuery(dict(query.query))
+    probe_query.query['max-results'] = str(AutoPaginator.PROBE_MAX_RESULTS)
+    return self.GetData(probe_query, converter=feed_parser.ParseDataFeedHeader)
+
+  def GetPageQuery(self, query, start_index):
+    """Returns a copy of query that retrieves the page at start_index.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to copy.
+      start_index: int The start-index of the page.
+
+    Returns:
+      gdata.analytics.client.DataFeedQuery A new query object.
+    """
+    page_query = gdata.analytics.client.DataFeedQuery(dict(query.query))
+    page_query.query['start-index'] = str(start_index)
+    return page_query
+
+  def SetPagination(self, query, total_results, num_pages):
+    """Determines the pages to retrieve for query.
+
+    Sets the start_index, total_results, max_pages and num_pages attributes
+    used by GetStartIndicies.
+
+    Args:
+      query: gdata.analytics.client.DataQuery The query to pagniate.
+      total_results: str The total results the API found for the query.
+      num_pages: int The number of pages to retrieve specified by the user.
+
+    Raises:
+       AutoPaginatorError: if num_pages is invalid.
+    """
+    self.start_index = int(query.query.get('start-index') or
+                           AutoPaginator.DEFAULT_START_INDEX)
+    self.total_results = self.GetIndexedTotalResults(total_results)
+    self.max_pages = self.GetMaxPages()
+    self.num_pages = self.DetermineNumPages(num_pages)
 
   def GetIndexedTotalResults(self, total_results):
     """Returns the remaining results in the feed after the start-index.
@@ -163,31 +335,56 @@ class AutoPaginator(object):
 
     return start_indicies
 
-  def GetData(self, query):
+  def GetData(self, query, converter=None):
     """Retrieves data from the API and does exception handling.
 
     If self.verbose is set to True, this will print out each query being
     executed. If the auth token is invalid, it will be deleted and an exception
-    is raised.
+    is raised. If self.cache is set, the response is retrieved through it.
+    If self.scheduler is set, the request waits for the quota and retryable
+    errors are retried before an exception is raised. If self.metrics is set,
+    the page is measured and recorded there, whether it succeeds or fails.
 
     Args:
       query: gdata.analytics.client.DataFeedQuery The query to execute with the
           Google Analytics API.
+      converter: function (optional) Converts the response instead of
+          self.converter.
 
     Returns:
-      gdata.analytics.data.DataFeed The respose from the API.
+      gdata.analytics.data.DataFeed The respose from the API, or the result of
+      the converter if set.
 
     Raises:
-      AutoPaginatorError if the token is either invalid or there was an issue
-      with the API request.
+      AutoPaginatorError if the token is either invalid, there was an issue
+      with the API request or a credential_pool.CredentialPool has no
+      credentials left.
     """
     if self.verbose:
       print 'Executing query: %s\n' % query
 
+    page_metrics = None
+    if self.metrics:
+      page_metrics = self.metrics.StartPage(query)
+    fetch = functools.partial(self.FetchData, page_metrics=page_metrics,
+                              converter=converter)
+
     try:
-      return self.my_client.GetDataFeed(query)
+      try:
+        if self.scheduler:
+          feed = self.scheduler.Execute(fetch, query)
+        else:
+          feed = fetch(query)
+      except Exception, error:
+        if page_metrics:
+          page_metrics.Finish(error=error)
+        raise
 
     except gdata.client.Unauthorized, error:
+      # A credential_pool.CredentialPool deletes the token of each
+      # credential itself and has no auth helper.
+      if not self.my_auth_helper:
+        raise AutoPaginatorError(msg=str(error))
       self.my_auth_helper.DeleteAuthToken()
       raise AutoPaginatorError(msg='%s\nDeleted token file.' % error)
 
@@ -195,6 +392,38 @@ class AutoPaginator(object):
       raise AutoPaginatorError(msg=('There was a error with this query: %s\n'
                                     'Error: \%s') % (query, error))
 
+    except credential_pool.CredentialPoolError, error:
+      raise AutoPaginatorError(msg=error.msg)
+
+    if page_metrics:
+      page_metrics.Finish(feed)
+    return feed
+
+  def FetchData(self, query, page_metrics=None, converter=None):
+    """Retrieves data from the API or self.cache without error handling.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to execute with the
+          Google Analytics API.
+      page_metrics: export_metrics.PageMetrics (optional) Measures the
+          request.
+      converter: function (optional) Converts the response instead of
+          self.converter.
+
+    Returns:
+      gdata.analytics.data.DataFeed The respose from the API, or the result of
+      the converter if set.
+    """
+    converter = converter or self.converter
+    if self.cache:
+      # The cache measures its requests apart from the parse of the body.
+      return self.cache.GetDataFeed(self.my_client, query, converter,
+                                    page_metrics)
+
+    if page_metrics:
+      converter = page_metrics.StartAttempt(self.my_client, converter)
+    return self.my_client.GetDataFeed(query, converter=converter)
+
 
 class AutoPaginatorError(Exception):
   """An application specific Error."""
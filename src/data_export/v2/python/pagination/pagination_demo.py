@@ -25,6 +25,7 @@ Usage: Set your table id parameter in the TABLE_ID variable. Configure which
 
 APP_NAME: The name of this application.
 TABLE_ID: The Google Analytics Table ID from which to retrieve data.
+NUM_WORKERS: The number of pages to retrieve from the API at the same time.
 
   main(): The main logic of the application.
   GetAuthorizedClient(): Returns an authorized client object to make requests
@@ -39,14 +40,17 @@ __author__ = 'api.nickm@google.com (Nick Mihailovski)'
 
 import sys
 import auth
+import feed_parser
 import feed_printer
 import gdata.analytics.client
+import http_pool
 import pagination
 
 
 APP_NAME = 'AutoPaginator_Demo'
 TABLE_ID = 'ga:xxxxx'  # Insert your Table Id here.
 OUTPUT_FILE_NAME = 'my_output.tsv'
+NUM_WORKERS = 4
 
 
 def main():
@@ -54,27 +58,31 @@ def main():
   my_auth_helper = auth.AuthRoutineUtil()
   my_client = GetAuthorizedClient(my_auth_helper, APP_NAME)
 
-  paginator = pagination.AutoPaginator(my_client, my_auth_helper, verbose=True)
+  # Each page is parsed with the fast feed_parser instead of gdata.
+  paginator = pagination.AutoPaginator(my_client, my_auth_helper, verbose=True,
+                                       num_workers=NUM_WORKERS,
+                                       converter=feed_parser.ParseDataFeed)
 
   my_query = GetDataFeedQuery(TABLE_ID)
 
-  # Try to get all the pages avalaible in the query as one big feed object.
+  # Output all the pages avalaible in the query to a tsv file. Each page is
+  # written as soon as it is retrieved.
+  printer = feed_printer.GetTsvFilePrinter(OUTPUT_FILE_NAME)
   try:
-    feed = paginator.GetDataFeed(my_query, -1)
+    printer.OutputPages(paginator.GetDataPages(my_query, -1))
 
   except pagination.AutoPaginatorError, error:
     print error.msg
     sys.exit(1)
 
+  finally:
+    printer.Close()
+
   # Output some stats.
   print '\nTotal results found: %d' % paginator.total_results
   print ('Total pages needed, with one page per API request: %d\n'
          % paginator.num_pages)
 
-  # Output the results as a tsv file.
-  printer = feed_printer.GetTsvFilePrinter(OUTPUT_FILE_NAME)
-  printer.Output(feed)
-
 
 def GetAuthorizedClient(my_auth_helper, app_name):
   """Returns an authorized Google Analytics API client object.
@@ -91,7 +99,9 @@ def GetAuthorizedClient(my_auth_helper, app_name):
     gdata.analytics.client.AnalyticsClient An object which can be used to make
     Google Analytics API requests.
   """
-  my_client = gdata.analytics.client.AnalyticsClient(source=app_name)
+  # Pages are retrieved over reused, gzipped connections.
+  my_client = gdata.analytics.client.AnalyticsClient(
+      source=app_name, http_client=http_pool.PooledHttpClient())
   my_auth = auth.OAuthRoutine(my_client, my_auth_helper)
 
   try:
@@ -18,14 +18,101 @@
 __author__ = 'api.nickm@google.com (Nick Mihailovski)'
 
 
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
+import feed_parser
+import gdata.analytics.client
+import credential_pool
+import gdata.client
 import pagination
+import replay_transport
+
+
+DATA_FEED_FILE_NAME = os.path.join(os.path.dirname(__file__), '..', '..',
+                                   '..', '..', 'v2', 'dataFeedResponse.xml')
+
+
+class FakeTotalResults(object):
+  """Stands in for the openSearch:totalResults element of a feed."""
+
+  def __init__(self, text):
+    self.text = text
+
+
+class FakeFeed(object):
+  """Stands in for gdata.analytics.data.DataFeed."""
+
+  def __init__(self, total_results, entry):
+    self.total_results = FakeTotalResults(str(total_results))
+    self.entry = entry
+
+
+class FakeClient(object):
+  """Returns the start-index of each row as the entries of a fake feed.
+
+  Attributes:
+    total_results: int The number of results the fake query matches.
+    delay: float Seconds to wait before returning each page.
+    max_in_flight: int The most requests that were ever made at once.
+  """
+
+  def __init__(self, total_results, delay=0):
+    self.total_results = total_results
+    self.delay = delay
+    self.max_in_flight = 0
+    self.in_flight = 0
+    self.max_results = []
+    self.lock = threading.Lock()
+
+  def GetDataFeed(self, query, converter=None):
+    with self.lock:
+      self.max_results.append(str(query.query['max-results']))
+      self.in_flight += 1
+      self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    # Later pages return first so out-of-order completion is exercised.
+    start_index = int(query.query.get('start-index') or 1)
+    time.sleep(self.delay / (start_index // 10000 + 1))
+
+    with self.lock:
+      self.in_flight -= 1
+
+    end_index = min(start_index + int(query.query['max-results']),
+                    self.total_results + 1)
+    return FakeFeed(self.total_results, range(start_index, end_index))
+
+
+class CannedHttpClient(object):
+  """Returns the same response to every request."""
+
+  def __init__(self, status, body):
+    self.status = status
+    self.body = body
+
+  def request(self, http_request):
+    return replay_transport.ReplayResponse(
+        self.status, 'Canned', [('Content-Type', 'application/atom+xml')],
+        self.body)
+
+
+class FakeAuthHelper(object):
+  """Counts the calls to DeleteAuthToken."""
+
+  def __init__(self):
+    self.deleted = 0
+
+  def DeleteAuthToken(self):
+    self.deleted += 1
 
 
 class TestPaginator(unittest.TestCase):
 
   def testGetStartIndicies(self):
-    page = pagination.Paginator(None, None)
+    page = pagination.AutoPaginator(None, None)
     page.num_pages = 5
     page.start_index = 1
     indicies = page.GetStartIndicies()
@@ -41,7 +128,7 @@ class TestPaginator(unittest.TestCase):
     self.assertEqual(expected_indicies, indicies)
 
   def testDetermineNumPages(self):
-    page = pagination.Paginator(None, None)
+    page = pagination.AutoPaginator(None, None)
     page.max_pages = 10
 
     num_pages = page.DetermineNumPages(-1)
@@ -58,7 +145,7 @@ class TestPaginator(unittest.TestCase):
     self.assertEqual(1, num_pages)
 
   def testGetIndexedTotalResults(self):
-    page = pagination.Paginator(None, None)
+    page = pagination.AutoPaginator(None, None)
     page.start_index = 1
     total_results = page.GetIndexedTotalResults('20000')
     self.assertEqual(20000, total_results)
@@ -73,7 +160,7 @@ class TestPaginator(unittest.TestCase):
 
 
   def testGetMaxPages(self):
-    page = pagination.Paginator(None, None)
+    page = pagination.AutoPaginator(None, None)
     page.start_index = 1
     page.total_results = 100000
 
@@ -88,6 +175,165 @@ class TestPaginator(unittest.TestCase):
     self.assertEquals(1, page.GetMaxPages())
 
 
+class TestGetData(unittest.TestCase):
+  """Runs GetData through the gdata client on replayed responses."""
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.temp_dir, 'fixture.jsonl.gz')
+    self.query = gdata.analytics.client.DataFeedQuery({
+        'ids': 'ga:1',
+        'dimensions': 'ga:source,ga:medium',
+        'metrics': 'ga:visits,ga:bounces',
+        'start-date': '2011-01-01',
+        'end-date': '2011-01-31'})
+    self.auth_helper = FakeAuthHelper()
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def GetPaginator(self, status, body, converter=None):
+    """Records one response to the query and replays it to a paginator."""
+    recorder = replay_transport.RecordingHttpClient(
+        self.file_name, CannedHttpClient(status, body))
+    try:
+      gdata.analytics.client.AnalyticsClient(
+          source='test', http_client=recorder).GetDataFeed(self.query)
+    except gdata.client.Error:
+      pass
+    recorder.Close()
+
+    my_client = gdata.analytics.client.AnalyticsClient(
+        source='test',
+        http_client=replay_transport.ReplayHttpClient(self.file_name))
+    return pagination.AutoPaginator(my_client, self.auth_helper,
+                                    converter=converter)
+
+  def testGetData(self):
+    paginator = self.GetPaginator(200, open(DATA_FEED_FILE_NAME).read())
+    feed = paginator.GetData(self.query)
+
+    self.assertEqual('6451', feed.total_results.text)
+    self.assertEqual(5, len(feed.entry))
+    self.assertEqual('blogger.com',
+                     feed.entry[0].GetDimension('ga:source').value)
+
+  def testGetDataWithConverter(self):
+    paginator = self.GetPaginator(200, open(DATA_FEED_FILE_NAME).read(),
+                                  converter=feed_parser.ParseDataFeed)
+    page = paginator.GetData(self.query)
+
+    self.assertEqual(('blogger.com', 'referral', '68140', '61095'),
+                     page.entry[0])
+
+  def testUnauthorizedDeletesToken(self):
+    paginator = self.GetPaginator(401, 'Token invalid')
+    self.assertRaises(pagination.AutoPaginatorError, paginator.GetData,
+                      self.query)
+    self.assertEqual(1, self.auth_helper.deleted)
+
+  def testRequestError(self):
+    paginator = self.GetPaginator(400, 'Invalid dimension')
+    self.assertRaises(pagination.AutoPaginatorError, paginator.GetData,
+                      self.query)
+    self.assertEqual(0, self.auth_helper.deleted)
+
+
+class EmptyPoolClient(object):
+  """Fails like a credential_pool.CredentialPool with no credentials."""
+
+  def GetDataFeed(self, query, converter=None):
+    raise credential_pool.CredentialPoolError(
+        msg='The credential pool is empty.')
+
+
+class TestAutoPaginator(unittest.TestCase):
+
+  def testGetDataFeed(self):
+    my_client = FakeClient(45000)
+    paginator = pagination.AutoPaginator(my_client, None)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    feed = paginator.GetDataFeed(query, -1)
+    self.assertEqual(range(1, 45001), feed.entry)
+    self.assertEqual(5, paginator.num_pages)
+
+  def testEmptyCredentialPool(self):
+    paginator = pagination.AutoPaginator(EmptyPoolClient(), None)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    try:
+      paginator.GetData(query)
+      self.fail('AutoPaginatorError was not raised.')
+    except pagination.AutoPaginatorError, error:
+      self.assertEqual('The credential pool is empty.', error.msg)
+
+  def testGetDataFeedConcurrent(self):
+    my_client = FakeClient(45000, delay=0.05)
+    paginator = pagination.AutoPaginator(my_client, None, num_workers=4)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    feed = paginator.GetDataFeed(query, -1)
+    self.assertEqual(range(1, 45001), feed.entry)
+    self.assertTrue(my_client.max_in_flight > 1)
+
+    # The caller's query is never modified by the page requests.
+    self.assertFalse('start-index' in query.query)
+
+  def testGetDataPages(self):
+    my_client = FakeClient(25000, delay=0.05)
+    paginator = pagination.AutoPaginator(my_client, None, num_workers=2)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    pages = paginator.GetDataPages(query, -1)
+    self.assertEqual(range(1, 10001), pages.next().entry)
+    self.assertEqual(3, paginator.num_pages)
+    self.assertEqual([range(10001, 20001), range(20001, 25001)],
+                     [page.entry for page in pages])
+
+  def testProbe(self):
+    my_client = FakeClient(45000)
+    paginator = pagination.AutoPaginator(my_client, None)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    header = paginator.Probe(query)
+    self.assertEqual('45000', header.total_results.text)
+    self.assertEqual(['1'], my_client.max_results)
+    self.assertFalse('max-results' in query.query)
+
+  def testGetDataPagesWithProbe(self):
+    my_client = FakeClient(25000, delay=0.05)
+    paginator = pagination.AutoPaginator(my_client, None, num_workers=3,
+                                         probe=True)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    pages = list(paginator.GetDataPages(query, -1))
+    self.assertEqual([range(1, 10001), range(10001, 20001),
+                      range(20001, 25001)], [page.entry for page in pages])
+    self.assertEqual(['1', '10000', '10000', '10000'], my_client.max_results)
+    # The first page is retrieved along with the others.
+    self.assertEqual(3, my_client.max_in_flight)
+
+  def testGetDataPagesWithHeader(self):
+    my_client = FakeClient(0)
+    paginator = pagination.AutoPaginator(my_client, None)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    header = paginator.Probe(query)
+    pages = list(paginator.GetDataPages(query, -1, header=header))
+    self.assertEqual([[]], [page.entry for page in pages])
+    self.assertEqual(0, paginator.num_pages)
+
+  def testGetPageQuery(self):
+    paginator = pagination.AutoPaginator(None, None)
+    query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+    page_query = paginator.GetPageQuery(query, 10001)
+    self.assertEqual('10001', page_query.query['start-index'])
+    self.assertEqual('ga:1', page_query.query['ids'])
+    self.assertFalse('start-index' in query.query)
+
+
 if __name__ == '__main__':
   unittest.main()
 
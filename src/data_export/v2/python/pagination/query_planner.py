@@ -0,0 +1,386 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Merges Data Feed queries which only differ by their metrics.
+
+Reports often ask for the same profile, dates, dimensions, filters and
+segment and only differ in their metrics. The QueryPlanner groups such
+queries and merges their metrics into as few queries as the API limit of
+metrics per request allows. Each merged query is retrieved once, with every
+page, and its columns are split back out into one result per original query.
+Each page is split as soon as it is retrieved, so only the split rows are
+held in memory, never every row of the merged query.
+
+Identical merged queries already being retrieved by another thread for the
+same original metrics are not requested again: the second caller waits for
+the first result.
+
+The API leaves out rows whose metrics are all zero, so the rows which only
+have values for the metrics of other queries are left out of each split
+result too.
+
+Usage:
+  planner = query_planner.QueryPlanner(my_client, my_auth_helper)
+  visits, goals = planner.Execute([visits_query, goals_query])
+  printer.Output(visits)
+
+  QueryPlanner: Merges, retrieves and splits Data Feed queries.
+  MergedQuery: A query retrieved for several original queries.
+  GetGroupKey(): Returns the parameters of a query other than its metrics.
+  GetMetrics(): Returns the metric names of a query.
+  SplitPage(): Returns the columns of a page for some of its metrics.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import collections
+from multiprocessing import pool
+import threading
+
+import feed_parser
+import gdata.analytics.client
+import pagination
+
+
+# The most metrics the API accepts in one query.
+MAX_METRICS = 10
+
+# Parameters which do not change the rows of a query. The paginator sets
+# max-results itself.
+_IGNORED_PARAMS = frozenset(['metrics', 'max-results', 'prettyprint'])
+
+MergedQuery = collections.namedtuple('MergedQuery', 'query metrics indices')
+
+
+class QueryPlanner(object):
+  """Merges, retrieves and splits Data Feed queries.
+
+  Attributes:
+    queries: int The number of queries given to Execute.
+    fetches: int The number of merged queries retrieved.
+    coalesced: int The number of merged queries which waited for an
+        identical query already being retrieved.
+  """
+
+  def __init__(self, my_client, my_auth_helper, max_metrics=MAX_METRICS,
+               num_queries=1, **paginator_args):
+    """Initializes this class.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The object used to
+          make requests to the API.
+      my_auth_helper: auth.AuthRoutine implementation, or None if my_client
+          is a credential_pool.CredentialPool.
+      max_metrics: int The most metrics in a merged query.
+      num_queries: int The number of merged queries retrieved at the same
+          time.
+      paginator_args: The other arguments of each pagination.AutoPaginator,
+          such as num_workers, the number of pages of each merged query
+          retrieved at the same time, cache, scheduler or metrics. Responses
+          are always converted with feed_parser.ParseDataFeed.
+    """
+    self.my_client = my_client
+    self.my_auth_helper = my_auth_helper
+    self.max_metrics = max_metrics
+    self.num_queries = num_queries
+    self.paginator_args = paginator_args
+    self.lock = threading.Lock()
+    self.in_flight = {}
+
+    self.queries = 0
+    self.fetches = 0
+    self.coalesced = 0
+
+  def Execute(self, queries, num_pages=-1):
+    """Returns the result of each query, retrieving as few queries as needed.
+
+    Args:
+      queries: list of gdata.analytics.client.DataFeedQuery The queries.
+      num_pages: int The number of pages to retrieve per query, -1 for all.
+
+    Returns:
+      A list with one feed_parser.DataPage per query, in the same order, with
+      the rows of every page. Identical queries may share the same object.
+
+    Raises:
+      pagination.AutoPaginatorError: If a merged query fails.
+    """
+    with self.lock:
+      self.queries += len(queries)
+    merged_queries = self.Plan(queries)
+
+    if self.num_queries > 1 and len(merged_queries) > 1:
+      workers = pool.ThreadPool(min(self.num_queries, len(merged_queries)))
+      try:
+        splits = workers.map(
+            lambda merged: self._ExecuteMerged(merged, queries, num_pages),
+            merged_queries)
+      finally:
+        workers.terminate()
+        workers.join()
+    else:
+      splits = [self._ExecuteMerged(merged, queries, num_pages)
+                for merged in merged_queries]
+
+    results = [None] * len(queries)
+    for merged, pages in zip(merged_queries, splits):
+      for index, page in zip(merged.indices, pages):
+        results[index] = page
+    return results
+
+  def Plan(self, queries):
+    """Groups compatible queries and merges their metrics.
+
+    Within a group, the queries with the most metrics are placed first, each
+    in the first merged query with room for the metrics it does not already
+    have.
+
+    Args:
+      queries: list of gdata.analytics.client.DataFeedQuery The queries.
+
+    Returns:
+      A list of MergedQuery tuples, with the indices in queries of the
+      queries each one answers.
+    """
+    groups = collections.OrderedDict()
+    for index, query in enumerate(queries):
+      groups.setdefault(GetGroupKey(query), []).append(index)
+
+    merged_queries = []
+    for indices in groups.itervalues():
+      bins = []
+      for index in sorted(indices,
+                          key=lambda index: -len(GetMetrics(queries[index]))):
+        metrics = GetMetrics(queries[index])
+        for metric_names, bin_indices in bins:
+          new_metrics = [name for name in metrics if name not in metric_names]
+          if len(metric_names) + len(new_metrics) <= self.max_metrics:
+            metric_names.extend(new_metrics)
+            bin_indices.append(index)
+            break
+        else:
+          bins.append((list(metrics), [index]))
+
+      for metric_names, bin_indices in bins:
+        params = dict(queries[bin_indices[0]].query)
+        params['metrics'] = ','.join(metric_names)
+        merged_queries.append(MergedQuery(
+            gdata.analytics.client.DataFeedQuery(params), metric_names,
+            sorted(bin_indices)))
+    return merged_queries
+
+  def GetSplitPages(self, query, metric_lists, num_pages=-1):
+    """Returns the rows of a query split by metrics, sharing queries in flight.
+
+    The pages are retrieved with AutoPaginator.GetDataPages and each one is
+    split by SplitPage as soon as it arrives, then dropped.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query to retrieve.
+      metric_lists: list of list The metrics of each split, all in query.
+      num_pages: int The number of pages to retrieve, -1 for all.
+
+    Returns:
+      A list with one feed_parser.DataPage per metric list, with the rows of
+      every page.
+
+    Raises:
+      pagination.AutoPaginatorError: If the query fails.
+    """
+    key = (GetGroupKey(query), tuple(GetMetrics(query)),
+           tuple(tuple(metric_names) for metric_names in metric_lists),
+           num_pages)
+    with self.lock:
+      pending = self.in_flight.get(key)
+      owner = pending is None
+      if owner:
+        pending = _PendingPages()
+        self.in_flight[key] = pending
+        self.fetches += 1
+      else:
+        self.coalesced += 1
+
+    if not owner:
+      return pending.Wait()
+
+    try:
+      pending.Set(self._RetrieveSplitPages(query, metric_lists, num_pages))
+    except Exception, error:
+      pending.SetError(error)
+    finally:
+      with self.lock:
+        del self.in_flight[key]
+    return pending.Wait()
+
+  def _ExecuteMerged(self, merged, queries, num_pages):
+    """Returns the result of each query answered by a merged query."""
+    return self.GetSplitPages(
+        merged.query, [GetMetrics(queries[index]) for index in merged.indices],
+        num_pages)
+
+  def _RetrieveSplitPages(self, query, metric_lists, num_pages):
+    """Retrieves a query page by page and joins the splits of each page."""
+    paginator = pagination.AutoPaginator(
+        self.my_client, self.my_auth_helper,
+        converter=feed_parser.ParseDataFeed, **self.paginator_args)
+    splits = None
+    num_rows = 0
+    for page in paginator.GetDataPages(query, num_pages):
+      num_rows += len(page.entry)
+      page_splits = [SplitPage(page, metric_names)
+                     for metric_names in metric_lists]
+      if splits is None:
+        splits = page_splits
+        total_results = page.total_results
+      else:
+        for split, page_split in zip(splits, page_splits):
+          split.entry.extend(page_split.entry)
+
+    # Whether every row was retrieved is only known once every page is.
+    for split in splits:
+      split.total_results = _GetSplitTotal(total_results, num_rows,
+                                           len(split.entry))
+    return splits
+
+
+class _PendingPages(object):
+  """The result of a query being retrieved by another thread."""
+
+  def __init__(self):
+    """Initializes this class."""
+    self.event = threading.Event()
+    self.pages = None
+    self.error = None
+
+  def Set(self, pages):
+    """Stores the result and wakes up the waiting threads."""
+    self.pages = pages
+    self.event.set()
+
+  def SetError(self, error):
+    """Stores the error and wakes up the waiting threads."""
+    self.error = error
+    self.event.set()
+
+  def Wait(self):
+    """Returns the result once it is set, or raises its error."""
+    self.event.wait()
+    if self.error:
+      raise self.error
+    return self.pages
+
+
+def GetGroupKey(query):
+  """Returns the parameters of a query other than its metrics.
+
+  Queries with the same key return the same rows, so their metrics can be
+  requested together.
+
+  Args:
+    query: gdata.analytics.client.DataFeedQuery The query.
+
+  Returns:
+    tuple The sorted (name, value) pairs of the parameters.
+  """
+  return tuple(sorted((name, str(value))
+                      for name, value in query.query.iteritems()
+                      if name not in _IGNORED_PARAMS and value is not None))
+
+
+def GetMetrics(query):
+  """Returns the metric names of a query, without duplicates."""
+  metrics = []
+  for name in (query.query.get('metrics') or '').split(','):
+    name = name.strip()
+    if name and name not in metrics:
+      metrics.append(name)
+  return metrics
+
+
+def SplitPage(page, metric_names):
+  """Returns the columns of a page for some of its metrics.
+
+  Rows whose values for metric_names are all zero are left out, as the API
+  would have done had it been asked for metric_names only. A page without
+  dimensions always keeps its single row of totals.
+
+  The total_results of the split page is only lowered by the rows left out
+  when page holds every row of the query. Otherwise the rows which were not
+  retrieved can not be checked, so it is left as the total of the merged
+  query, which counts the rows whose values are all zero too.
+
+  Args:
+    page: feed_parser.DataPage The page of a merged query.
+    metric_names: list The metrics to keep, in the order to return them.
+
+  Returns:
+    feed_parser.DataPage A new page with the dimensions of page and the
+    metrics in metric_names.
+  """
+  split = feed_parser.DataPage()
+  split.etag = page.etag
+  split.start_index = page.start_index
+  split.items_per_page = page.items_per_page
+  split.contains_sampled_data = page.contains_sampled_data
+  split.dimension_names = list(page.dimension_names)
+  split.metric_names = list(metric_names)
+
+  aggregates = dict((metric.name, metric) for metric in page.aggregates)
+  split.aggregates = [aggregates[name] for name in metric_names
+                      if name in aggregates]
+
+  num_dims = len(page.dimension_names)
+  if page.metric_names:
+    columns = [num_dims + page.metric_names.index(name)
+               for name in metric_names]
+    split.metric_types = [page.metric_types[column - num_dims]
+                          for column in columns]
+  else:
+    # A page without rows does not know the names of its metrics.
+    columns = []
+    split.metric_types = [None] * len(metric_names)
+
+  if page.metric_names == metric_names or not num_dims:
+    split.entry = [row[:num_dims] + tuple(row[column] for column in columns)
+                   for row in page.entry]
+  else:
+    for row in page.entry:
+      values = tuple(row[column] for column in columns)
+      if any(_IsNonZero(value) for value in values):
+        split.entry.append(row[:num_dims] + values)
+
+  split.total_results = _GetSplitTotal(page.total_results, len(page.entry),
+                                       len(split.entry))
+  return split
+
+
+def _GetSplitTotal(total_results, num_rows, num_split_rows):
+  """Returns the total_results of a split of num_rows retrieved rows."""
+  if total_results is None:
+    return None
+  if num_split_rows == num_rows or num_rows < int(total_results.text):
+    return total_results
+  return feed_parser.TextElement(
+      str(int(total_results.text) - num_rows + num_split_rows))
+
+
+def _IsNonZero(value):
+  """Returns whether a metric value is not zero."""
+  try:
+    return float(value) != 0
+  except ValueError:
+    return True
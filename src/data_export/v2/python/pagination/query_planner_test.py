@@ -0,0 +1,237 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for query_planner.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import threading
+import time
+import unittest
+import feed_parser
+import gdata.analytics.client
+import gdata.client
+import pagination
+import query_planner
+
+
+# The value of each metric in row i.
+VALUES = {
+    'ga:visits': lambda i: i,
+    'ga:pageviews': lambda i: 2 * i,
+    'ga:goal1Completions': lambda i: i % 2,
+    'ga:bounces': lambda i: 0,
+}
+
+
+class MockClient(object):
+  """Returns ten rows per query, with the values of VALUES.
+
+  The start-index and max-results of each query are honored.
+  """
+
+  def __init__(self, error=None):
+    self.queries = []
+    self.error = error
+    self.release = threading.Event()
+    self.release.set()
+
+  def GetDataFeed(self, query, converter=None):
+    self.queries.append(dict(query.query))
+    self.release.wait()
+    if self.error:
+      raise self.error
+
+    page = feed_parser.DataPage()
+    page.total_results = feed_parser.TextElement('10')
+    page.start_index = 1
+    dimensions = [name for name in query.query.get('dimensions', '').split(',')
+                  if name]
+    metrics = query.query['metrics'].split(',')
+    page.dimension_names = dimensions
+    page.metric_names = metrics
+    page.metric_types = ['integer'] * len(metrics)
+    page.aggregates = [feed_parser.Metric(
+        name, 'integer', str(sum(VALUES[name](i) for i in range(1, 11))))
+                       for name in metrics]
+    start_index = int(query.query.get('start-index') or 1)
+    max_results = int(query.query.get('max-results') or 10)
+    end_index = min(start_index + max_results, 11)
+    for i in range(start_index, end_index):
+      page.entry.append(tuple(['source-%d' % i] * len(dimensions) +
+                              [str(VALUES[name](i)) for name in metrics]))
+    return page
+
+
+def GetQuery(metrics, **params):
+  """Returns a query for the sources of ga:1 in January."""
+  query = {
+      'ids': 'ga:1',
+      'dimensions': 'ga:source',
+      'metrics': metrics,
+      'start-date': '2011-01-01',
+      'end-date': '2011-01-31'}
+  query.update(params)
+  return gdata.analytics.client.DataFeedQuery(query)
+
+
+class TestQueryPlanner(unittest.TestCase):
+
+  def testPlan(self):
+    planner = query_planner.QueryPlanner(None, None, max_metrics=3)
+    merged = planner.Plan([
+        GetQuery('ga:visits'),
+        GetQuery('ga:visits,ga:pageviews'),
+        GetQuery('ga:visits', **{'end-date': '2011-02-28'}),
+        GetQuery('ga:bounces,ga:goal1Completions'),
+        GetQuery('ga:pageviews,ga:visits', **{'max-results': '50'})])
+
+    self.assertEqual(3, len(merged))
+    self.assertEqual(['ga:visits', 'ga:pageviews'], merged[0].metrics)
+    self.assertEqual([0, 1, 4], merged[0].indices)
+    self.assertEqual(['ga:bounces', 'ga:goal1Completions'], merged[1].metrics)
+    self.assertEqual([3], merged[1].indices)
+    self.assertEqual([2], merged[2].indices)
+    self.assertEqual('ga:visits,ga:pageviews',
+                     merged[0].query.query['metrics'])
+
+  def testExecute(self):
+    my_client = MockClient()
+    planner = query_planner.QueryPlanner(my_client, None)
+    visits, goals, both = planner.Execute([
+        GetQuery('ga:visits,ga:pageviews'),
+        GetQuery('ga:goal1Completions'),
+        GetQuery('ga:pageviews,ga:goal1Completions')])
+
+    self.assertEqual(1, len(my_client.queries))
+    self.assertEqual(1, planner.fetches)
+    self.assertEqual(3, planner.queries)
+
+    self.assertEqual(['ga:visits', 'ga:pageviews'], visits.metric_names)
+    self.assertEqual(10, len(visits.entry))
+    self.assertEqual(('source-3', '3', '6'), visits.entry[2])
+    self.assertEqual(['55', '110'],
+                     [metric.value for metric in visits.aggregates])
+
+    # The API leaves out the rows where every metric is zero.
+    self.assertEqual(['ga:goal1Completions'], goals.metric_names)
+    self.assertEqual(5, len(goals.entry))
+    self.assertEqual(('source-1', '1'), goals.entry[0])
+    self.assertEqual('5', goals.total_results.text)
+
+    self.assertEqual(10, len(both.entry))
+    self.assertEqual(('source-2', '4', '0'), both.entry[1])
+
+  def testExecuteSeveralPages(self):
+    my_client = MockClient()
+    planner = query_planner.QueryPlanner(my_client, None)
+    max_results = pagination.AutoPaginator.DEFAULT_MAX_RESULTS
+    pagination.AutoPaginator.DEFAULT_MAX_RESULTS = 4
+    try:
+      visits, goals = planner.Execute([
+          GetQuery('ga:visits'), GetQuery('ga:goal1Completions')])
+    finally:
+      pagination.AutoPaginator.DEFAULT_MAX_RESULTS = max_results
+
+    self.assertEqual(3, len(my_client.queries))
+    self.assertEqual([str(i) for i in range(1, 11)],
+                     [row[1] for row in visits.entry])
+    self.assertEqual('10', visits.total_results.text)
+    self.assertEqual([('source-%d' % i, '1') for i in (1, 3, 5, 7, 9)],
+                     goals.entry)
+    self.assertEqual('5', goals.total_results.text)
+
+  def testExecuteWithoutDimensions(self):
+    planner = query_planner.QueryPlanner(MockClient(), None)
+    bounces, visits = planner.Execute([
+        GetQuery('ga:bounces', dimensions=''),
+        GetQuery('ga:visits', dimensions='')])
+
+    self.assertEqual(10, len(bounces.entry))
+    self.assertEqual(('0',), bounces.entry[0])
+    self.assertEqual(('1',), visits.entry[0])
+
+  def testExecuteSeveralMergedQueries(self):
+    my_client = MockClient()
+    planner = query_planner.QueryPlanner(my_client, None, max_metrics=1,
+                                         num_queries=2, num_workers=3)
+    visits, pageviews = planner.Execute([GetQuery('ga:visits'),
+                                         GetQuery('ga:pageviews')])
+
+    self.assertEqual(2, len(my_client.queries))
+    self.assertEqual(('source-4', '4'), visits.entry[3])
+    self.assertEqual(('source-4', '8'), pageviews.entry[3])
+    self.assertEqual({'num_workers': 3}, planner.paginator_args)
+
+  def testCoalesce(self):
+    my_client = MockClient()
+    my_client.release.clear()
+    planner = query_planner.QueryPlanner(my_client, None)
+    results = []
+
+    def Execute():
+      results.extend(planner.Execute([GetQuery('ga:visits')]))
+
+    threads = [threading.Thread(target=Execute) for _ in range(2)]
+    for thread in threads:
+      thread.start()
+    while planner.coalesced < 1:
+      time.sleep(0.001)
+    my_client.release.set()
+    for thread in threads:
+      thread.join()
+
+    self.assertEqual(1, len(my_client.queries))
+    self.assertEqual(1, planner.fetches)
+    self.assertEqual(2, len(results))
+    self.assertEqual(results[0].entry, results[1].entry)
+
+  def testError(self):
+    my_client = MockClient(error=gdata.client.RequestError('Bad request'))
+    planner = query_planner.QueryPlanner(my_client, None)
+
+    self.assertRaises(pagination.AutoPaginatorError, planner.Execute,
+                      [GetQuery('ga:visits')])
+    self.assertEqual({}, planner.in_flight)
+
+
+class TestGetGroupKey(unittest.TestCase):
+
+  def testGetGroupKey(self):
+    self.assertEqual(
+        query_planner.GetGroupKey(GetQuery('ga:visits')),
+        query_planner.GetGroupKey(GetQuery('ga:bounces',
+                                           **{'max-results': '10'})))
+    self.assertNotEqual(
+        query_planner.GetGroupKey(GetQuery('ga:visits')),
+        query_planner.GetGroupKey(GetQuery('ga:visits',
+                                           filters='ga:source==google')))
+
+  def testGetMetrics(self):
+    self.assertEqual(['ga:visits', 'ga:bounces'], query_planner.GetMetrics(
+        GetQuery('ga:visits, ga:bounces,ga:visits')))
+
+  def testSplitPartialPage(self):
+    page = MockClient().GetDataFeed(GetQuery('ga:visits,ga:goal1Completions'))
+    page.total_results = feed_parser.TextElement('100')
+
+    goals = query_planner.SplitPage(page, ['ga:goal1Completions'])
+    self.assertEqual(5, len(goals.entry))
+    self.assertEqual('100', goals.total_results.text)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,303 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Records API responses to a fixture file and replays them offline.
+
+A RecordingHttpClient is given to the client of a real export in place of
+its HTTP client. It passes each request on and saves the response, with the
+time it took, to a fixture file. A ReplayHttpClient later serves the same
+responses from the fixture without any network access, immediately or with
+the recorded timing scaled by time_scale. The parser, the writers and the
+paginator can then be profiled on production payloads, and tests can
+exercise AutoPaginator.GetData without the API.
+
+The fixture is a gzip file with one JSON object per line for each request:
+the key it is matched on, and the status, reason, headers, base64 body and
+seconds of its response. The body is saved decompressed. The request
+headers, which hold the credentials, are not saved.
+
+Requests are matched on their method, path and query parameters, in any
+parameter order. Identical requests are served their responses in the
+order they were recorded.
+
+Usage:
+  my_client = gdata.analytics.client.AnalyticsClient(
+      source=APP_NAME, http_client=replay_transport.RecordingHttpClient(
+          'export.jsonl.gz', http_pool.PooledHttpClient()))
+  ...
+  my_client.http_client.Close()
+
+  my_client = gdata.analytics.client.AnalyticsClient(
+      source=APP_NAME,
+      http_client=replay_transport.ReplayHttpClient('export.jsonl.gz'))
+
+  RecordingHttpClient: Saves the responses of another HTTP client.
+  ReplayHttpClient: Serves the responses saved in a fixture file.
+  ReplayResponse: A response read from a fixture.
+  GetRequestKey(): Returns the string requests are matched on.
+  LoadFixture(): Returns the responses saved in a fixture file.
+  ReplayError: Raised when a request was not recorded.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import base64
+import collections
+import cStringIO
+import gzip
+import json
+import mimetools
+import threading
+import time
+import urllib
+
+import atom.http_core
+
+
+# Response headers which do not apply to the saved body.
+_DROPPED_HEADERS = frozenset(['content-encoding', 'content-length',
+                              'transfer-encoding', 'set-cookie'])
+
+
+class RecordingHttpClient(atom.http_core.HttpClient):
+  """Passes requests to another HTTP client and saves their responses.
+
+  The client can be shared by all the worker threads of an AutoPaginator.
+
+  Attributes:
+    http_client: atom.http_core.HttpClient The client making the requests.
+    requests: int The number of responses saved.
+  """
+
+  def __init__(self, file_name, http_client=None):
+    """Initializes this class.
+
+    Args:
+      file_name: string The fixture file to write. It is replaced if it
+          exists.
+      http_client: atom.http_core.HttpClient (optional) The client making the
+          requests, such as an http_pool.PooledHttpClient. Defaults to the
+          gdata HTTP client.
+    """
+    self.http_client = http_client or atom.http_core.HttpClient()
+    self.fixture = gzip.GzipFile(file_name, 'wb')
+    self.lock = threading.Lock()
+    self.requests = 0
+
+  def request(self, http_request):
+    """Makes the request and saves its response.
+
+    The whole body is read before it is returned, so the recorded time
+    includes the download.
+
+    Args:
+      http_request: atom.http_core.HttpRequest The request to make.
+
+    Returns:
+      ReplayResponse The response, with the body already read.
+    """
+    start = time.time()
+    response = self.http_client.request(http_request)
+    body = response.read()
+    seconds = time.time() - start
+
+    headers = [(name, value) for name, value in response.getheaders()
+               if name.lower() not in _DROPPED_HEADERS]
+    line = json.dumps({
+        'key': GetRequestKey(http_request.method, http_request.uri),
+        'status': response.status,
+        'reason': response.reason,
+        'headers': headers,
+        'body': base64.b64encode(body),
+        'seconds': seconds})
+    with self.lock:
+      self.fixture.write(line + '\n')
+      self.requests += 1
+    return ReplayResponse(response.status, response.reason, headers, body)
+
+  Request = request
+
+  def Close(self):
+    """Finishes the fixture file and closes the wrapped client."""
+    with self.lock:
+      self.fixture.close()
+    if hasattr(self.http_client, 'Close'):
+      self.http_client.Close()
+
+
+class ReplayHttpClient(atom.http_core.HttpClient):
+  """Serves the responses saved in a fixture file.
+
+  Attributes:
+    time_scale: float The factor applied to the recorded time of each
+        response before it is returned, or None to return immediately.
+    requests: int The number of responses served.
+  """
+
+  def __init__(self, file_name, time_scale=None):
+    """Initializes this class.
+
+    Args:
+      file_name: string The fixture file written by a RecordingHttpClient.
+      time_scale: float (optional) 1 to wait as long as the recorded
+          request took, 0.5 for half as long. Defaults to not waiting.
+    """
+    self.time_scale = time_scale
+    self.lock = threading.Lock()
+    self.responses = LoadFixture(file_name)
+    self.requests = 0
+
+  def _http_request(self, method, uri, headers=None, body_parts=None):
+    """Returns the next recorded response of the request.
+
+    Args:
+      method: str example: 'GET', 'POST', 'PUT', 'DELETE', etc.
+      uri: str or atom.http_core.Uri
+      headers: dict The request headers, which are ignored.
+      body_parts: list The request body, which is ignored.
+
+    Returns:
+      ReplayResponse The recorded response.
+
+    Raises:
+      ReplayError: If the request was not recorded, or all its responses
+          were already served.
+    """
+    key = GetRequestKey(method, uri)
+    with self.lock:
+      responses = self.responses.get(key)
+      if not responses:
+        raise ReplayError(msg='No recorded response for %s' % key)
+      recorded = responses.popleft()
+      self.requests += 1
+
+    if self.time_scale:
+      time.sleep(recorded['seconds'] * self.time_scale)
+    return ReplayResponse(recorded['status'], recorded['reason'],
+                          recorded['headers'],
+                          base64.b64decode(recorded['body']))
+
+  def Close(self):
+    """Does nothing. Lets the client be closed like a PooledHttpClient."""
+    pass
+
+
+class ReplayResponse(object):
+  """A response whose body is already in memory.
+
+  Attributes:
+    status: int The HTTP status code.
+    reason: string The HTTP reason phrase.
+    msg: mimetools.Message The headers of the response.
+  """
+
+  def __init__(self, status, reason, headers, body):
+    """Initializes this class.
+
+    Args:
+      status: int The HTTP status code.
+      reason: string The HTTP reason phrase.
+      headers: list of (name, value) tuples The response headers.
+      body: str The decompressed body.
+    """
+    self.status = status
+    self.reason = reason
+    self.headers = [(str(name), str(value)) for name, value in headers]
+    self.msg = mimetools.Message(cStringIO.StringIO(''.join(
+        '%s: %s\r\n' % header for header in self.headers)))
+    self.body = cStringIO.StringIO(body)
+
+  def getheader(self, name, default=None):
+    """Returns the value of a header or default if it is missing."""
+    return self.msg.getheader(name, default)
+
+  def getheaders(self):
+    """Returns a list of (name, value) tuples of the headers."""
+    return list(self.headers)
+
+  def read(self, amt=None):
+    """Reads the body of the response."""
+    if amt is None or amt < 0:
+      return self.body.read()
+    return self.body.read(amt)
+
+  def close(self):
+    """Does nothing. The body is in memory."""
+    pass
+
+
+def GetRequestKey(method, uri):
+  """Returns the string requests are matched on.
+
+  The scheme and host are left out, so a fixture recorded from a
+  MockApiServer replays for requests to the API, and the query parameters
+  are sorted.
+
+  Args:
+    method: str The HTTP method, such as GET.
+    uri: str or atom.http_core.Uri The URI of the request.
+
+  Returns:
+    string The method, path and sorted query parameters.
+  """
+  if isinstance(uri, (str, unicode)):
+    uri = atom.http_core.Uri.parse_uri(uri)
+  params = sorted((_Encode(name), _Encode(value))
+                  for name, value in uri.query.iteritems()
+                  if value is not None)
+  key = '%s %s' % (method, uri.path or '/')
+  if params:
+    key += '?' + urllib.urlencode(params)
+  return key
+
+
+def LoadFixture(file_name):
+  """Returns the responses saved in a fixture file.
+
+  Args:
+    file_name: string The fixture file written by a RecordingHttpClient.
+
+  Returns:
+    dict A collections.deque of the recorded responses of each request key,
+    in the order they were recorded.
+  """
+  responses = collections.defaultdict(collections.deque)
+  fixture = gzip.GzipFile(file_name, 'rb')
+  try:
+    for line in fixture:
+      if line.strip():
+        recorded = json.loads(line)
+        responses[recorded['key']].append(recorded)
+  finally:
+    fixture.close()
+  return dict(responses)
+
+
+class ReplayError(Exception):
+  """Raised when a request has no recorded response."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _Encode(value):
+  """Returns a query parameter as a str, encoding unicode as UTF-8."""
+  if isinstance(value, unicode):
+    return value.encode('utf-8')
+  return str(value)
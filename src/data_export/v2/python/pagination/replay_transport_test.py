@@ -0,0 +1,139 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for replay_transport.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import atom.http_core
+import feed_parser
+import gdata.analytics.client
+import mock_api_server
+import pagination
+import replay_transport
+
+
+def GetQuery():
+  return gdata.analytics.client.DataFeedQuery({
+      'ids': 'ga:1',
+      'dimensions': 'ga:source,ga:medium',
+      'metrics': 'ga:visits,ga:bounceRate',
+      'start-date': '2011-01-01',
+      'end-date': '2011-01-31'})
+
+
+def GetRows(my_client):
+  paginator = pagination.AutoPaginator(my_client, None, num_workers=2,
+                                       converter=feed_parser.ParseDataFeed)
+  return [row for page in paginator.GetDataPages(GetQuery(), -1)
+          for row in page.entry]
+
+
+class TestReplayTransport(unittest.TestCase):
+
+  def setUp(self):
+    self.temp_dir = tempfile.mkdtemp()
+    self.file_name = os.path.join(self.temp_dir, 'export.jsonl.gz')
+
+  def tearDown(self):
+    shutil.rmtree(self.temp_dir)
+
+  def Record(self, **server_args):
+    """Exports GetQuery from a MockApiServer and returns the server."""
+    server = mock_api_server.MockApiServer(**server_args)
+    server.Start()
+    try:
+      recorder = replay_transport.RecordingHttpClient(
+          self.file_name, server.GetClient().http_client)
+      my_client = gdata.analytics.client.AnalyticsClient(
+          source='test', http_client=recorder)
+      try:
+        self.recorded_rows = GetRows(my_client)
+      finally:
+        recorder.Close()
+    finally:
+      server.Stop()
+    return server
+
+  def GetReplayClient(self, time_scale=None):
+    return gdata.analytics.client.AnalyticsClient(
+        source='test', http_client=replay_transport.ReplayHttpClient(
+            self.file_name, time_scale))
+
+  def testReplay(self):
+    server = self.Record(total_results=25000)
+    self.assertEqual(3, server.requests)
+    self.assertEqual(25000, len(self.recorded_rows))
+
+    my_client = self.GetReplayClient()
+    self.assertEqual(self.recorded_rows, GetRows(my_client))
+    self.assertEqual(3, my_client.http_client.requests)
+
+  def testUnrecordedRequest(self):
+    self.Record(total_results=10)
+    my_client = self.GetReplayClient()
+    query = GetQuery()
+    query.query['start-date'] = '2011-02-01'
+    self.assertRaises(replay_transport.ReplayError, my_client.GetDataFeed,
+                      query)
+
+  def testEachResponseIsServedOnce(self):
+    self.Record(total_results=10)
+    my_client = self.GetReplayClient()
+    GetRows(my_client)
+    self.assertRaises(replay_transport.ReplayError, GetRows, my_client)
+
+  def testTimeScale(self):
+    self.Record(total_results=10, latency=0.2)
+
+    start = time.time()
+    GetRows(self.GetReplayClient())
+    self.assertTrue(time.time() - start < 0.1)
+
+    start = time.time()
+    GetRows(self.GetReplayClient(time_scale=0.5))
+    self.assertTrue(time.time() - start >= 0.1)
+
+  def testErrorsAreReplayed(self):
+    self.assertRaises(pagination.AutoPaginatorError, self.Record,
+                      total_results=10, error_rate=1)
+    self.assertRaises(pagination.AutoPaginatorError, GetRows,
+                      self.GetReplayClient())
+
+  def testGetRequestKey(self):
+    self.assertEqual(
+        replay_transport.GetRequestKey(
+            'GET', 'https://www.google.com/analytics/feeds/data?b=2&a=1'),
+        replay_transport.GetRequestKey(
+            'GET', 'http://127.0.0.1:8080/analytics/feeds/data?a=1&b=2'))
+    self.assertEqual('GET /analytics/feeds/data?a=1&b=2',
+                     replay_transport.GetRequestKey(
+                         'GET', '/analytics/feeds/data?b=2&a=1'))
+
+    uri = atom.http_core.Uri(path='/analytics/feeds/data',
+                             query={'filters': u'ga:city==M\xfcnchen'})
+    self.assertEqual(
+        'GET /analytics/feeds/data?filters=ga%3Acity%3D%3DM%C3%BCnchen',
+        replay_transport.GetRequestKey('GET', uri))
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,291 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Schedules Data Export API requests within the API quota.
+
+The RequestScheduler waits for a token from several token buckets before
+each request: one for the requests per second of the whole application, one
+for the requests per second of each profile and one for the requests per
+day. Requests which fail with a rate limit, quota or server error are retried
+with jittered exponential backoff, respecting any Retry-After header sent by
+the API up to the longest delay. Other errors, including the daily quota
+being used up, are raised right away.
+
+Usage:
+  scheduler = request_scheduler.RequestScheduler(requests_per_second=10)
+  paginator = pagination.AutoPaginator(my_client, my_auth_helper,
+                                       scheduler=scheduler)
+
+  RequestScheduler: Rate limits and retries API requests.
+  TokenBucket: Limits how often an action can happen.
+  IsRetryable(): Returns whether a failed request should be retried.
+  GetRetryAfter(): Returns the delay requested by a Retry-After header.
+"""
+
+from __future__ import division
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import httplib
+import random
+import socket
+import threading
+import time
+
+import gdata.client
+
+
+# Status codes of responses which may succeed if the request is retried.
+RETRYABLE_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+# Reasons in the body of 403 responses which mean the quota was exceeded
+# rather than the request not being allowed.
+QUOTA_REASONS = ('quotaExceeded', 'rateLimitExceeded',
+                 'userRateLimitExceeded')
+
+# Reasons in the body of responses which mean no request can succeed until the
+# quota is reset the next day, so retrying only wastes time.
+FATAL_REASONS = ('dailyLimitExceeded',)
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class RequestScheduler(object):
+  """Rate limits and retries Data Export API requests.
+
+  Attributes:
+    DEFAULT_REQUESTS_PER_SECOND: float The default request rate of the whole
+        application.
+    DEFAULT_REQUESTS_PER_PROFILE_PER_SECOND: float The default request rate of
+        each profile.
+    DEFAULT_REQUESTS_PER_DAY: int The default number of requests per day.
+    DEFAULT_MAX_RETRIES: int The default number of times a request is retried.
+    DEFAULT_BASE_DELAY: float The default delay in seconds of the first retry.
+    DEFAULT_MAX_DELAY: float The default longest delay in seconds between
+        retries.
+    retries: int The number of retries made so far.
+  """
+
+  DEFAULT_REQUESTS_PER_SECOND = 10
+  DEFAULT_REQUESTS_PER_PROFILE_PER_SECOND = 1
+  DEFAULT_REQUESTS_PER_DAY = 50000
+  DEFAULT_MAX_RETRIES = 5
+  DEFAULT_BASE_DELAY = 1
+  DEFAULT_MAX_DELAY = 64
+
+  def __init__(self, requests_per_second=DEFAULT_REQUESTS_PER_SECOND,
+               requests_per_profile_per_second=(
+                   DEFAULT_REQUESTS_PER_PROFILE_PER_SECOND),
+               requests_per_day=DEFAULT_REQUESTS_PER_DAY,
+               max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY,
+               max_delay=DEFAULT_MAX_DELAY, clock=time.time, sleep=time.sleep):
+    """Initializes this class.
+
+    Args:
+      requests_per_second: float The request rate of the whole application.
+          None means unlimited.
+      requests_per_profile_per_second: float The request rate of each
+          profile, identified by the ids query parameter. None means
+          unlimited.
+      requests_per_day: int The number of requests per day. None means
+          unlimited.
+      max_retries: int The number of times a failed request is retried.
+      base_delay: float The delay in seconds before the first retry. The
+          delay doubles with each retry.
+      max_delay: float The longest delay in seconds between retries.
+      clock: function Returns the current time in seconds.
+      sleep: function Waits for a number of seconds.
+    """
+    self.requests_per_profile_per_second = requests_per_profile_per_second
+    self.max_retries = max_retries
+    self.base_delay = base_delay
+    self.max_delay = max_delay
+    self.clock = clock
+    self.sleep = sleep
+    self.retries = 0
+    self.lock = threading.Lock()
+
+    self.buckets = []
+    if requests_per_second:
+      self.buckets.append(TokenBucket(requests_per_second,
+                                      capacity=requests_per_second,
+                                      clock=clock, sleep=sleep))
+    if requests_per_day:
+      self.buckets.append(TokenBucket(requests_per_day / SECONDS_PER_DAY,
+                                      capacity=requests_per_day,
+                                      clock=clock, sleep=sleep))
+    self.profile_buckets = {}
+
+  def Execute(self, function, query):
+    """Makes an API request once the quota allows it, retrying on failure.
+
+    Args:
+      function: function Makes the request when called with query.
+      query: gdata.analytics.client.DataFeedQuery The query of the request.
+
+    Returns:
+      The result of function.
+
+    Raises:
+      The error raised by function if it is not retryable or if it still
+      fails after max_retries retries.
+    """
+    attempt = 0
+    while True:
+      self.Acquire(query)
+      try:
+        return function(query)
+      except (gdata.client.RequestError, socket.error,
+              httplib.HTTPException), error:
+        if attempt >= self.max_retries or not IsRetryable(error):
+          raise
+        delay = GetRetryAfter(error, self.max_delay)
+        if delay is None:
+          delay = self.GetBackoffDelay(attempt)
+        attempt += 1
+        with self.lock:
+          self.retries += 1
+        self.sleep(delay)
+
+  def Acquire(self, query):
+    """Waits until a request for query is allowed by every token bucket."""
+    for bucket in self.buckets + [self.GetProfileBucket(query)]:
+      if bucket:
+        bucket.Acquire()
+
+  def GetProfileBucket(self, query):
+    """Returns the token bucket of the profile of query, if any."""
+    if not self.requests_per_profile_per_second:
+      return None
+
+    table_id = query.query.get('ids')
+    with self.lock:
+      bucket = self.profile_buckets.get(table_id)
+      if not bucket:
+        bucket = TokenBucket(
+            self.requests_per_profile_per_second,
+            capacity=max(1, self.requests_per_profile_per_second),
+            clock=self.clock, sleep=self.sleep)
+        self.profile_buckets[table_id] = bucket
+    return bucket
+
+  def GetBackoffDelay(self, attempt):
+    """Returns a random delay before retrying for the attempt-th time.
+
+    The upper bound of the delay doubles with each attempt, up to max_delay.
+
+    Args:
+      attempt: int The number of retries already made, starting at 0.
+
+    Returns:
+      float The number of seconds to wait.
+    """
+    return random.uniform(0, min(self.max_delay,
+                                 self.base_delay * 2 ** attempt))
+
+
+class TokenBucket(object):
+  """Limits how often an action can happen.
+
+  Tokens are added at a constant rate up to the capacity of the bucket. Each
+  action takes one token, waiting for one if the bucket is empty.
+  """
+
+  def __init__(self, rate, capacity=1, clock=time.time, sleep=time.sleep):
+    """Initializes this class.
+
+    Args:
+      rate: float The number of tokens added per second.
+      capacity: float The most tokens the bucket can hold, which is the
+          largest burst of actions allowed.
+      clock: function Returns the current time in seconds.
+      sleep: function Waits for a number of seconds.
+    """
+    self.rate = float(rate)
+    self.capacity = float(capacity)
+    self.clock = clock
+    self.sleep = sleep
+    self.tokens = self.capacity
+    self.updated = clock()
+    self.lock = threading.Lock()
+
+  def Acquire(self):
+    """Takes one token, waiting until one is available."""
+    while True:
+      with self.lock:
+        now = self.clock()
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+          self.tokens -= 1
+          return
+        wait = (1 - self.tokens) / self.rate
+      self.sleep(wait)
+
+
+def IsRetryable(error):
+  """Returns whether a failed request should be retried.
+
+  Args:
+    error: The error raised by the request.
+
+  Returns:
+    boolean True for network errors, server errors and rate limit or quota
+    errors, except the daily quota being used up.
+  """
+  if isinstance(error, (socket.error, httplib.HTTPException)):
+    return True
+
+  body = getattr(error, 'body', None) or ''
+  if any(reason in body for reason in FATAL_REASONS):
+    return False
+
+  status = getattr(error, 'status', None)
+  if status in RETRYABLE_STATUSES:
+    return True
+  if status == 403:
+    return any(reason in body for reason in QUOTA_REASONS)
+  return False
+
+
+def GetRetryAfter(error, max_delay=None):
+  """Returns the delay requested by the Retry-After header of an error.
+
+  Args:
+    error: The error raised by the request.
+    max_delay: float (optional) The longest delay in seconds returned. A
+        longer Retry-After is cut down to it. Defaults to no limit.
+
+  Returns:
+    float The number of seconds to wait, or None if there is no valid
+    Retry-After header.
+  """
+  headers = getattr(error, 'headers', None) or []
+  if isinstance(headers, dict):
+    headers = headers.items()
+
+  for name, value in headers:
+    if name.lower() == 'retry-after':
+      try:
+        delay = max(0.0, float(value))
+      except ValueError:
+        return None
+      if max_delay is not None:
+        delay = min(delay, max_delay)
+      return delay
+  return None
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for request_scheduler.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import socket
+import unittest
+import gdata.analytics.client
+import gdata.client
+import request_scheduler
+
+
+class FakeClock(object):
+  """A clock which only moves forward when sleep is called."""
+
+  def __init__(self):
+    self.now = 0.0
+    self.sleeps = []
+
+  def Time(self):
+    return self.now
+
+  def Sleep(self, seconds):
+    self.sleeps.append(seconds)
+    self.now += seconds
+
+
+def GetError(status, body='', headers=None, error_class=None):
+  """Returns an error like the ones raised by gdata for a response."""
+  error = (error_class or gdata.client.RequestError)('Server responded with')
+  error.status = status
+  error.body = body
+  error.headers = headers or []
+  return error
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+  def setUp(self):
+    self.clock = FakeClock()
+    self.query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:1'})
+
+  def GetScheduler(self, **kwargs):
+    return request_scheduler.RequestScheduler(
+        clock=self.clock.Time, sleep=self.clock.Sleep, **kwargs)
+
+  def testRateLimit(self):
+    scheduler = self.GetScheduler(requests_per_second=2,
+                                  requests_per_profile_per_second=None)
+    for _ in range(6):
+      scheduler.Execute(lambda query: None, self.query)
+    self.assertAlmostEqual(2.0, self.clock.now)
+
+  def testProfileRateLimit(self):
+    scheduler = self.GetScheduler(requests_per_second=None,
+                                  requests_per_profile_per_second=1)
+    other_query = gdata.analytics.client.DataFeedQuery({'ids': 'ga:2'})
+    for _ in range(3):
+      scheduler.Execute(lambda query: None, self.query)
+      scheduler.Execute(lambda query: None, other_query)
+    self.assertAlmostEqual(2.0, self.clock.now)
+
+  def testRetry(self):
+    errors = [GetError(503), GetError(403, body='userRateLimitExceeded'),
+              socket.error('Connection reset')]
+
+    def Request(query):
+      if errors:
+        raise errors.pop(0)
+      return 'feed'
+
+    scheduler = self.GetScheduler(base_delay=1)
+    self.assertEqual('feed', scheduler.Execute(Request, self.query))
+    self.assertEqual(3, scheduler.retries)
+    for attempt, delay in enumerate(self.clock.sleeps):
+      self.assertTrue(0 <= delay <= 2 ** attempt)
+
+  def testRetryAfter(self):
+    errors = [GetError(503, headers=[('Retry-After', '30')])]
+
+    def Request(query):
+      if errors:
+        raise errors.pop(0)
+      return 'feed'
+
+    scheduler = self.GetScheduler()
+    scheduler.Execute(Request, self.query)
+    self.assertEqual([30.0], self.clock.sleeps)
+
+  def testRetryAfterIsLimitedToMaxDelay(self):
+    errors = [GetError(503, headers=[('Retry-After', '86400')])]
+
+    def Request(query):
+      if errors:
+        raise errors.pop(0)
+      return 'feed'
+
+    scheduler = self.GetScheduler(max_delay=10)
+    scheduler.Execute(Request, self.query)
+    self.assertEqual([10.0], self.clock.sleeps)
+
+  def testDailyLimitIsFatal(self):
+    def Request(query):
+      raise GetError(403, body='<reason>dailyLimitExceeded</reason>')
+
+    scheduler = self.GetScheduler()
+    self.assertRaises(gdata.client.RequestError, scheduler.Execute, Request,
+                      self.query)
+    self.assertEqual(0, scheduler.retries)
+    self.assertEqual([], self.clock.sleeps)
+
+  def testFatalErrors(self):
+    def Request(query):
+      raise GetError(400)
+
+    scheduler = self.GetScheduler()
+    self.assertRaises(gdata.client.RequestError, scheduler.Execute, Request,
+                      self.query)
+    self.assertEqual(0, scheduler.retries)
+
+  def testMaxRetries(self):
+    def Request(query):
+      raise GetError(500)
+
+    scheduler = self.GetScheduler(max_retries=2)
+    self.assertRaises(gdata.client.RequestError, scheduler.Execute, Request,
+                      self.query)
+    self.assertEqual(2, scheduler.retries)
+
+  def testIsRetryable(self):
+    self.assertTrue(request_scheduler.IsRetryable(GetError(429)))
+    self.assertTrue(request_scheduler.IsRetryable(
+        GetError(403, body='<reason>quotaExceeded</reason>')))
+    self.assertFalse(request_scheduler.IsRetryable(
+        GetError(403, body='insufficientPermissions')))
+    self.assertFalse(request_scheduler.IsRetryable(
+        GetError(403, body='<reason>dailyLimitExceeded</reason>')))
+    self.assertFalse(request_scheduler.IsRetryable(
+        GetError(401, error_class=gdata.client.Unauthorized)))
+
+
+if __name__ == '__main__':
+  unittest.main()
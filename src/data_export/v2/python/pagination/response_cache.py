@@ -0,0 +1,360 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Provides an on-disk cache for Data Export API responses.
+
+Responses are saved by the normalized parameters of their query. A saved
+response is used without any API request until its time to live expires.
+Closed date ranges, which end before the data has stopped changing, can be
+given a longer time to live than date ranges which include recent days.
+Once a response expires, it is revalidated with the ETag returned by the API:
+if the data did not change, the API responds with 304 Not Modified and the
+saved response is used again.
+
+The least recently used responses are deleted when the size of the cache
+goes over its limit.
+
+Usage:
+  my_cache = response_cache.ResponseCache('cache_dir')
+  paginator = pagination.AutoPaginator(my_client, my_auth_helper,
+                                       cache=my_cache)
+
+  ResponseCache: Saves, revalidates and evicts responses.
+  CachedResponse: A response read from the cache.
+  GetCacheKey(): Returns the cache key of a query.
+  ParseResponseBody(): Converts a response body like a client request would.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib
+from xml.sax import saxutils
+
+import atom.core
+import atom.http_core
+import atomic_file
+import gdata.analytics.data
+import gdata.client
+
+
+# Finds the gd:etag attribute of the feed element near the top of a response.
+_FEED_ETAG = re.compile(r'<feed[^>]*gd:etag=[\'"]([^\'"]*)[\'"]')
+_FEED_ETAG_SEARCH_BYTES = 4096
+
+
+class ResponseCache(object):
+  """Saves, revalidates and evicts Data Export API responses.
+
+  Attributes:
+    DEFAULT_MAX_BYTES: int The default size limit of the cache.
+    DEFAULT_OPEN_TTL: int The default number of seconds a response is used
+        without revalidation if its date range includes recent days.
+    DEFAULT_CLOSED_TTL: int The default number of seconds a response is used
+        without revalidation if its date range is closed. None means forever.
+    DEFAULT_SETTLE_DAYS: int The default number of days after which the data
+        of a day no longer changes.
+  """
+
+  DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+  DEFAULT_OPEN_TTL = 60 * 60
+  DEFAULT_CLOSED_TTL = None
+  DEFAULT_SETTLE_DAYS = 2
+
+  BODY_SUFFIX = '.xml'
+  META_SUFFIX = '.json'
+
+  def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES,
+               open_ttl=DEFAULT_OPEN_TTL, closed_ttl=DEFAULT_CLOSED_TTL,
+               settle_days=DEFAULT_SETTLE_DAYS):
+    """Initializes this class.
+
+    Args:
+      cache_dir: string The directory to save the responses in. It is created
+          if it does not exist.
+      max_bytes: int The maximum size of all the saved responses.
+      open_ttl: int The number of seconds a response is used without
+          revalidation if its end-date is within settle_days of today.
+      closed_ttl: int The number of seconds a response is used without
+          revalidation if its end-date is before that. None means forever.
+      settle_days: int The number of days after which the data of a day no
+          longer changes.
+    """
+    self.cache_dir = cache_dir
+    self.max_bytes = max_bytes
+    self.open_ttl = open_ttl
+    self.closed_ttl = closed_ttl
+    self.settle_days = settle_days
+    self.lock = threading.Lock()
+
+    if not os.path.isdir(cache_dir):
+      os.makedirs(cache_dir)
+    self.sizes = {}
+    self.last_used = {}
+    for file_name in os.listdir(cache_dir):
+      if file_name.endswith(ResponseCache.BODY_SUFFIX):
+        key = file_name[:-len(ResponseCache.BODY_SUFFIX)]
+        stat = os.stat(os.path.join(cache_dir, file_name))
+        self.sizes[key] = stat.st_size
+        self.last_used[key] = stat.st_mtime
+    self.total_bytes = sum(self.sizes.values())
+
+  def GetDataFeed(self, my_client, query, converter=None, page_metrics=None):
+    """Returns the response to query from the cache or the API.
+
+    Args:
+      my_client: gdata.analytics.client.AnalyticsClient The object used to
+          make requests to the API.
+      query: gdata.analytics.client.DataFeedQuery The query to retrieve.
+      converter: function (optional) Converts the response instead of the
+          gdata library, such as feed_parser.ParseDataFeed.
+      page_metrics: export_metrics.PageMetrics (optional) Measures the
+          request, if one is made, apart from the parse of the body.
+
+    Returns:
+      gdata.analytics.data.DataFeed The response, or the result of converter
+      if set.
+
+    Raises:
+      gdata.client.RequestError if the API request fails.
+    """
+    key = GetCacheKey(query)
+    cached = self.Load(key)
+    if cached and time.time() < cached.expires:
+      self.Touch(key)
+      if page_metrics:
+        converter = page_metrics.StartParse(my_client, converter,
+                                            cache_hit=True)
+      return ParseResponseBody(my_client, cached.body, converter)
+
+    http_request = atom.http_core.HttpRequest()
+    if cached and cached.etag:
+      http_request.headers['If-None-Match'] = cached.etag
+
+    read_response = _ReadResponse
+    if page_metrics:
+      read_response = page_metrics.StartAttempt(my_client, _ReadResponse)
+      converter = page_metrics.StartParse(my_client, converter)
+    try:
+      body, etag = my_client.GetDataFeed(query, converter=read_response,
+                                         http_request=http_request)
+    except gdata.client.NotModified:
+      self.SaveMeta(key, query, cached.etag)
+      self.Touch(key)
+      return ParseResponseBody(my_client, cached.body, converter)
+
+    self.Save(key, query, body, etag)
+    return ParseResponseBody(my_client, body, converter)
+
+  def GetTtl(self, query):
+    """Returns the number of seconds the response to query can be used.
+
+    Args:
+      query: gdata.analytics.client.DataFeedQuery The query.
+
+    Returns:
+      int The time to live in seconds, or None if the response never expires.
+    """
+    try:
+      end_date = datetime.datetime.strptime(query.query['end-date'],
+                                            '%Y-%m-%d').date()
+    except (KeyError, ValueError):
+      return self.open_ttl
+
+    settled_date = (datetime.date.today() -
+                    datetime.timedelta(days=self.settle_days))
+    if end_date < settled_date:
+      return self.closed_ttl
+    return self.open_ttl
+
+  def Load(self, key):
+    """Returns the CachedResponse saved for key or None if there is none."""
+    try:
+      meta_file = open(self._GetPath(key, ResponseCache.META_SUFFIX), 'rb')
+      try:
+        meta = json.load(meta_file)
+      finally:
+        meta_file.close()
+
+      body_file = open(self._GetPath(key, ResponseCache.BODY_SUFFIX), 'rb')
+      try:
+        body = body_file.read()
+      finally:
+        body_file.close()
+    except (IOError, ValueError):
+      return None
+
+    return CachedResponse(body, meta.get('etag'), meta.get('expires'))
+
+  def Save(self, key, query, body, etag):
+    """Saves a response and evicts old responses if the cache is too big.
+
+    Args:
+      key: string The cache key of query.
+      query: gdata.analytics.client.DataFeedQuery The query of the response.
+      body: str The body of the response.
+      etag: string The ETag of the response.
+    """
+    # Write the meta file last, so a crash in between never pairs the ETag
+    # and expiry time of the new response with the old body. A body without
+    # a meta file is not loaded.
+    atomic_file.WriteAtomically(
+        self._GetPath(key, ResponseCache.BODY_SUFFIX), body)
+    self.SaveMeta(key, query, etag)
+
+    with self.lock:
+      self.total_bytes += len(body) - self.sizes.get(key, 0)
+      self.sizes[key] = len(body)
+      self.last_used[key] = time.time()
+      self.Evict()
+
+  def SaveMeta(self, key, query, etag):
+    """Saves the ETag and a new expiry time for a response.
+
+    Args:
+      key: string The cache key of query.
+      query: gdata.analytics.client.DataFeedQuery The query of the response.
+      etag: string The ETag of the response.
+    """
+    ttl = self.GetTtl(query)
+    if ttl is None:
+      expires = float('inf')
+    else:
+      expires = time.time() + ttl
+    meta = {'etag': etag, 'expires': expires, 'query': query.query}
+    atomic_file.WriteAtomically(
+        self._GetPath(key, ResponseCache.META_SUFFIX), json.dumps(meta))
+
+  def Touch(self, key):
+    """Marks the response saved for key as the most recently used.
+
+    Nothing is marked if the response was evicted in the meantime. A response
+    saved by another process is added to the size of the cache.
+    """
+    now = time.time()
+    path = self._GetPath(key, ResponseCache.BODY_SUFFIX)
+    with self.lock:
+      try:
+        os.utime(path, (now, now))
+        size = os.path.getsize(path)
+      except OSError:
+        return
+      self.total_bytes += size - self.sizes.get(key, 0)
+      self.sizes[key] = size
+      self.last_used[key] = now
+      self.Evict()
+
+  def Evict(self):
+    """Deletes the least recently used responses until the cache fits.
+
+    Must be called with self.lock held.
+    """
+    if self.total_bytes <= self.max_bytes:
+      return
+
+    for key in sorted(self.last_used, key=self.last_used.get):
+      if self.total_bytes <= self.max_bytes:
+        break
+      for suffix in (ResponseCache.BODY_SUFFIX, ResponseCache.META_SUFFIX):
+        try:
+          os.remove(self._GetPath(key, suffix))
+        except OSError:
+          pass
+      self.total_bytes -= self.sizes.pop(key, 0)
+      del self.last_used[key]
+
+  def _GetPath(self, key, suffix):
+    """Returns the path of a file of the response saved for key."""
+    return os.path.join(self.cache_dir, key + suffix)
+
+
+class CachedResponse(object):
+  """A response read from the cache.
+
+  Attributes:
+    body: str The body of the response.
+    etag: string The ETag of the response.
+    expires: float The time after which the response must be revalidated.
+  """
+
+  def __init__(self, body, etag, expires):
+    self.body = body
+    self.etag = etag
+    self.expires = expires
+
+
+def GetCacheKey(query):
+  """Returns the cache key of a query.
+
+  Queries with the same parameters have the same key, no matter the order of
+  the parameters or surrounding white space.
+
+  Args:
+    query: gdata.analytics.client.DataFeedQuery The query.
+
+  Returns:
+    string A hexadecimal digest of the normalized query parameters.
+  """
+  params = sorted((str(name).strip(), str(value).strip())
+                  for name, value in query.query.iteritems()
+                  if value is not None)
+  return hashlib.sha1('%s?%s' % (query.path, urllib.urlencode(params))
+                     ).hexdigest()
+
+
+def ParseResponseBody(my_client, body, converter=None):
+  """Converts a response body the same way a client request would.
+
+  Args:
+    my_client: gdata.analytics.client.AnalyticsClient The client whose API
+        version is used to parse the body.
+    body: str The body of the response.
+    converter: function (optional) Converts the response instead of the
+        gdata library, such as feed_parser.ParseDataFeed.
+
+  Returns:
+    gdata.analytics.data.DataFeed The response, or the result of converter
+    if set.
+  """
+  if converter:
+    return converter(cStringIO.StringIO(body))
+  if my_client.api_version is not None:
+    return atom.core.parse(
+        body, gdata.analytics.data.DataFeed,
+        version=gdata.client.get_xml_version(my_client.api_version))
+  return atom.core.parse(body, gdata.analytics.data.DataFeed)
+
+
+def _ReadResponse(response):
+  """Returns the body and ETag of an HTTP response.
+
+  If the response has no ETag header, the gd:etag of the feed is used.
+  """
+  body = response.read()
+  etag = response.getheader('ETag')
+  if not etag:
+    match = _FEED_ETAG.search(body, 0, _FEED_ETAG_SEARCH_BYTES)
+    if match:
+      etag = saxutils.unescape(match.group(1), {'&quot;': '"'})
+  return body, etag
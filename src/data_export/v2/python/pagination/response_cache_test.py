@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for response_cache.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import datetime
+import shutil
+import tempfile
+import unittest
+import feed_parser
+import feed_parser_test
+import gdata.analytics.client
+import gdata.client
+import response_cache
+
+
+class FakeResponse(object):
+  """Stands in for the HTTP response of an API request."""
+
+  def __init__(self, body, headers):
+    self.body = cStringIO.StringIO(body)
+    self.headers = headers
+
+  def read(self, amt=None):
+    if amt is None:
+      return self.body.read()
+    return self.body.read(amt)
+
+  def getheader(self, name, default=None):
+    return self.headers.get(name, default)
+
+
+class FakeClient(object):
+  """Returns the same response to every query, honoring If-None-Match."""
+
+  api_version = '2'
+
+  def __init__(self, body, headers=None):
+    self.body = body
+    self.headers = headers or {}
+    self.requests = 0
+    self.not_modified = 0
+
+  def GetDataFeed(self, query, converter=None, http_request=None):
+    self.requests += 1
+    etag = self.headers.get('ETag') or 'W/"DUINSHcycSp7I2A9WxRWFEQ."'
+    if http_request and http_request.headers.get('If-None-Match') == etag:
+      self.not_modified += 1
+      raise gdata.client.NotModified('Not Modified')
+    return converter(FakeResponse(self.body, self.headers))
+
+
+class TestResponseCache(unittest.TestCase):
+
+  def setUp(self):
+    self.cache_dir = tempfile.mkdtemp()
+    self.body = open(feed_parser_test.DATA_FEED_FILE_NAME).read()
+
+  def tearDown(self):
+    shutil.rmtree(self.cache_dir)
+
+  def GetQuery(self, end_date='2010-10-30', **kwargs):
+    params = {'ids': 'ga:1', 'start-date': '2010-10-01',
+              'end-date': end_date, 'metrics': 'ga:visits'}
+    params.update(kwargs)
+    return gdata.analytics.client.DataFeedQuery(params)
+
+  def testClosedDateRangeIsReused(self):
+    my_client = FakeClient(self.body)
+    my_cache = response_cache.ResponseCache(self.cache_dir)
+
+    for _ in range(3):
+      page = my_cache.GetDataFeed(my_client, self.GetQuery(),
+                                  feed_parser.ParseDataFeed)
+      self.assertEqual(5, len(page.entry))
+    self.assertEqual(1, my_client.requests)
+
+    # The responses are still cached by a new object.
+    my_cache = response_cache.ResponseCache(self.cache_dir)
+    feed = my_cache.GetDataFeed(my_client, self.GetQuery())
+    self.assertEqual(5, len(feed.entry))
+    self.assertEqual(1, my_client.requests)
+
+  def testOpenDateRangeIsRevalidated(self):
+    my_client = FakeClient(self.body)
+    my_cache = response_cache.ResponseCache(self.cache_dir, open_ttl=0)
+    today = datetime.date.today().strftime('%Y-%m-%d')
+
+    for _ in range(3):
+      page = my_cache.GetDataFeed(my_client, self.GetQuery(end_date=today),
+                                  feed_parser.ParseDataFeed)
+      self.assertEqual(5, len(page.entry))
+    self.assertEqual(3, my_client.requests)
+    self.assertEqual(2, my_client.not_modified)
+
+  def testEtagHeader(self):
+    my_client = FakeClient(self.body, {'ETag': '"abc"'})
+    my_cache = response_cache.ResponseCache(self.cache_dir, closed_ttl=0)
+
+    my_cache.GetDataFeed(my_client, self.GetQuery())
+    my_cache.GetDataFeed(my_client, self.GetQuery())
+    self.assertEqual(1, my_client.not_modified)
+
+  def testEviction(self):
+    my_client = FakeClient(self.body)
+    my_cache = response_cache.ResponseCache(
+        self.cache_dir, max_bytes=int(len(self.body) * 2.5))
+
+    for start_index in ('1', '2', '3'):
+      my_cache.GetDataFeed(my_client, self.GetQuery(**{'start-index':
+                                                       start_index}))
+    self.assertEqual(2, len(my_cache.sizes))
+    self.assertTrue(my_cache.total_bytes <= my_cache.max_bytes)
+
+    # The oldest response was evicted.
+    my_cache.GetDataFeed(my_client, self.GetQuery(**{'start-index': '1'}))
+    self.assertEqual(4, my_client.requests)
+
+  def testTouchAfterEviction(self):
+    my_client = FakeClient(self.body)
+    my_cache = response_cache.ResponseCache(
+        self.cache_dir, max_bytes=int(len(self.body) * 1.5))
+    first_key = response_cache.GetCacheKey(self.GetQuery())
+
+    my_cache.GetDataFeed(my_client, self.GetQuery())
+    my_cache.GetDataFeed(my_client, self.GetQuery(**{'start-index': '2'}))
+    my_cache.Touch(first_key)
+    self.assertFalse(first_key in my_cache.last_used)
+
+    my_cache.GetDataFeed(my_client, self.GetQuery(**{'start-index': '3'}))
+    self.assertEqual(my_cache.sizes.keys(), my_cache.last_used.keys())
+    self.assertEqual(len(self.body), my_cache.total_bytes)
+
+  def testGetCacheKey(self):
+    key = response_cache.GetCacheKey(self.GetQuery())
+    self.assertEqual(key, response_cache.GetCacheKey(
+        self.GetQuery(metrics=' ga:visits')))
+    self.assertNotEqual(key, response_cache.GetCacheKey(
+        self.GetQuery(sort='-ga:visits')))
+
+
+if __name__ == '__main__':
+  unittest.main()
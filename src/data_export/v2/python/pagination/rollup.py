@@ -0,0 +1,271 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Re-groups exported rows by fewer dimensions without any API request.
+
+An export by ga:source, ga:medium and ga:keyword holds everything needed
+for the same report by ga:source only, as long as its metrics are additive:
+the visits of a source are the sum of the visits of its rows. Ratios and
+averages, such as ga:visitBounceRate or ga:avgTimeOnSite, and counts of
+distinct users, such as ga:visitors, can not be summed. They are left out of
+the result and reported along with the reason.
+
+The rows are grouped by the dictionary codes of the kept dimensions, and
+each metric is summed per group. With NumPy installed, both are done with
+array operations; otherwise the groups are found with a hash table.
+
+Usage:
+  table = columnar_file.ReadDataTable(open('my_output.gacol', 'rb'))
+  result = rollup.Rollup(table, ['ga:source'])
+  print result.table.Sum('ga:visits'), result.skipped_metrics
+
+  Rollup(): Groups the rows of a DataTable by some of its dimensions.
+  RollupPages(): Groups the rows of the pages of an export.
+  RollupResult: The grouped table and the metrics left out.
+  GetNonAdditiveReason(): Returns why a metric can not be summed, if so.
+  RollupError: Raised when a rollup is not possible.
+"""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import array
+import collections
+import math
+
+import data_table
+import date_sharding
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+
+# Metrics which count distinct users, who can appear in several rows.
+_DISTINCT_COUNT_METRICS = frozenset(['ga:visitors'])
+
+# The largest combined key of the dimension codes stored in an int64.
+_MAX_COMBINED_KEY = 2 ** 62
+
+RollupResult = collections.namedtuple('RollupResult', 'table skipped_metrics')
+
+
+def Rollup(table, dimension_names, metric_names=None):
+  """Groups the rows of a DataTable by some of its dimensions.
+
+  Args:
+    table: data_table.DataTable The rows of an export.
+    dimension_names: list The dimensions to keep, in the order to return
+        them. May be empty to return a single row of totals.
+    metric_names: list (optional) The metrics to sum. Defaults to every
+        metric of the table.
+
+  Returns:
+    RollupResult The table with one row per distinct combination of the kept
+    dimensions, in the order first seen, and a dict of the metrics which were
+    left out with the reason.
+
+  Raises:
+    RollupError: If a dimension or metric is not in the table.
+  """
+  if metric_names is None:
+    metric_names = table.metric_names
+  for name in dimension_names:
+    if name not in table.dimension_names:
+      raise RollupError(msg='The table has no dimension %s.' % name)
+  for name in metric_names:
+    if name not in table.metric_names:
+      raise RollupError(msg='The table has no metric %s.' % name)
+
+  skipped_metrics = {}
+  summed_metrics = []
+  for name in metric_names:
+    metric_type = table.metric_types[table.metric_names.index(name)]
+    reason = GetNonAdditiveReason(name, metric_type)
+    if reason:
+      skipped_metrics[name] = reason
+    else:
+      summed_metrics.append(name)
+
+  result = data_table.DataTable()
+  result.SetColumns(
+      dimension_names, summed_metrics,
+      [table.metric_types[table.metric_names.index(name)]
+       for name in summed_metrics])
+  if not table.num_rows:
+    return RollupResult(result, skipped_metrics)
+
+  columns = [table.GetDimension(name) for name in dimension_names]
+  groups, group_rows = _GetGroups(columns, table.num_rows)
+
+  for column, kept in zip(columns, result.dimensions):
+    kept.Extend(column.values[column.codes[row]] for row in group_rows)
+  for name, summed in zip(summed_metrics, result.metrics):
+    values = table.metrics[table.metric_names.index(name)]
+    summed.extend(_SumByGroup(values, groups, len(group_rows)))
+  result.num_rows = len(group_rows)
+  return RollupResult(result, skipped_metrics)
+
+
+def RollupPages(pages, dimension_names, metric_names=None):
+  """Groups the rows of the pages of an export by some of its dimensions.
+
+  Args:
+    pages: iterable of gdata.analytics.data.DataFeed or feed_parser.DataPage
+        The pages of the export, such as AutoPaginator.GetDataPages.
+    dimension_names: list The dimensions to keep.
+    metric_names: list (optional) The metrics to sum.
+
+  Returns:
+    RollupResult As returned by Rollup.
+
+  Raises:
+    RollupError: If a dimension or metric is not in the pages.
+  """
+  return Rollup(data_table.GetDataTable(pages), dimension_names, metric_names)
+
+
+def GetNonAdditiveReason(name, metric_type):
+  """Returns why a metric can not be summed across rows, if so.
+
+  Args:
+    name: string The name of the metric, such as ga:visits.
+    metric_type: string The type of the metric reported by the API.
+
+  Returns:
+    string The reason, or None if the metric can be summed.
+  """
+  if name in _DISTINCT_COUNT_METRICS:
+    return 'counts distinct users, who may appear in several rows'
+  if name.split(':')[-1].startswith('avg'):
+    return 'is an average'
+  if metric_type == 'percent' or not date_sharding.IsAdditiveMetric(name):
+    return 'is a ratio'
+  return None
+
+
+class RollupError(Exception):
+  """Raised when a rollup is not possible."""
+
+  def __init__(self, msg=''):
+    """Initializes this class."""
+    Exception.__init__(self, msg)
+    self.msg = msg
+
+
+def _GetGroups(columns, num_rows):
+  """Assigns each row to the group of its values of some dimensions.
+
+  Args:
+    columns: list of data_table.DimensionColumn The dimensions to group by.
+    num_rows: int The number of rows.
+
+  Returns:
+    A (groups, group_rows) tuple. groups is an array.array with the group of
+    each row, numbered in the order first seen, and group_rows a list with
+    one row of each group.
+  """
+  if numpy:
+    unused_keys, first_rows, inverse = numpy.unique(
+        _GetKeyArray(columns, num_rows), return_index=True,
+        return_inverse=True)
+    # numpy.unique numbers the groups in key order; renumber them in the
+    # order of their first row.
+    order = numpy.argsort(first_rows)
+    numbers = numpy.empty(len(order), dtype=numpy.intc)
+    numbers[order] = numpy.arange(len(order), dtype=numpy.intc)
+    return (array.array(data_table.CODE_TYPECODE,
+                        numbers[inverse].astype(numpy.intc).tostring()),
+            first_rows[order].tolist())
+
+  group_index = {}
+  if not columns:
+    keys = [0] * num_rows
+  elif len(columns) == 1:
+    keys = columns[0].codes
+  else:
+    keys = zip(*[column.codes for column in columns])
+  groups = [group_index.setdefault(key, len(group_index)) for key in keys]
+  # Any row of a group has its dimension values. The last one is found
+  # without a Python loop.
+  last_rows = dict(zip(groups, xrange(num_rows)))
+  group_rows = [last_rows[group] for group in xrange(len(group_index))]
+  return array.array(data_table.CODE_TYPECODE, groups), group_rows
+
+
+def _GetKeyArray(columns, num_rows):
+  """Returns a NumPy array with one sortable key per row of the columns.
+
+  The codes are combined into a single int64 per row when the number of
+  combinations fits, and otherwise viewed as one opaque value per row.
+  """
+  if not columns:
+    return numpy.zeros(num_rows, dtype=numpy.int64)
+
+  codes = [numpy.frombuffer(column.codes, dtype=numpy.intc)
+           for column in columns]
+  cardinality = 1
+  for column in columns:
+    cardinality *= max(1, len(column.values))
+
+  if cardinality < _MAX_COMBINED_KEY:
+    keys = numpy.zeros(num_rows, dtype=numpy.int64)
+    for column, column_codes in zip(columns, codes):
+      keys *= max(1, len(column.values))
+      keys += column_codes
+    return keys
+
+  rows = numpy.ascontiguousarray(numpy.column_stack(codes))
+  return rows.view(numpy.dtype(
+      (numpy.void, rows.dtype.itemsize * len(columns)))).ravel()
+
+
+def _SumByGroup(values, groups, num_groups):
+  """Returns the sum of the values of each group.
+
+  Args:
+    values: array.array The value of each row.
+    groups: array.array The group of each row.
+    num_groups: int The number of groups.
+
+  Returns:
+    A list with the sum of each group, in the type of values.
+  """
+  if numpy:
+    group_array = numpy.frombuffer(groups, dtype=numpy.intc)
+    if values.typecode == data_table.INTEGER_TYPECODE:
+      # bincount sums in floats, which are not exact for large integers.
+      sums = numpy.zeros(num_groups, dtype=numpy.int_)
+      numpy.add.at(sums, group_array,
+                   numpy.frombuffer(values, dtype=numpy.int_))
+    else:
+      sums = numpy.bincount(group_array,
+                            weights=numpy.frombuffer(values,
+                                                     dtype=numpy.float64),
+                            minlength=num_groups)
+    return sums.tolist()
+
+  if values.typecode == data_table.INTEGER_TYPECODE:
+    sums = [0] * num_groups
+    for group, value in zip(groups, values):
+      sums[group] += value
+    return sums
+
+  group_values = [[] for _ in xrange(num_groups)]
+  for group, value in zip(groups, values):
+    group_values[group].append(value)
+  return [math.fsum(group_value) for group_value in group_values]
@@ -0,0 +1,174 @@
+#!/usr/bin/python
+#
+# Copyright 2011 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Provides unit tests for rollup.py."""
+
+__author__ = 'api.nickm@google.com (Nick Mihailovski)'
+
+
+import cStringIO
+import unittest
+import columnar_file
+import data_table
+import feed_parser
+import mock_api_server
+import rollup
+
+
+def GetPage():
+  """Returns a page of sources, mediums and keywords."""
+  page = feed_parser.DataPage()
+  page.dimension_names = ['ga:source', 'ga:medium', 'ga:keyword']
+  page.metric_names = ['ga:visits', 'ga:transactionRevenue',
+                       'ga:visitBounceRate', 'ga:visitors']
+  page.metric_types = ['integer', 'currency', 'percent', 'integer']
+  page.entry = [
+      ('google', 'organic', 'shoes', '10', '1.5', '20.0', '9'),
+      ('google', 'cpc', 'shoes', '5', '0.25', '40.0', '5'),
+      ('bing', 'organic', 'boots', '3', '0.0', '0.0', '3'),
+      ('google', 'organic', 'boots', '2', '2.0', '50.0', '2'),
+      ('bing', 'organic', 'shoes', '1', '1.0', '100.0', '1'),
+  ]
+  return page
+
+
+class TestRollup(unittest.TestCase):
+
+  def setUp(self):
+    self.table = data_table.GetDataTable([GetPage()])
+
+  def testRollup(self):
+    result = rollup.Rollup(self.table, ['ga:source'])
+
+    self.assertEqual(['ga:source'], result.table.dimension_names)
+    self.assertEqual(['ga:visits', 'ga:transactionRevenue'],
+                     result.table.metric_names)
+    self.assertEqual(['integer', 'currency'], result.table.metric_types)
+    self.assertEqual([('google', 17, 3.75), ('bing', 4, 1.0)],
+                     list(result.table.GetRows()))
+    self.assertEqual(['ga:visitBounceRate', 'ga:visitors'],
+                     sorted(result.skipped_metrics))
+
+  def testRollupSeveralDimensions(self):
+    result = rollup.Rollup(self.table, ['ga:keyword', 'ga:medium'],
+                           ['ga:visits'])
+
+    self.assertEqual([('shoes', 'organic', 11), ('shoes', 'cpc', 5),
+                      ('boots', 'organic', 5)],
+                     list(result.table.GetRows()))
+    self.assertEqual({}, result.skipped_metrics)
+    self.assertEqual(['shoes', 'boots'],
+                     result.table.GetDimension('ga:keyword').values)
+
+  def testKeysTooLargeToCombine(self):
+    max_combined_key = rollup._MAX_COMBINED_KEY
+    rollup._MAX_COMBINED_KEY = 1
+    try:
+      result = rollup.Rollup(self.table, ['ga:keyword', 'ga:medium'],
+                             ['ga:visits'])
+    finally:
+      rollup._MAX_COMBINED_KEY = max_combined_key
+
+    self.assertEqual([('shoes', 'organic', 11), ('shoes', 'cpc', 5),
+                      ('boots', 'organic', 5)],
+                     list(result.table.GetRows()))
+
+  def testTotals(self):
+    result = rollup.Rollup(self.table, [])
+
+    self.assertEqual([(21, 4.75)], list(result.table.GetRows()))
+
+  def testEmptyTable(self):
+    table = data_table.DataTable()
+    table.SetColumns(['ga:source'], ['ga:visits'], ['integer'])
+    result = rollup.Rollup(table, ['ga:source'])
+
+    self.assertEqual(0, len(result.table))
+    self.assertEqual(['ga:visits'], result.table.metric_names)
+
+  def testUnknownColumns(self):
+    self.assertRaises(rollup.RollupError, rollup.Rollup, self.table,
+                      ['ga:city'])
+    self.assertRaises(rollup.RollupError, rollup.Rollup, self.table,
+                      ['ga:source'], ['ga:pageviews'])
+
+  def testRollupPages(self):
+    result = rollup.RollupPages([GetPage(), GetPage()], ['ga:medium'])
+
+    self.assertEqual([('organic', 32, 9.0), ('cpc', 10, 0.5)],
+                     list(result.table.GetRows()))
+
+  def testColumnarFile(self):
+    params = {'ids': 'ga:1', 'dimensions': 'ga:source,ga:medium',
+              'metrics': 'ga:visits,ga:timeOnSite'}
+    body = mock_api_server.GetDataFeedBody(params, 5000, 1, 5000,
+                                           cardinality=50)
+    page = feed_parser.ParseDataFeed(cStringIO.StringIO(body))
+    output = cStringIO.StringIO()
+    sink = columnar_file.ColumnarSink(output)
+    sink.WriteHeaders(page.dimension_names, page.metric_names,
+                      page.metric_types)
+    sink.WriteRows(page.entry)
+    sink.Close()
+    output.seek(0)
+
+    table = columnar_file.ReadDataTable(output)
+    result = rollup.Rollup(table, ['ga:source'])
+    self.assertEqual(50, len(result.table))
+    self.assertEqual(table.Sum('ga:visits'), result.table.Sum('ga:visits'))
+    self.assertAlmostEqual(table.Sum('ga:timeOnSite'),
+                           result.table.Sum('ga:timeOnSite'))
+
+
+class TestRollupWithoutNumpy(TestRollup):
+
+  def setUp(self):
+    TestRollup.setUp(self)
+    self.numpy = rollup.numpy
+    rollup.numpy = None
+
+  def tearDown(self):
+    rollup.numpy = self.numpy
+
+
+class TestGetNonAdditiveReason(unittest.TestCase):
+
+  def testGetNonAdditiveReason(self):
+    self.assertEqual(None, rollup.GetNonAdditiveReason('ga:visits',
+                                                       'integer'))
+    self.assertEqual(None, rollup.GetNonAdditiveReason('ga:timeOnSite',
+                                                       'time'))
+    self.assertEqual(None, rollup.GetNonAdditiveReason(
+        'ga:transactionRevenue', 'currency'))
+    self.assertEqual('is an average', rollup.GetNonAdditiveReason(
+        'ga:avgTimeOnSite', 'time'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:pageviewsPerVisit', 'float'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:perVisitGoalValue', 'currency'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:percentNewVisits', 'percent'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:goalConversionRateAll', 'float'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:CPC', 'currency'))
+    self.assertEqual('is a ratio', rollup.GetNonAdditiveReason(
+        'ga:CTR', 'float'))
+    self.assertEqual(
+        'counts distinct users, who may appear in several rows',
+        rollup.GetNonAdditiveReason('ga:visitors', 'integer'))
+
+if __name__ == '__main__':
+  unittest.main()